@@ -21,17 +21,101 @@ TTS_API_HOST = "localhost"
 TTS_API_PORT = 8000
 CONVERSATION_API_HOST = "localhost"
 CONVERSATION_API_PORT = 8001
+STT_API_HOST = "localhost"
+STT_API_PORT = 8002
+DOCUMENT_API_HOST = "localhost"
+DOCUMENT_API_PORT = 8003
+API_REQUEST_TIMEOUT = 60  # Socket timeout for slow clients and idle keep-alive connections
+API_MAX_QUEUED_REQUESTS = 16  # Requests allowed to wait for a worker before answering 429
+API_QUEUE_TIMEOUT = 30.0  # Seconds a request may wait for a worker
+API_MAX_CONNECTIONS = 256  # Open connections per service before answering 503
+MAX_REQUEST_BODY_MB = 64  # Default request body limit for API handlers
+UPLOAD_SPOOL_MB = 8  # Uploads larger than this are spooled to a temporary file
+API_COMPRESSION_MIN_BYTES = 1024  # Smaller responses are sent uncompressed
+API_COMPRESSION_LEVEL = 5  # gzip/deflate level for responses
 
 # TTS Settings
 TTS_SAMPLE_RATE = 24000
 TTS_DEFAULT_SPEAKER = "kavya"
 TTS_AVAILABLE_SPEAKERS = ["kavya", "agastya", "maitri", "vinaya"]
+TTS_MAX_CONCURRENT_REQUESTS = 1  # Synthesis requests running at once; the rest queue or get 429
+TTS_STREAM_FIRST_CHUNK_FRAMES = 3  # SNAC frames (~85 ms each) before the first streamed chunk
+TTS_STREAM_CHUNK_FRAMES = 8  # SNAC frames per later streamed chunk
+TTS_BATCH_SIZE = 8  # Utterances per batched generate / SNAC decode call
+TTS_MAX_BATCH_ITEMS = 64  # Largest item list accepted by POST /batch
+TTS_LONG_FORM_CHUNK_CHARS = 120  # Longer texts are split at sentence/clause boundaries and synthesized in chunks
+TTS_LONG_FORM_CROSSFADE_MS = 40  # Crossfade between consecutive chunks
+TTS_PHRASE_CACHE_DIR = AI_SYSTEMS_ROOT / "cache" / "tts"  # Synthesized audio for recurring phrases
+TTS_PHRASE_CACHE_MAX_MB = 1024
+TTS_PHRASE_CACHE_MEMORY_MB = 64  # Hot tier of decoded audio kept in memory
+TTS_PHRASE_CACHE_MAX_CHARS = 300  # Longer texts (narrations) are not cached
+TTS_PHRASE_CACHE_VERSION = 1  # Bump to invalidate cached audio
+TTS_PREWARM_ON_STARTUP = True  # Synthesize the companion's template phrases in the background
+TTS_PREWARM_SPEAKERS = [TTS_DEFAULT_SPEAKER]
 
 # Conversation AI Settings
 CONVERSATION_MODEL_REPO = "SandLogicTechnologies/LLama3-Gaja-Hindi-8B-GGUF"
 CONVERSATION_MODEL_FILE = "*llama3-gaja-hindi-8b-v0.1.Q5_K_M.gguf"
 CONVERSATION_MAX_CONTEXT = 4096
-CONVERSATION_MAX_TOKENS = 256
+CONVERSATION_MAX_TOKENS = 256  # Longest reply, in tokens (both backends)
+CONVERSATION_MIN_TOKENS = 20  # End of turn is suppressed until a reply is this long
+CONVERSATION_BACKEND = "auto"  # "transformers", "llama_cpp", or "auto" (llama.cpp on CPU-only nodes)
+CONVERSATION_NUM_THREADS = None  # llama.cpp threads (None = all cores)
+CONVERSATION_GPU_LAYERS = 0  # Layers llama.cpp offloads to the GPU
+CONVERSATION_KV_CACHE_MAX_MB = 2048  # Memory budget for past-key-values kept between turns
+CONVERSATION_SCHEDULER_ENABLED = True  # Merge concurrent requests into batched decode steps
+CONVERSATION_MAX_BATCH_SIZE = 8
+CONVERSATION_MAX_CONCURRENT_REQUESTS = CONVERSATION_MAX_BATCH_SIZE  # Enough to fill one decode batch
+CONVERSATION_SPECULATIVE_MODE = "off"  # "off", "prompt_lookup" (drafts copied from the prompt) or "draft_model"
+CONVERSATION_SPECULATIVE_TOKENS = 8  # Draft tokens verified per forward pass of the main model
+CONVERSATION_PROMPT_LOOKUP_MAX_NGRAM = 3  # Longest suffix matched against the prompt when drafting
+CONVERSATION_DRAFT_MODEL = None  # Small model sharing the main model's tokenizer (for "draft_model")
+CONVERSATION_HISTORY_TOKENS = 1536  # Verbatim history per prompt; older turns are folded into a summary
+CONVERSATION_HISTORY_KEEP_FRACTION = 0.5  # Share of the history budget kept verbatim after a fold
+CONVERSATION_SUMMARY_TOKENS = 256  # Rolling summary of folded turns
+CONVERSATION_PROFILE_TOKENS = 256  # Family members and memories in the system prompt
+MEMORY_INDEX_DIR = AI_SYSTEMS_ROOT / "data" / "memory_index"  # Per-patient embedded memory entries
+MEMORY_EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"  # None = hashed n-grams
+MEMORY_EMBEDDING_MAX_TOKENS = 64  # Longer queries/entries are truncated, keeping embedding time bounded
+MEMORY_RETRIEVAL_TOP_K = 3  # Memories added to each prompt
+MEMORY_RETRIEVAL_MIN_SCORE = None  # Cosine similarity below which a memory is not relevant (None = embedder default)
+MEMORY_RETRIEVAL_TOKENS = 192  # Prompt budget for retrieved memories
+MEMORY_INDEX_URL = os.getenv("MEMORY_INDEX_URL", f"http://{CONVERSATION_API_HOST}:{CONVERSATION_API_PORT}/index_memory")
+STREAM_TOKEN_TIMEOUT = 120.0  # Seconds to wait for the next streamed token before giving up
+
+# Speech-to-Text Settings
+STT_MAX_UPLOAD_MB = 200  # Largest accepted audio upload
+STT_MAX_CONCURRENT_REQUESTS = 1  # Transcriptions running at once; the rest queue or get 429
+STT_STREAM_PARTIAL_INTERVAL = 1.0  # Seconds of new audio between partial hypotheses
+STT_STREAM_END_SILENCE = 0.8  # Pause (seconds) that finalizes the current utterance
+STT_STREAM_MAX_SEGMENT = 25.0  # Force-finalize utterances longer than this (seconds)
+STT_STREAM_SESSION_TIMEOUT = 300  # Idle seconds before a streaming session is dropped
+
+# Document Understanding Settings
+DOCUMENT_NUM_WORKERS = 2  # Concurrent analysis jobs
+DOCUMENT_MAX_PENDING_JOBS = 100  # Queue size before /analyze answers 429
+DOCUMENT_JOB_RETENTION_SECONDS = 24 * 3600  # Finished jobs are forgotten after this (result files stay on disk)
+DOCUMENT_RESULTS_DIR = AI_SYSTEMS_ROOT / "analysis_results"
+DOCUMENT_UPLOAD_DIR = AI_SYSTEMS_ROOT / "uploads"  # Uploaded media waiting for analysis
+DOCUMENT_MAX_UPLOAD_MB = 1024  # Largest accepted image/video upload
+DOCUMENT_MAX_CONCURRENT_REQUESTS = 8  # Uploads received at once (analysis itself runs in the job queue)
+BLIP2_MODEL_NAME = "Salesforce/blip2-opt-2.7b"
+BLIP2_VISION_BATCH_SIZE = 8  # Images per vision encoder / Q-Former pass
+BLIP2_DECODE_BATCH_SIZE = 16  # (image, prompt) rows per language model generate call
+BLIP2_MAX_NEW_TOKENS = 30
+DOCUMENT_STATUS_CALLBACK_URL = os.getenv("DOCUMENT_STATUS_CALLBACK_URL", "http://localhost:3000/memory/analysis-status")  # Requires AI_CALLBACK_SECRET shared with the backend
+VIDEO_FRAME_MAX_SIDE = 1024  # Decoded video frames are scaled down to this longest side
+VIDEO_SAMPLING_MODE = "scene"  # "scene" (one frame per distinct scene) or "uniform"
+VIDEO_SCENE_SCAN_FPS = 2.0  # Frames per second signed during the scene scan
+VIDEO_SCENE_THRESHOLD = 0.35  # Histogram distance from a scene's first frame that starts a new scene
+VIDEO_DUPLICATE_THRESHOLD = 0.1  # New scenes this close to an already kept frame are skipped
+ANALYSIS_CACHE_DIR = AI_SYSTEMS_ROOT / "cache" / "analysis"  # Content-addressed analysis results
+ANALYSIS_CACHE_MAX_MB = 512
+ANALYSIS_CACHE_VERSION = 1  # Bump when analysis output changes to orphan old entries
+FACE_DATABASE_DIR = AI_SYSTEMS_ROOT / "data" / "face_database"  # Memory-mapped known-faces store
+FACE_MATCH_TOLERANCE = 0.6  # Max encoding distance for a known-face match (face_recognition default)
+FACE_MATCH_TOP_K = 3  # Candidate people reported per detected face
+FACE_INDEX_ANN_THRESHOLD = 50000  # Encodings before switching to an HNSW index (requires faiss)
 
 # GPU Settings
 USE_GPU = True
@@ -1,36 +1,56 @@
 """
 Alzheimer's Companion Conversation AI System
-Uses Llama-3-Nanda-10B-Chat for empathetic, memory-aware conversations
+Uses Llama-3-Nanda-10B-Chat (transformers) or a quantized GGUF model (llama.cpp)
+for empathetic, memory-aware conversations
 """
 
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
 import json
 import os
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator
 import threading
-from http.server import HTTPServer
 import uuid
 import sys
+from functools import lru_cache
 
 # Import shared utilities and config
 sys.path.append(str(Path(__file__).parent.parent))
 from config.settings import *
 from utils.api_utils import BaseAPIHandler, get_gpu_info, optimize_for_gpu
+from utils.server import create_api_server
+from utils.uploads import RequestBodyError
+from conversation.backends import create_backend
+from conversation.context_builder import ContextBuilder, MESSAGE_OVERHEAD_TOKENS
+from conversation.memory_index import MemoryIndex, create_embedder
+from conversation.templates import (
+    SYSTEM_PROMPT, MEMORY_PROMPTS, COMFORT_RESPONSES, DEFAULT_PATIENT_NAME, greeting_options
+)
 
 
 class AlzheimerConversationAI:
     """Conversation AI specialized for Alzheimer's patients"""
     
-    def __init__(self, model_path: Optional[str] = None, use_quantization: bool = True):
-        """Initialize the conversation AI system"""
+    def __init__(
+        self, 
+        model_path: Optional[str] = None, 
+        use_quantization: bool = True,
+        backend: Optional[str] = None
+    ):
+        """
+        Initialize the conversation AI system
+        
+        Args:
+            model_path: Hugging Face model for the transformers backend
+            use_quantization: Use 8-bit quantization (transformers backend)
+            backend: "transformers", "llama_cpp" or "auto" (defaults to CONVERSATION_BACKEND)
+        """
         self.model_path = model_path or "MBZUAI/Llama-3-Nanda-10B-Chat"
         self.use_quantization = use_quantization
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model = None
-        self.tokenizer = None
+        self.backend_name = backend or CONVERSATION_BACKEND
+        self.backend = None
         
         # Conversation context storage
         self.conversations = {}
@@ -39,172 +59,45 @@ class AlzheimerConversationAI:
         print("Initializing Alzheimer's Conversation AI...")
         print(f"Using device: {self.device}")
         optimize_for_gpu()
-        self._load_model()
         self._load_conversation_templates()
+        self._load_memory_index()
+        self._load_backend()
         print("✓ Conversation AI ready!")
     
-    def _load_model(self):
-        """Load model with RTX 3050 4GB optimized settings"""
-        print(f"Loading {self.model_path} model...")
-        
-        try:
-            # Set custom cache directory
-            import os
-            custom_cache_dir = "F:\\Models\\HuggingFace"
-            os.makedirs(custom_cache_dir, exist_ok=True)
-            
-            # Configure environment
-            os.environ["HF_HUB_DISABLE_SYMLINKS_WARNING"] = "1"
-            os.environ["HF_HOME"] = custom_cache_dir
-            os.environ["TRANSFORMERS_CACHE"] = os.path.join(custom_cache_dir, "transformers")
-            os.environ["HF_DATASETS_CACHE"] = os.path.join(custom_cache_dir, "datasets")
-            
-            print(f"📁 Model cache directory: {custom_cache_dir}")
-            
-            # Hugging Face authentication
-            from huggingface_hub import login
-            
-            # Get token
-            hf_token = os.getenv('HF_TOKEN')
-            if not hf_token:
-                print("\n📋 Please enter your Hugging Face token:")
-                hf_token = input("\nEnter your HF Token: ").strip()
-            
-            if not hf_token:
-                raise ValueError("Token is required for this gated model")
-            
-            # Login to Hugging Face
-            login(token=hf_token)
-            print("✓ Logged in to Hugging Face")
-            
-            # Load tokenizer first
-            print("Loading tokenizer...")
-            self.tokenizer = AutoTokenizer.from_pretrained(
-                self.model_path,
-                trust_remote_code=True,
-                token=hf_token,
-                cache_dir=custom_cache_dir,
-                local_files_only=True
-            )
-            print("✓ Tokenizer loaded successfully")
-            
-            # RTX 3050 4GB specific optimization
-            if torch.cuda.is_available():
-                gpu_memory = torch.cuda.get_device_properties(0).total_memory / (1024**3)
-                print(f"🔧 GPU: RTX 3050 with {gpu_memory:.1f} GB VRAM")
-                print("🚀 Using RTX 3050 optimized loading strategy...")
-                
-                # Use 8-bit quantization with CPU offloading (more stable than 4-bit)
-                quantization_config = BitsAndBytesConfig(
-                    load_in_8bit=True,
-                    llm_int8_enable_fp32_cpu_offload=True,  # Enable CPU offload
-                    llm_int8_threshold=6.0
-                )
-                
-                # Conservative memory allocation for RTX 3050
-                max_memory = {
-                    0: "3.2GB",    # Conservative GPU usage (80% of 4GB)
-                    "cpu": "12GB"  # Allow generous CPU usage
-                }
-                
-                print("📦 Loading with 8-bit quantization and CPU-GPU hybrid...")
-                self.model = AutoModelForCausalLM.from_pretrained(
-                    self.model_path,
-                    quantization_config=quantization_config,
-                    device_map="auto",
-                    max_memory=max_memory,
-                    trust_remote_code=True,
-                    torch_dtype=torch.float16,
-                    token=hf_token,
-                    cache_dir=custom_cache_dir,
-                    local_files_only=True,
-                    low_cpu_mem_usage=True,
-                    offload_folder="temp_offload"
-                )
-                print("✓ Model loaded with RTX 3050 optimized settings")
-                
-            else:
-                print("🖥️  No GPU detected. Using CPU-only mode...")
-                self.model = AutoModelForCausalLM.from_pretrained(
-                    self.model_path,
-                    device_map="cpu",
-                    trust_remote_code=True,
-                    torch_dtype=torch.float32,
-                    token=hf_token,
-                    cache_dir=custom_cache_dir,
-                    local_files_only=True,
-                    low_cpu_mem_usage=True
-                )
-                print("✓ Model loaded on CPU")
-            
-            print("✓ Nanda model loaded successfully")
-            print(f"✓ Model device: {self.device}")
-            print(f"✓ Models cached in: {custom_cache_dir}")
-            
-            # Check final device distribution
-            self.check_model_device_distribution()
-            
-        except Exception as e:
-            print(f"❌ Error loading conversation model: {e}")
-            print("\n🔄 Trying fallback strategy...")
-            
-            # Fallback: CPU-only loading
-            try:
-                print("Loading in CPU-only mode as fallback...")
-                self.model = AutoModelForCausalLM.from_pretrained(
-                    self.model_path,
-                    device_map="cpu",
-                    trust_remote_code=True,
-                    torch_dtype=torch.float32,
-                    token=hf_token,
-                    cache_dir=custom_cache_dir,
-                    local_files_only=True,
-                    low_cpu_mem_usage=True
-                )
-                print("✓ Fallback: Model loaded on CPU only")
-            except Exception as fallback_error:
-                print(f"❌ Fallback also failed: {fallback_error}")
-                raise RuntimeError("Failed to load model on both GPU and CPU")
-
+    def _load_backend(self):
+        """Load the configured inference backend and warm the shared system prompt"""
+        self.backend = create_backend(
+            self.backend_name,
+            self.model_path,
+            use_quantization=self.use_quantization
+        )
+        print(f"✓ Using {self.backend.name} inference backend")
+        
+        # Fixed texts (system prompt, profile entries) are tokenized once
+        self._count_tokens = lru_cache(maxsize=1024)(self.backend.count_tokens)
+        self.context_builder = ContextBuilder(
+            self._count_tokens,
+            history_tokens=CONVERSATION_HISTORY_TOKENS,
+            summary_tokens=CONVERSATION_SUMMARY_TOKENS,
+            profile_tokens=CONVERSATION_PROFILE_TOKENS,
+            keep_fraction=CONVERSATION_HISTORY_KEEP_FRACTION
+        )
+        
+        system_prompt = self._format_prompt([{"role": "system", "content": self.templates["system_prompt"]}])
+        self.backend.warm_prefix(system_prompt)
+    
+    def _load_memory_index(self):
+        """Open the per-patient retrieval index of analyzed memories"""
+        embedder = create_embedder(MEMORY_EMBEDDING_MODEL, max_tokens=MEMORY_EMBEDDING_MAX_TOKENS)
+        self.memory_index = MemoryIndex(MEMORY_INDEX_DIR, embedder)
+        print(f"✓ Memory index ready ({embedder.name})")
+    
     def _load_conversation_templates(self):
         """Load conversation templates for different scenarios"""
         self.templates = {
-            "system_prompt": """You are a caring, patient, and empathetic AI companion specifically designed to help people with Alzheimer's disease and dementia. Your role is to:
-
-1. Provide emotional support and companionship
-2. Help with memory recall through gentle prompting
-3. Maintain a calm, reassuring presence
-4. Speak slowly and clearly
-5. Repeat information when needed
-6. Validate feelings and experiences
-7. Redirect gently when conversations become confused
-8. Use simple, familiar language
-9. Reference personal memories and family when appropriate
-10. Always be kind, patient, and understanding
-
-Respond in the same language the user speaks (English or Hindi). Keep responses warm, short, and easy to understand. Focus on being a comforting presence.""",
-            
-            "memory_prompts": [
-                "Tell me about a happy memory from your childhood.",
-                "What was your wedding day like?",
-                "Can you describe your favorite family tradition?",
-                "What did you enjoy doing with your children when they were young?",
-                "What was your favorite job or work experience?",
-                "Do you remember your favorite song from when you were young?",
-                "Tell me about your parents - what were they like?",
-                "What's a funny story from your past that always makes you smile?"
-            ],
-            
-            "comfort_responses": [
-                "I'm here with you, and you're safe.",
-                "It's okay to feel confused sometimes. We'll figure it out together.",
-                "You're doing great. Take your time.",
-                "I understand this might be difficult. You're not alone.",
-                "Let's talk about something that makes you happy.",
-                "Your feelings are completely valid.",
-                "I'm here to listen to you.",
-                "We can take this conversation at your own pace."
-            ]
+            "system_prompt": SYSTEM_PROMPT,
+            "memory_prompts": list(MEMORY_PROMPTS),
+            "comfort_responses": list(COMFORT_RESPONSES)
         }
     
     def _format_prompt(self, messages: List[Dict[str, str]]) -> str:
@@ -270,7 +163,7 @@ Respond in the same language the user speaks (English or Hindi). Keep responses
         
         # Get patient profile if available
         patient_profile = self.patient_profiles.get(patient_id, {})
-        patient_name = patient_profile.get("name", "friend")
+        patient_name = patient_profile.get("name", DEFAULT_PATIENT_NAME)
         
         # Initialize conversation context
         self.conversations[conversation_id] = {
@@ -282,14 +175,8 @@ Respond in the same language the user speaks (English or Hindi). Keep responses
         }
         
         # Create personalized greeting
-        greeting_options = [
-            f"Hello {patient_name}! I'm so happy to see you today. How are you feeling?",
-            f"Good day, {patient_name}! I hope you're having a wonderful day. What would you like to talk about?",
-            f"Hi there, {patient_name}! It's lovely to spend time with you. How has your day been?"
-        ]
-        
         import random
-        greeting = random.choice(greeting_options)
+        greeting = random.choice(greeting_options(patient_name))
         
         return conversation_id, greeting
     
@@ -317,8 +204,8 @@ Respond in the same language the user speaks (English or Hindi). Keep responses
         messages = self._build_conversation_messages(conversation, include_memory_context)
         
         try:
-            # Generate response using Nanda model
-            ai_response = self._generate_response(messages)
+            # Generate response using the inference backend
+            ai_response = self._generate_response(messages, conversation_id)
             
             # Add AI response to conversation history
             conversation["messages"].append({
@@ -336,54 +223,77 @@ Respond in the same language the user speaks (English or Hindi). Keep responses
             import random
             return random.choice(self.templates["comfort_responses"])
     
-    def _generate_response(self, messages: List[Dict[str, str]]) -> str:
-        """Generate response using Nanda model"""
-        # Format prompt
-        formatted_prompt = self._format_prompt(messages)
-        
-        # Tokenize
-        inputs = self.tokenizer(formatted_prompt, return_tensors="pt")
-        if torch.cuda.is_available():
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
-        
-        input_length = inputs['input_ids'].shape[-1]
-        
-        # Generate response
-        with torch.no_grad():
-            generate_ids = self.model.generate(
-                **inputs,
-                max_length=input_length + 150,  # Limit response length
-                min_length=input_length + 20,   # Ensure minimum response
-                temperature=0.3,                # Lower temperature for consistency
-                top_p=0.9,
-                repetition_penalty=1.1,
-                do_sample=True,
-                pad_token_id=self.tokenizer.eos_token_id,
-                eos_token_id=self.tokenizer.eos_token_id
-            )
-        
-        # Decode response
-        full_response = self.tokenizer.batch_decode(
-            generate_ids, 
-            skip_special_tokens=True, 
-            clean_up_tokenization_spaces=True
-        )[0]
-        
-        # Extract only the assistant's response
-        if "assistant<|end_header_id|>" in full_response:
-            ai_response = full_response.split("assistant<|end_header_id|>")[-1].strip()
-        else:
-            ai_response = full_response[len(formatted_prompt):].strip()
+    def continue_conversation_stream(
+        self, 
+        conversation_id: str, 
+        user_message: str,
+        include_memory_context: bool = True
+    ) -> Iterator[str]:
+        """Continue an existing conversation, yielding the reply as it is generated"""
+        
+        if conversation_id not in self.conversations:
+            raise ValueError("Conversation not found")
+        
+        conversation = self.conversations[conversation_id]
+        
+        # Add user message to conversation history
+        conversation["messages"].append({
+            "role": "user",
+            "content": user_message,
+            "timestamp": datetime.now().isoformat()
+        })
+        
+        # Build conversation context
+        messages = self._build_conversation_messages(conversation, include_memory_context)
+        
+        response_chunks = []
+        try:
+            for text_chunk in self._generate_response_stream(messages, conversation_id):
+                response_chunks.append(text_chunk)
+                yield text_chunk
+            
+            ai_response = "".join(response_chunks).strip()
+            if not ai_response:
+                ai_response = "I'm here to listen. Please tell me more."
+                yield ai_response
+            
+        except Exception as e:
+            print(f"Error generating streamed response: {e}")
+            import random
+            ai_response = random.choice(self.templates["comfort_responses"])
+            # Only fall back if nothing reached the patient yet
+            if response_chunks:
+                ai_response = "".join(response_chunks).strip()
+            else:
+                yield ai_response
         
-        # Clean up response
-        ai_response = ai_response.replace("<|eot_id|>", "").strip()
+        # Add AI response to conversation history
+        conversation["messages"].append({
+            "role": "assistant", 
+            "content": ai_response,
+            "timestamp": datetime.now().isoformat()
+        })
         
+        conversation["last_activity"] = datetime.now().isoformat()
+    
+    def _generate_response(self, messages: List[Dict[str, str]], conversation_id: Optional[str] = None) -> str:
+        """Generate a reply with the inference backend"""
+        ai_response = self.backend.generate(self._format_prompt(messages), conversation_id)
         return ai_response if ai_response else "I'm here to listen. Please tell me more."
     
+    def _generate_response_stream(self, messages: List[Dict[str, str]], conversation_id: Optional[str] = None) -> Iterator[str]:
+        """Yield reply text chunks from the inference backend as they are decoded"""
+        return self.backend.stream(self._format_prompt(messages), conversation_id)
+    
     def _build_conversation_messages(self, conversation: Dict, include_memory_context: bool) -> List[Dict]:
-        """Build message array for Nanda model"""
+        """
+        Build message array for Nanda model
+        
+        Profile details and history are packed against token budgets, so the
+        prompt plus a full reply always fits CONVERSATION_MAX_CONTEXT.
+        """
         patient_profile = conversation["context"]
-        patient_name = patient_profile.get("name", "friend")
+        patient_name = patient_profile.get("name", DEFAULT_PATIENT_NAME)
         
         # System message with patient context
         system_content = self.templates["system_prompt"]
@@ -392,27 +302,72 @@ Respond in the same language the user speaks (English or Hindi). Keep responses
             context_info = f"\n\nPatient Information:\n"
             context_info += f"- Name: {patient_name}\n"
             
-            if patient_profile.get("family_members"):
-                family_list = ", ".join(patient_profile["family_members"])
+            profile_budget = CONVERSATION_PROFILE_TOKENS
+            family_members = self.context_builder.pack(patient_profile.get("family_members", []), profile_budget)
+            if family_members:
+                family_list = ", ".join(family_members)
                 context_info += f"- Family: {family_list}\n"
+                profile_budget -= self._count_tokens(family_list)
             
-            if patient_profile.get("important_memories"):
-                context_info += f"- Important memories: {', '.join(patient_profile['important_memories'][:3])}\n"
+            memories = self.context_builder.pack(patient_profile.get("important_memories", []), profile_budget)
+            if memories:
+                context_info += f"- Important memories: {', '.join(memories)}\n"
             
             system_content += context_info
         
-        messages = [{"role": "system", "content": system_content}]
-        
-        # Add recent conversation history (last 6 messages to manage context length)
-        recent_messages = conversation["messages"][-6:]
-        for msg in recent_messages:
-            messages.append({
-                "role": msg["role"],
-                "content": msg["content"]
-            })
+        # Whatever the system message, summary, memories and reply leave is available for history
+        history_budget = (
+            CONVERSATION_MAX_CONTEXT
+            - CONVERSATION_MAX_TOKENS
+            - self._count_tokens(system_content)
+            - CONVERSATION_SUMMARY_TOKENS
+            - MEMORY_RETRIEVAL_TOKENS
+            - 4 * MESSAGE_OVERHEAD_TOKENS
+        )
+        summary, history = self.context_builder.build_history(conversation, history_budget, patient_name)
+        
+        messages = [{"role": "system", "content": system_content + summary}]
+        messages.extend(history)
+        
+        # Retrieved memories go just before the latest patient message, so the
+        # rest of the prompt stays a stable, cacheable prefix
+        if include_memory_context:
+            memories = self.context_builder.pack(self._retrieve_memories(conversation), MEMORY_RETRIEVAL_TOKENS, separator="\n")
+            if memories and messages[-1]["role"] == "user":
+                messages.insert(len(messages) - 1, {
+                    "role": "system",
+                    "content": "Memories that may be relevant:\n" + "\n".join(memories)
+                })
         
         return messages
     
+    def index_memory(self, patient_id: str, memory_id: str, entries: List[Dict[str, Any]]) -> int:
+        """Add an analyzed memory (captions, answers, transcripts) to the patient's retrieval index"""
+        indexed = self.memory_index.add_memory(patient_id, memory_id, entries)
+        if indexed:
+            print(f"✓ Indexed {indexed} entries of memory {memory_id} for patient {patient_id}")
+        return indexed
+    
+    def _retrieve_memories(self, conversation: Dict) -> List[str]:
+        """Memory lines relevant to the patient's latest message"""
+        user_messages = [msg for msg in conversation["messages"] if msg["role"] == "user"]
+        if not user_messages:
+            return []
+        
+        results = self.memory_index.search(
+            conversation["patient_id"],
+            user_messages[-1]["content"],
+            top_k=MEMORY_RETRIEVAL_TOP_K,
+            min_score=MEMORY_RETRIEVAL_MIN_SCORE
+        )
+        lines = []
+        for result in results:
+            line = f"- {result['text']}"
+            if result["people"]:
+                line += f" (with {', '.join(result['people'])})"
+            lines.append(line)
+        return lines
+    
     def get_memory_prompt(self) -> str:
         """Get a random memory-triggering prompt"""
         import random
@@ -468,101 +423,16 @@ Respond in the same language the user speaks (English or Hindi). Keep responses
         }
         return suggestions.get(mood, "Continue normal conversation")
     
-    def _download_model_files_individually(self, repo_id: str, cache_dir: str, token: str):
-        """Download each model file one by one to prevent conflicts"""
-        from huggingface_hub import list_repo_files, hf_hub_download
-        import time
-        
-        print("📋 Downloading files individually...")
-        
-        try:
-            # Get list of model files
-            files = list_repo_files(repo_id, token=token)
-            
-            # Filter for important model files (download largest files first)
-            model_files = [f for f in files if f.endswith(('.bin', '.safetensors'))]
-            config_files = [f for f in files if f.endswith(('.json', '.txt'))]
-            
-            # Sort model files by size (download smaller files first for progress)
-            all_files = config_files + model_files
-            
-            print(f"Found {len(all_files)} files to download")
-            
-            for i, filename in enumerate(all_files, 1):
-                print(f"\n📥 [{i}/{len(all_files)}] Downloading: {filename}")
-                
-                try:
-                    hf_hub_download(
-                        repo_id=repo_id,
-                        filename=filename,
-                        cache_dir=cache_dir,
-                        token=token,
-                        resume_download=True,
-                        force_download=False  # Don't re-download if exists
-                    )
-                    print(f"✓ Downloaded: {filename}")
-                    
-                    # Small delay to prevent server overload
-                    time.sleep(1)
-                    
-                except Exception as e:
-                    print(f"⚠️  Error downloading {filename}: {e}")
-                    continue
-            
-            print("✓ Individual file download completed")
-            
-        except Exception as e:
-            print(f"Error in individual download: {e}")
-            raise
-
-    def check_model_device_distribution(self):
-        """Check where model layers are loaded"""
-        print("\n🔍 Model Device Distribution:")
-        
-        if hasattr(self.model, 'hf_device_map'):
-            device_map = self.model.hf_device_map
-            gpu_layers = sum(1 for device in device_map.values() if device == 0 or device == 'cuda:0')
-            cpu_layers = sum(1 for device in device_map.values() if device == 'cpu')
-            disk_layers = sum(1 for device in device_map.values() if 'disk' in str(device))
-            
-            print(f"GPU layers: {gpu_layers}")
-            print(f"CPU layers: {cpu_layers}")
-            print(f"Disk layers: {disk_layers}")
-            print(f"Total layers: {len(device_map)}")
-            
-            # Show some mappings
-            for i, (layer, device) in enumerate(list(device_map.items())[:5]):
-                print(f"  {layer}: {device}")
-            if len(device_map) > 5:
-                print(f"  ... and {len(device_map) - 5} more layers")
-        else:
-            print("No device map found - likely CPU-only mode")
-        
-        # Check GPU memory usage
-        if torch.cuda.is_available():
-            try:
-                gpu_memory_allocated = torch.cuda.memory_allocated(0) / (1024**3)
-                gpu_memory_reserved = torch.cuda.memory_reserved(0) / (1024**3)
-                gpu_memory_total = torch.cuda.get_device_properties(0).total_memory / (1024**3)
-                
-                print(f"\n🔧 GPU Memory Usage:")
-                print(f"Allocated: {gpu_memory_allocated:.2f} GB")
-                print(f"Reserved: {gpu_memory_reserved:.2f} GB")
-                print(f"Total: {gpu_memory_total:.2f} GB")
-                print(f"Usage: {(gpu_memory_allocated/gpu_memory_total)*100:.1f}%")
-            except:
-                print("Could not get GPU memory info")
-
-
 class ConversationAPIHandler(BaseAPIHandler):
     """HTTP request handler for Conversation AI API"""
     
+    # Only generation needs a model worker slot
+    unthrottled_paths = ("/health", "/start_conversation", "/create_profile", "/analyze_mood", "/memory_prompt", "/index_memory")
+    
     def do_POST(self):
         """Handle POST requests"""
         try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            request_data = json.loads(post_data.decode('utf-8'))
+            request_data = self.read_json_body()
             
             endpoint = self.path
             
@@ -576,9 +446,13 @@ class ConversationAPIHandler(BaseAPIHandler):
                 self._handle_analyze_mood(request_data)
             elif endpoint == '/memory_prompt':
                 self._handle_memory_prompt(request_data)
+            elif endpoint == '/index_memory':
+                self._handle_index_memory(request_data)
             else:
                 self.send_error_response(404, "Endpoint not found")
                 
+        except RequestBodyError as e:
+            self.send_error_response(e.status_code, str(e))
         except Exception as e:
             print(f"Error handling request: {e}")
             self.send_error_response(500, f"Internal server error: {str(e)}")
@@ -610,6 +484,10 @@ class ConversationAPIHandler(BaseAPIHandler):
             self.send_error_response(400, "conversation_id and message are required")
             return
         
+        if request_data.get('stream', False):
+            self._handle_continue_conversation_stream(conversation_id, user_message)
+            return
+        
         ai_response = conversation_ai.continue_conversation(conversation_id, user_message)
         
         response = {
@@ -620,6 +498,29 @@ class ConversationAPIHandler(BaseAPIHandler):
         
         self.send_json_response(response)
     
+    def _handle_continue_conversation_stream(self, conversation_id: str, user_message: str):
+        """Stream the reply as server-sent events: one 'token' event per chunk, then 'done'"""
+        if conversation_id not in conversation_ai.conversations:
+            self.send_error_response(404, "Conversation not found")
+            return
+        
+        self.send_sse_headers()
+        
+        response_chunks = []
+        try:
+            for text_chunk in conversation_ai.continue_conversation_stream(conversation_id, user_message):
+                response_chunks.append(text_chunk)
+                self.send_sse_event({"text": text_chunk}, event="token")
+            
+            self.send_sse_event({
+                "success": True,
+                "response": "".join(response_chunks).strip(),
+                "timestamp": datetime.now().isoformat()
+            }, event="done")
+            
+        except (BrokenPipeError, ConnectionResetError):
+            print("Client disconnected during streamed response")
+    
     def _handle_create_profile(self, request_data):
         """Handle create patient profile request"""
         patient_id = request_data.get('patient_id')
@@ -666,16 +567,51 @@ class ConversationAPIHandler(BaseAPIHandler):
         
         self.send_json_response(response)
     
+    def _handle_index_memory(self, request_data):
+        """
+        Index an analyzed memory for retrieval during conversations
+        
+        Expects patient_id, memory_id and entries: a list of {"text", "kind",
+        "people", "timestamp"} dicts (see DocumentProcessor.get_memory_entries).
+        """
+        patient_id = request_data.get('patient_id')
+        memory_id = request_data.get('memory_id')
+        entries = request_data.get('entries')
+        
+        if not patient_id or not memory_id or not isinstance(entries, list):
+            self.send_error_response(400, "patient_id, memory_id and an entries list are required")
+            return
+        
+        indexed = conversation_ai.index_memory(patient_id, memory_id, entries)
+        
+        self.send_json_response({
+            "success": True,
+            "memory_id": memory_id,
+            "indexed_entries": indexed
+        })
+    
     def do_GET(self):
         """Handle GET requests"""
         if self.path == '/health':
             response = {
                 "status": "healthy",
                 "service": "Alzheimer's Conversation AI",
-                "model": "Llama-3-Nanda-10B-Chat",
+                "model": conversation_ai.backend.model_name,
+                "backend": conversation_ai.backend.get_stats(),
+                "memory_index": conversation_ai.memory_index.get_stats(),
+                "server": self.server_stats(),
                 "gpu_info": get_gpu_info()
             }
             self.send_json_response(response)
+        elif self.path == '/scheduler_stats':
+            scheduler = getattr(conversation_ai.backend, 'scheduler', None)
+            if scheduler is None:
+                self.send_error_response(404, "Generation scheduler is not available for this backend")
+                return
+            self.send_json_response({
+                "success": True,
+                "scheduler": scheduler.get_stats()
+            })
         else:
             self.send_error_response(404, "Not found")
 
@@ -693,16 +629,23 @@ def initialize_conversation_ai():
 def start_server():
     """Start the conversation AI server"""
     server_address = (CONVERSATION_API_HOST, CONVERSATION_API_PORT)
-    httpd = HTTPServer(server_address, ConversationAPIHandler)
+    # Enough workers that concurrent patients can be merged into one decode batch
+    httpd = create_api_server(
+        server_address,
+        ConversationAPIHandler,
+        max_active=CONVERSATION_MAX_CONCURRENT_REQUESTS
+    )
     
     print(f"Conversation AI Server running on http://{CONVERSATION_API_HOST}:{CONVERSATION_API_PORT}")
     print("Endpoints:")
     print("  POST /start_conversation - Start new conversation")
-    print("  POST /continue_conversation - Continue conversation")
+    print("  POST /continue_conversation - Continue conversation (\"stream\": true for SSE)")
     print("  POST /create_profile - Create patient profile")
     print("  POST /analyze_mood - Analyze conversation mood")
     print("  POST /memory_prompt - Get memory prompt")
+    print("  POST /index_memory - Index an analyzed memory for retrieval")
     print("  GET /health - Health check")
+    print("  GET /scheduler_stats - Queue depth and batch occupancy")
     
     try:
         httpd.serve_forever()
@@ -0,0 +1,603 @@
+"""
+Inference backends for the conversation AI
+A backend turns a formatted chat prompt into reply text (whole or streamed);
+AlzheimerConversationAI picks one from CONVERSATION_BACKEND
+"""
+
+import os
+import threading
+from typing import Optional, Dict, Any, Iterator
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig, TextIteratorStreamer, DynamicCache
+
+from config.settings import *
+from conversation.kv_cache import ConversationKVCache
+from conversation.scheduler import ContinuousBatchScheduler
+from conversation.speculative import create_drafter, unmeasured_speculation_stats, PromptLookupDrafter, DraftModelDrafter
+
+
+class InferenceBackend:
+    """Interface shared by all conversation inference backends"""
+    
+    name = "base"
+    model_name = ""
+    
+    def generate(self, prompt: str, conversation_id: Optional[str] = None) -> str:
+        """Generate a complete reply for a formatted prompt"""
+        raise NotImplementedError
+    
+    def stream(self, prompt: str, conversation_id: Optional[str] = None) -> Iterator[str]:
+        """Yield reply text chunks as soon as they are decoded"""
+        raise NotImplementedError
+    
+    def warm_prefix(self, prefix_prompt: str):
+        """Precompute state for a prompt prefix shared by every conversation"""
+        pass
+    
+    def count_tokens(self, text: str) -> int:
+        """Number of prompt tokens text occupies (rough estimate without a tokenizer)"""
+        return len(text) // 4 + 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Backend details for health reporting"""
+        return {"backend": self.name, "model": self.model_name}
+
+
+class TransformersBackend(InferenceBackend):
+    """Hugging Face transformers backend (8-bit + CPU offload on small GPUs)"""
+    
+    name = "transformers"
+    
+    def __init__(self, model_path: str, use_quantization: bool = True):
+        self.model_path = model_path
+        self.model_name = model_path
+        self.use_quantization = use_quantization
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.model = None
+        self.tokenizer = None
+        
+        # Past-key-values reused across turns (per conversation + system prompt)
+        self.kv_cache = ConversationKVCache(CONVERSATION_KV_CACHE_MAX_MB * 1024**2)
+        
+        self._load_model()
+        self._start_scheduler()
+    
+    def _load_model(self):
+        """Load model with RTX 3050 4GB optimized settings"""
+        print(f"Loading {self.model_path} model...")
+        
+        try:
+            # Set custom cache directory
+            import os
+            custom_cache_dir = "F:\\Models\\HuggingFace"
+            os.makedirs(custom_cache_dir, exist_ok=True)
+            
+            # Configure environment
+            os.environ["HF_HUB_DISABLE_SYMLINKS_WARNING"] = "1"
+            os.environ["HF_HOME"] = custom_cache_dir
+            os.environ["TRANSFORMERS_CACHE"] = os.path.join(custom_cache_dir, "transformers")
+            os.environ["HF_DATASETS_CACHE"] = os.path.join(custom_cache_dir, "datasets")
+            
+            print(f"📁 Model cache directory: {custom_cache_dir}")
+            
+            # Hugging Face authentication
+            from huggingface_hub import login
+            
+            # Get token
+            hf_token = os.getenv('HF_TOKEN')
+            if not hf_token:
+                print("\n📋 Please enter your Hugging Face token:")
+                hf_token = input("\nEnter your HF Token: ").strip()
+            
+            if not hf_token:
+                raise ValueError("Token is required for this gated model")
+            
+            # Login to Hugging Face
+            login(token=hf_token)
+            print("✓ Logged in to Hugging Face")
+            
+            # Load tokenizer first
+            print("Loading tokenizer...")
+            self.tokenizer = AutoTokenizer.from_pretrained(
+                self.model_path,
+                trust_remote_code=True,
+                token=hf_token,
+                cache_dir=custom_cache_dir,
+                local_files_only=True
+            )
+            print("✓ Tokenizer loaded successfully")
+            
+            # RTX 3050 4GB specific optimization
+            if torch.cuda.is_available():
+                gpu_memory = torch.cuda.get_device_properties(0).total_memory / (1024**3)
+                print(f"🔧 GPU: RTX 3050 with {gpu_memory:.1f} GB VRAM")
+                print("🚀 Using RTX 3050 optimized loading strategy...")
+                
+                # Use 8-bit quantization with CPU offloading (more stable than 4-bit)
+                quantization_config = BitsAndBytesConfig(
+                    load_in_8bit=True,
+                    llm_int8_enable_fp32_cpu_offload=True,  # Enable CPU offload
+                    llm_int8_threshold=6.0
+                )
+                
+                # Conservative memory allocation for RTX 3050
+                max_memory = {
+                    0: "3.2GB",    # Conservative GPU usage (80% of 4GB)
+                    "cpu": "12GB"  # Allow generous CPU usage
+                }
+                
+                print("📦 Loading with 8-bit quantization and CPU-GPU hybrid...")
+                self.model = AutoModelForCausalLM.from_pretrained(
+                    self.model_path,
+                    quantization_config=quantization_config,
+                    device_map="auto",
+                    max_memory=max_memory,
+                    trust_remote_code=True,
+                    torch_dtype=torch.float16,
+                    token=hf_token,
+                    cache_dir=custom_cache_dir,
+                    local_files_only=True,
+                    low_cpu_mem_usage=True,
+                    offload_folder="temp_offload"
+                )
+                print("✓ Model loaded with RTX 3050 optimized settings")
+                
+            else:
+                print("🖥️  No GPU detected. Using CPU-only mode...")
+                self.model = AutoModelForCausalLM.from_pretrained(
+                    self.model_path,
+                    device_map="cpu",
+                    trust_remote_code=True,
+                    torch_dtype=torch.float32,
+                    token=hf_token,
+                    cache_dir=custom_cache_dir,
+                    local_files_only=True,
+                    low_cpu_mem_usage=True
+                )
+                print("✓ Model loaded on CPU")
+            
+            print("✓ Nanda model loaded successfully")
+            print(f"✓ Model device: {self.device}")
+            print(f"✓ Models cached in: {custom_cache_dir}")
+            
+            # Check final device distribution
+            self.check_model_device_distribution()
+            
+        except Exception as e:
+            print(f"❌ Error loading conversation model: {e}")
+            print("\n🔄 Trying fallback strategy...")
+            
+            # Fallback: CPU-only loading
+            try:
+                print("Loading in CPU-only mode as fallback...")
+                self.model = AutoModelForCausalLM.from_pretrained(
+                    self.model_path,
+                    device_map="cpu",
+                    trust_remote_code=True,
+                    torch_dtype=torch.float32,
+                    token=hf_token,
+                    cache_dir=custom_cache_dir,
+                    local_files_only=True,
+                    low_cpu_mem_usage=True
+                )
+                print("✓ Fallback: Model loaded on CPU only")
+            except Exception as fallback_error:
+                print(f"❌ Fallback also failed: {fallback_error}")
+                raise RuntimeError("Failed to load model on both GPU and CPU")
+    
+    def _start_scheduler(self):
+        """Start the continuous-batching scheduler so concurrent patients share decode steps"""
+        self.scheduler = None
+        self.drafter = self._load_drafter()
+        if CONVERSATION_SCHEDULER_ENABLED:
+            self.scheduler = ContinuousBatchScheduler(
+                self.model,
+                device=self.device,
+                max_batch_size=CONVERSATION_MAX_BATCH_SIZE,
+                drafter=self.drafter,
+                draft_tokens=CONVERSATION_SPECULATIVE_TOKENS
+            )
+            print(f"✓ Generation scheduler started (max batch size {CONVERSATION_MAX_BATCH_SIZE})")
+    
+    def _load_drafter(self):
+        """Drafter for speculative decoding (None when CONVERSATION_SPECULATIVE_MODE is "off")"""
+        try:
+            drafter = create_drafter(
+                CONVERSATION_SPECULATIVE_MODE,
+                device=self.device,
+                draft_model_path=CONVERSATION_DRAFT_MODEL,
+                max_ngram=CONVERSATION_PROMPT_LOOKUP_MAX_NGRAM,
+                eos_token_id=self.tokenizer.eos_token_id,
+                vocab_size=self.model.config.get_text_config().vocab_size
+            )
+        except Exception as e:
+            print(f"⚠️  Speculative decoding disabled: {e}")
+            return None
+        
+        if drafter is not None:
+            print(f"✓ Speculative decoding enabled ({drafter.name}, {CONVERSATION_SPECULATIVE_TOKENS} draft tokens)")
+        return drafter
+    
+    def _assisted_generation_kwargs(self) -> Dict[str, Any]:
+        """model.generate arguments for speculative decoding when the scheduler is off"""
+        if isinstance(self.drafter, PromptLookupDrafter):
+            return {
+                "prompt_lookup_num_tokens": CONVERSATION_SPECULATIVE_TOKENS,
+                "max_matching_ngram_size": CONVERSATION_PROMPT_LOOKUP_MAX_NGRAM
+            }
+        if isinstance(self.drafter, DraftModelDrafter):
+            return {"assistant_model": self.drafter.model}
+        return {}
+    
+    def warm_prefix(self, prefix_prompt: str):
+        """Prefill the fixed system prompt once so every conversation can reuse it"""
+        try:
+            inputs = self.tokenizer(prefix_prompt, return_tensors="pt")
+            if torch.cuda.is_available():
+                inputs = {k: v.to(self.device) for k, v in inputs.items()}
+            
+            with torch.no_grad():
+                outputs = self.model(**inputs, past_key_values=DynamicCache(), use_cache=True)
+            
+            self.kv_cache.set_system_prefix(inputs["input_ids"][0], outputs.past_key_values)
+            print(f"✓ System prompt KV cache warmed ({inputs['input_ids'].shape[-1]} tokens)")
+            
+        except Exception as e:
+            print(f"⚠️  Could not warm system prompt cache: {e}")
+    
+    def count_tokens(self, text: str) -> int:
+        """Number of prompt tokens text occupies"""
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+    
+    def _prepare_generation_inputs(self, prompt: str) -> Dict[str, torch.Tensor]:
+        """Tokenize a formatted prompt and move it to the model device"""
+        inputs = self.tokenizer(prompt, return_tensors="pt")
+        if torch.cuda.is_available():
+            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        
+        return inputs
+    
+    def _generation_kwargs(self) -> Dict[str, Any]:
+        """Sampling settings shared by blocking, streaming and scheduled generation"""
+        return {
+            "max_new_tokens": CONVERSATION_MAX_TOKENS,
+            "min_new_tokens": CONVERSATION_MIN_TOKENS,
+            "temperature": 0.3,                # Lower temperature for consistency
+            "top_p": 0.9,
+            "repetition_penalty": 1.1,
+            "do_sample": True,
+            "pad_token_id": self.tokenizer.eos_token_id,
+            "eos_token_id": self.tokenizer.eos_token_id
+        }
+    
+    def _generate_with_cache(self, inputs: Dict[str, torch.Tensor], conversation_id: Optional[str], **generate_kwargs) -> torch.Tensor:
+        """
+        Run model.generate, reusing the longest cached prefix of the prompt
+        
+        Only the tokens after the reused prefix are prefilled. The extended
+        cache is stored back under conversation_id for the next turn. When the
+        scheduler is running, the request joins the shared decode batch.
+        """
+        cache, reused_length = self.kv_cache.lookup(conversation_id, inputs['input_ids'][0])
+        
+        if self.scheduler is not None:
+            request = self.scheduler.submit(
+                inputs['input_ids'][0],
+                cache=cache,
+                **self._generation_kwargs(),
+                **generate_kwargs
+            )
+            generate_ids, cache = request.wait()
+        else:
+            if cache is None:
+                cache = DynamicCache()
+            
+            with torch.no_grad():
+                generate_ids = self.model.generate(
+                    **inputs,
+                    **self._generation_kwargs(),
+                    **self._assisted_generation_kwargs(),
+                    **generate_kwargs,
+                    past_key_values=cache
+                )
+        
+        if conversation_id:
+            self.kv_cache.store(conversation_id, generate_ids[0], cache)
+        
+        return generate_ids
+    
+    def generate(self, prompt: str, conversation_id: Optional[str] = None) -> str:
+        """Generate a complete reply for a formatted prompt"""
+        inputs = self._prepare_generation_inputs(prompt)
+        input_length = inputs['input_ids'].shape[-1]
+        
+        # Generate response
+        generate_ids = self._generate_with_cache(inputs, conversation_id)
+        
+        # Decode only the newly generated tokens
+        ai_response = self.tokenizer.decode(
+            generate_ids[0][input_length:], 
+            skip_special_tokens=True, 
+            clean_up_tokenization_spaces=True
+        )
+        
+        return ai_response.replace("<|eot_id|>", "").strip()
+    
+    def stream(self, prompt: str, conversation_id: Optional[str] = None) -> Iterator[str]:
+        """
+        Generate response text incrementally using a TextIteratorStreamer
+        
+        model.generate runs on a background thread and pushes tokens into the
+        streamer; decoded text is yielded as soon as it is available, so the
+        caller sees the first words after prefill instead of after the full reply.
+        """
+        inputs = self._prepare_generation_inputs(prompt)
+        
+        streamer = TextIteratorStreamer(
+            self.tokenizer,
+            skip_prompt=True,
+            skip_special_tokens=True,
+            timeout=STREAM_TOKEN_TIMEOUT
+        )
+        generation_error = []
+        
+        def _run_generation():
+            try:
+                self._generate_with_cache(inputs, conversation_id, streamer=streamer)
+            except Exception as e:
+                generation_error.append(e)
+                streamer.end()
+        
+        generation_thread = threading.Thread(target=_run_generation, daemon=True)
+        generation_thread.start()
+        
+        for text_chunk in streamer:
+            text_chunk = text_chunk.replace("<|eot_id|>", "")
+            if text_chunk:
+                yield text_chunk
+        
+        generation_thread.join()
+        if generation_error:
+            raise generation_error[0]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Backend details for health reporting"""
+        stats = super().get_stats()
+        stats["kv_cache"] = self.kv_cache.get_stats()
+        stats["speculative_mode"] = self.drafter.name if self.drafter is not None else "off"
+        stats["scheduler"] = self.scheduler.get_stats() if self.scheduler else None
+        if self.scheduler is not None:
+            stats["speculation"] = stats["scheduler"]["speculation"]
+        elif self.drafter is not None:
+            stats["speculation"] = unmeasured_speculation_stats(
+                self.drafter.name,
+                CONVERSATION_SPECULATIVE_TOKENS,
+                "model.generate assisted decoding does not report drafted/accepted counts"
+            )
+        else:
+            stats["speculation"] = None
+        return stats
+    
+    def _download_model_files_individually(self, repo_id: str, cache_dir: str, token: str):
+        """Download each model file one by one to prevent conflicts"""
+        from huggingface_hub import list_repo_files, hf_hub_download
+        import time
+        
+        print("📋 Downloading files individually...")
+        
+        try:
+            # Get list of model files
+            files = list_repo_files(repo_id, token=token)
+            
+            # Filter for important model files (download largest files first)
+            model_files = [f for f in files if f.endswith(('.bin', '.safetensors'))]
+            config_files = [f for f in files if f.endswith(('.json', '.txt'))]
+            
+            # Sort model files by size (download smaller files first for progress)
+            all_files = config_files + model_files
+            
+            print(f"Found {len(all_files)} files to download")
+            
+            for i, filename in enumerate(all_files, 1):
+                print(f"\n📥 [{i}/{len(all_files)}] Downloading: {filename}")
+                
+                try:
+                    hf_hub_download(
+                        repo_id=repo_id,
+                        filename=filename,
+                        cache_dir=cache_dir,
+                        token=token,
+                        resume_download=True,
+                        force_download=False  # Don't re-download if exists
+                    )
+                    print(f"✓ Downloaded: {filename}")
+                    
+                    # Small delay to prevent server overload
+                    time.sleep(1)
+                    
+                except Exception as e:
+                    print(f"⚠️  Error downloading {filename}: {e}")
+                    continue
+            
+            print("✓ Individual file download completed")
+            
+        except Exception as e:
+            print(f"Error in individual download: {e}")
+            raise
+    
+    def check_model_device_distribution(self):
+        """Check where model layers are loaded"""
+        print("\n🔍 Model Device Distribution:")
+        
+        if hasattr(self.model, 'hf_device_map'):
+            device_map = self.model.hf_device_map
+            gpu_layers = sum(1 for device in device_map.values() if device == 0 or device == 'cuda:0')
+            cpu_layers = sum(1 for device in device_map.values() if device == 'cpu')
+            disk_layers = sum(1 for device in device_map.values() if 'disk' in str(device))
+            
+            print(f"GPU layers: {gpu_layers}")
+            print(f"CPU layers: {cpu_layers}")
+            print(f"Disk layers: {disk_layers}")
+            print(f"Total layers: {len(device_map)}")
+            
+            # Show some mappings
+            for i, (layer, device) in enumerate(list(device_map.items())[:5]):
+                print(f"  {layer}: {device}")
+            if len(device_map) > 5:
+                print(f"  ... and {len(device_map) - 5} more layers")
+        else:
+            print("No device map found - likely CPU-only mode")
+        
+        # Check GPU memory usage
+        if torch.cuda.is_available():
+            try:
+                gpu_memory_allocated = torch.cuda.memory_allocated(0) / (1024**3)
+                gpu_memory_reserved = torch.cuda.memory_reserved(0) / (1024**3)
+                gpu_memory_total = torch.cuda.get_device_properties(0).total_memory / (1024**3)
+                
+                print(f"\n🔧 GPU Memory Usage:")
+                print(f"Allocated: {gpu_memory_allocated:.2f} GB")
+                print(f"Reserved: {gpu_memory_reserved:.2f} GB")
+                print(f"Total: {gpu_memory_total:.2f} GB")
+                print(f"Usage: {(gpu_memory_allocated/gpu_memory_total)*100:.1f}%")
+            except:
+                print("Could not get GPU memory info")
+
+
+class LlamaCppBackend(InferenceBackend):
+    """
+    llama.cpp backend for the quantized GGUF model (CONVERSATION_MODEL_REPO/FILE)
+    
+    Weights are memory-mapped, so startup is fast and pages are shared between
+    processes. llama.cpp reuses the KV state of the longest common prefix with
+    the previous prompt, and a RAM cache keeps prefix states for other
+    conversations within the same budget as the transformers KV cache.
+    """
+    
+    name = "llama_cpp"
+    
+    def __init__(self, n_threads: Optional[int] = None, n_gpu_layers: int = CONVERSATION_GPU_LAYERS):
+        from llama_cpp import Llama, LlamaRAMCache
+        from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+        
+        self.model_name = f"{CONVERSATION_MODEL_REPO}/{CONVERSATION_MODEL_FILE}"
+        self.n_threads = n_threads or CONVERSATION_NUM_THREADS or os.cpu_count()
+        
+        print(f"Loading {self.model_name} with llama.cpp...")
+        print(f"🧵 Threads: {self.n_threads}, GPU layers: {n_gpu_layers}")
+        
+        # llama.cpp only ships prompt-lookup drafting
+        draft_model = None
+        if CONVERSATION_SPECULATIVE_MODE == "prompt_lookup":
+            draft_model = LlamaPromptLookupDecoding(
+                num_pred_tokens=CONVERSATION_SPECULATIVE_TOKENS,
+                max_ngram_size=CONVERSATION_PROMPT_LOOKUP_MAX_NGRAM
+            )
+        elif CONVERSATION_SPECULATIVE_MODE == "draft_model":
+            print("⚠️  draft_model speculation is not supported by llama.cpp; decoding normally")
+        
+        self.llm = Llama.from_pretrained(
+            repo_id=CONVERSATION_MODEL_REPO,
+            filename=CONVERSATION_MODEL_FILE,
+            cache_dir=str(MODELS_DIR),
+            n_ctx=CONVERSATION_MAX_CONTEXT,
+            n_threads=self.n_threads,
+            n_threads_batch=self.n_threads,
+            n_gpu_layers=n_gpu_layers,
+            use_mmap=True,
+            draft_model=draft_model,
+            verbose=False
+        )
+        self.llm.set_cache(LlamaRAMCache(capacity_bytes=CONVERSATION_KV_CACHE_MAX_MB * 1024**2))
+        self._end_token_ids = sorted({
+            self.llm.token_eos(),
+            *self.llm.tokenize(b"<|eot_id|>", add_bos=False, special=True)
+        })
+        
+        # A llama.cpp context serves one evaluation at a time
+        self._lock = threading.Lock()
+        print("✓ GGUF model loaded (memory-mapped)")
+    
+    def _completion_kwargs(self) -> Dict[str, Any]:
+        """Sampling settings matching the transformers backend"""
+        from llama_cpp import LogitsProcessorList
+        
+        return {
+            "max_tokens": CONVERSATION_MAX_TOKENS,
+            "temperature": 0.3,
+            "top_p": 0.9,
+            "repeat_penalty": 1.1,
+            "stop": ["<|eot_id|>"],
+            "logits_processor": LogitsProcessorList([self._min_tokens_processor()])
+        }
+    
+    def _min_tokens_processor(self):
+        """
+        Logits processor suppressing end of turn until CONVERSATION_MIN_TOKENS
+        are generated (llama.cpp completions have no min_tokens argument)
+        """
+        prompt_length = None
+        
+        def processor(input_ids, scores):
+            nonlocal prompt_length
+            # The first call samples the token right after the prompt
+            if prompt_length is None:
+                prompt_length = len(input_ids)
+            if len(input_ids) - prompt_length < CONVERSATION_MIN_TOKENS:
+                scores[self._end_token_ids] = float("-inf")
+            return scores
+        
+        return processor
+    
+    def _strip_bos(self, prompt: str) -> str:
+        """llama.cpp prepends BOS itself; drop the one from the chat template"""
+        return prompt[len("<|begin_of_text|>"):] if prompt.startswith("<|begin_of_text|>") else prompt
+    
+    def count_tokens(self, text: str) -> int:
+        """Number of prompt tokens text occupies"""
+        return len(self.llm.tokenize(text.encode("utf-8"), add_bos=False, special=True))
+    
+    def generate(self, prompt: str, conversation_id: Optional[str] = None) -> str:
+        """Generate a complete reply for a formatted prompt"""
+        with self._lock:
+            completion = self.llm(self._strip_bos(prompt), **self._completion_kwargs())
+        return completion["choices"][0]["text"].strip()
+    
+    def stream(self, prompt: str, conversation_id: Optional[str] = None) -> Iterator[str]:
+        """Yield reply text chunks as soon as they are decoded"""
+        with self._lock:
+            for chunk in self.llm(self._strip_bos(prompt), stream=True, **self._completion_kwargs()):
+                text_chunk = chunk["choices"][0]["text"]
+                if text_chunk:
+                    yield text_chunk
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Backend details for health reporting"""
+        stats = super().get_stats()
+        stats.update({
+            "n_ctx": self.llm.n_ctx(),
+            "n_threads": self.n_threads,
+            "max_tokens": CONVERSATION_MAX_TOKENS,
+            "min_tokens": CONVERSATION_MIN_TOKENS,
+            "speculative_mode": "prompt_lookup" if self.llm.draft_model is not None else "off",
+            "speculation": unmeasured_speculation_stats(
+                "prompt_lookup",
+                CONVERSATION_SPECULATIVE_TOKENS,
+                "llama.cpp does not report drafted/accepted counts"
+            ) if self.llm.draft_model is not None else None
+        })
+        return stats
+
+
+def create_backend(backend_name: str, model_path: str, use_quantization: bool = True) -> InferenceBackend:
+    """Instantiate the configured backend ("auto" picks llama.cpp on CPU-only nodes)"""
+    if backend_name == "auto":
+        backend_name = "transformers" if torch.cuda.is_available() else "llama_cpp"
+    
+    if backend_name == "transformers":
+        return TransformersBackend(model_path, use_quantization=use_quantization)
+    if backend_name == "llama_cpp":
+        return LlamaCppBackend()
+    
+    raise ValueError(f"Unknown conversation backend: {backend_name}")
@@ -0,0 +1,131 @@
+"""
+Token-budgeted prompt context for the conversation AI
+Packs as much recent history as a fixed token budget allows and folds older
+turns into a rolling summary, so every prompt fits CONVERSATION_MAX_CONTEXT
+"""
+
+import re
+from typing import Callable, Dict, List, Any, Tuple
+
+
+# Chat-template tokens around every message (header start/end, role, end of turn)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_HEADER = "\n\nEarlier in this conversation:\n"
+SUMMARY_LINE_CHARS = 160
+FIRST_SENTENCE = re.compile(r'.+?[.!?।]["\'”’)]*(?=\s|$)', re.DOTALL)
+
+
+class ContextBuilder:
+    """
+    Chooses which history goes into each prompt.
+
+    Verbatim history starts at conversation["history_start"] and grows turn
+    by turn, so consecutive prompts share their prefix and the KV cache only
+    prefills the new messages. When the window exceeds history_tokens, the
+    oldest messages are folded into conversation["summary"] until the window
+    is back under keep_fraction of the budget; the prompt prefix changes
+    only at these folds. The summary keeps one short line per folded message
+    and drops its oldest lines beyond summary_tokens.
+
+    Token counts come from the backend tokenizer and are cached on each
+    message and summary line, so every text is tokenized once.
+    """
+
+    def __init__(
+        self,
+        count_tokens: Callable[[str], int],
+        history_tokens: int,
+        summary_tokens: int,
+        profile_tokens: int,
+        keep_fraction: float = 0.5
+    ):
+        self.count_tokens = count_tokens
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.profile_tokens = profile_tokens
+        self.keep_fraction = keep_fraction
+
+    def message_tokens(self, message: Dict[str, Any]) -> int:
+        """Prompt tokens of a stored message (cached on the message)"""
+        if "token_count" not in message:
+            message["token_count"] = self.count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+        return message["token_count"]
+
+    def pack(self, items: List[str], budget: int, separator: str = ", ") -> List[str]:
+        """Longest leading run of items whose joined text fits in budget tokens"""
+        packed = []
+        used = 0
+        for item in items:
+            cost = self.count_tokens(item + separator)
+            if used + cost > budget:
+                break
+            packed.append(item)
+            used += cost
+        return packed
+
+    def build_history(self, conversation: Dict[str, Any], history_budget: int, patient_name: str) -> Tuple[str, List[Dict[str, str]]]:
+        """
+        Summary text and verbatim messages for the next prompt
+
+        history_budget caps the verbatim history below history_tokens when
+        the rest of the prompt leaves less room. The latest message is always
+        included, shortened if it alone exceeds the budget.
+        """
+        messages = conversation["messages"]
+        budget = min(self.history_tokens, history_budget)
+        start = conversation.get("history_start", 0)
+
+        window_tokens = sum(self.message_tokens(message) for message in messages[start:])
+        if window_tokens > budget:
+            target = int(budget * self.keep_fraction)
+            folded_start = start
+            while folded_start < len(messages) - 1 and window_tokens > target:
+                window_tokens -= self.message_tokens(messages[folded_start])
+                folded_start += 1
+            self._fold(conversation, messages[start:folded_start], patient_name)
+            conversation["history_start"] = start = folded_start
+
+        history = [{"role": message["role"], "content": message["content"]} for message in messages[start:]]
+        if history and window_tokens > budget:
+            history[-1]["content"] = self._shorten(history[-1]["content"], budget - MESSAGE_OVERHEAD_TOKENS)
+
+        return self.summary_text(conversation), history
+
+    def summary_text(self, conversation: Dict[str, Any]) -> str:
+        """Rolling summary block for the system message ("" before the first fold)"""
+        lines = conversation.get("summary", [])
+        if not lines:
+            return ""
+        return SUMMARY_HEADER + "\n".join(line["text"] for line in lines) + "\n"
+
+    def _fold(self, conversation: Dict[str, Any], folded: List[Dict[str, Any]], patient_name: str):
+        """Append one line per folded message and trim the summary to its budget"""
+        lines = conversation.setdefault("summary", [])
+        for message in folded:
+            speaker = patient_name if message["role"] == "user" else "You"
+            text = f"- {speaker}: {_first_sentence(message['content'])}"
+            lines.append({"text": text, "token_count": self.count_tokens(text + "\n")})
+
+        total = sum(line["token_count"] for line in lines)
+        while lines and total > self.summary_tokens:
+            total -= lines.pop(0)["token_count"]
+
+    def _shorten(self, content: str, budget: int) -> str:
+        """Keep the end of an oversized message (where the question usually is)"""
+        tokens = self.count_tokens(content)
+        while content and tokens > budget:
+            keep = max(0, int(len(content) * budget / tokens) - 1)
+            content = content[len(content) - keep:] if keep else ""
+            tokens = self.count_tokens("…" + content)
+        return "…" + content
+
+
+def _first_sentence(text: str) -> str:
+    """First sentence of text, cut to SUMMARY_LINE_CHARS"""
+    text = " ".join(text.split())
+    match = FIRST_SENTENCE.match(text)
+    sentence = match.group(0) if match else text
+    if len(sentence) > SUMMARY_LINE_CHARS:
+        sentence = sentence[:SUMMARY_LINE_CHARS].rsplit(" ", 1)[0] + "…"
+    return sentence
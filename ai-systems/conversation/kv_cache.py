@@ -0,0 +1,172 @@
+"""
+Prefix KV-cache store for the conversation model
+Keeps past-key-values between turns so each turn only prefills new tokens
+"""
+
+import copy
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+
+import torch
+from transformers import DynamicCache
+
+
+def cache_layers(cache) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+    """Per-layer (keys, values) tensors of a transformers DynamicCache"""
+    if hasattr(cache, "layers"):
+        return [(layer.keys, layer.values) for layer in cache.layers if getattr(layer, "keys", None) is not None]
+    return list(zip(cache.key_cache, cache.value_cache))
+
+
+def build_cache(layers: List[Tuple[torch.Tensor, torch.Tensor]]) -> DynamicCache:
+    """Create a DynamicCache holding the given per-layer (keys, values) tensors"""
+    cache = DynamicCache()
+    for layer_idx, (keys, values) in enumerate(layers):
+        cache.update(keys, values, layer_idx)
+    return cache
+
+
+def cache_nbytes(cache) -> int:
+    """Total size in bytes of the key/value tensors held by a transformers cache"""
+    return sum(
+        t.numel() * t.element_size()
+        for layer in cache_layers(cache)
+        for t in layer
+    )
+
+
+def common_prefix_length(cached_ids: torch.Tensor, input_ids: torch.Tensor) -> int:
+    """Number of leading tokens shared by two 1-D token id tensors"""
+    length = min(cached_ids.shape[0], input_ids.shape[0])
+    if length == 0:
+        return 0
+
+    mismatches = (cached_ids[:length] != input_ids[:length].to(cached_ids.device)).nonzero()
+    return int(mismatches[0]) if mismatches.numel() else length
+
+
+class ConversationKVCache:
+    """
+    LRU store of past-key-values keyed by conversation_id, plus one pinned
+    cache for the shared system prompt prefix.
+
+    A per-conversation entry is handed out (and removed from the store) on
+    lookup, because generate() extends the cache in place; the caller stores it
+    back once the reply is finished. The system prefix cache is copied on use.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._system_entry: Optional[Dict[str, Any]] = None
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.hits = 0
+        self.system_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reused_tokens = 0
+        self.prefilled_tokens = 0
+
+    def set_system_prefix(self, token_ids: torch.Tensor, cache):
+        """Pin the cache for the fixed system prompt prefix"""
+        with self._lock:
+            self._system_entry = {
+                "token_ids": token_ids.detach().cpu(),
+                "cache": cache,
+                "nbytes": cache_nbytes(cache)
+            }
+
+    def lookup(self, conversation_id: Optional[str], input_ids: torch.Tensor) -> Tuple[Optional[Any], int]:
+        """
+        Find the longest cached prefix of input_ids (1-D)
+
+        Returns:
+            (cache, reused_length); the cache is cropped to reused_length and
+            owned by the caller. At least one input token is always left
+            uncached so generation has something to prefill.
+        """
+        input_ids = input_ids.detach().cpu()
+        max_reuse = input_ids.shape[0] - 1
+
+        with self._lock:
+            entry = self._entries.pop(conversation_id, None) if conversation_id else None
+            if entry is not None:
+                self._total_bytes -= entry["nbytes"]
+
+            conversation_length = common_prefix_length(entry["token_ids"], input_ids) if entry else 0
+            system_length = 0
+            if self._system_entry is not None:
+                system_length = common_prefix_length(self._system_entry["token_ids"], input_ids)
+
+            if entry is not None and conversation_length >= system_length and conversation_length > 0:
+                cache = entry["cache"]
+                reused_length = min(conversation_length, max_reuse)
+                self.hits += 1
+            elif system_length > 0:
+                cache = copy.deepcopy(self._system_entry["cache"])
+                reused_length = min(system_length, max_reuse)
+                self.system_hits += 1
+            else:
+                self.misses += 1
+                self.prefilled_tokens += input_ids.shape[0]
+                return None, 0
+
+            self.reused_tokens += reused_length
+            self.prefilled_tokens += input_ids.shape[0] - reused_length
+
+        surplus = cache.get_seq_length() - reused_length
+        if surplus > 0:
+            cache.crop(-surplus)
+        return cache, reused_length
+
+    def store(self, conversation_id: str, token_ids: torch.Tensor, cache):
+        """Store the cache for a conversation and evict idle ones over budget"""
+        cached_length = cache.get_seq_length()
+        entry = {
+            "token_ids": token_ids.detach().cpu()[:cached_length],
+            "cache": cache,
+            "nbytes": cache_nbytes(cache)
+        }
+
+        with self._lock:
+            previous = self._entries.pop(conversation_id, None)
+            if previous is not None:
+                self._total_bytes -= previous["nbytes"]
+
+            if entry["nbytes"] > self.max_bytes:
+                return
+
+            self._entries[conversation_id] = entry
+            self._total_bytes += entry["nbytes"]
+
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted["nbytes"]
+                self.evictions += 1
+
+    def drop(self, conversation_id: str):
+        """Forget the cache for a conversation"""
+        with self._lock:
+            entry = self._entries.pop(conversation_id, None)
+            if entry is not None:
+                self._total_bytes -= entry["nbytes"]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Cache usage statistics for health reporting"""
+        with self._lock:
+            return {
+                "conversations_cached": len(self._entries),
+                "cached_mb": round(self._total_bytes / (1024**2), 2),
+                "budget_mb": round(self.max_bytes / (1024**2), 2),
+                "system_prefix_tokens": int(self._system_entry["token_ids"].shape[0]) if self._system_entry else 0,
+                "hits": self.hits,
+                "system_hits": self.system_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "reused_tokens": self.reused_tokens,
+                "prefilled_tokens": self.prefilled_tokens
+            }
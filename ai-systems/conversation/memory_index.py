@@ -0,0 +1,354 @@
+"""
+Retrieval index over patients' analyzed memories
+Captions, answers, recognized people and transcripts from document analysis are
+embedded once and searched at every conversation turn
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Optional, Dict, List, Any
+
+import numpy as np
+import torch
+
+
+# Devanagari vowel signs are not \w, so the block is listed to keep Hindi words whole
+WORD_PATTERN = re.compile(r"[\w\u0900-\u097F]+")
+SENTENCE_END = re.compile(r'(?<=[.!?।])\s+')
+
+# Entries longer than this are split so each piece fits the embedding window
+MAX_ENTRY_CHARS = 240
+
+
+class HashingEmbedder:
+    """
+    Model-free embeddings from hashed character n-grams of each word.
+
+    Matches names and shared words across English and Hindi text without
+    any download; used when the sentence-embedding model is unavailable.
+    crc32 keeps the hashing stable across processes, so stored vectors stay
+    valid after a restart.
+    """
+
+    def __init__(self, dim: int = 512, ngram_sizes: tuple = (3, 4)):
+        self.dim = dim
+        self.ngram_sizes = ngram_sizes
+        self.name = f"hashing-{dim}"
+        # Lexical overlap scores lower than sentence-embedding similarity
+        self.min_score = 0.2
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """(n, dim) L2-normalized float32 embeddings"""
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in WORD_PATTERN.findall(text.lower()):
+                word = f"<{word}>"
+                for size in self.ngram_sizes:
+                    for start in range(max(1, len(word) - size + 1)):
+                        code = zlib.crc32(word[start:start + size].encode("utf-8"))
+                        vectors[row, code % self.dim] += 1.0 if code & 0x80000000 else -1.0
+        return _normalize(vectors)
+
+
+class TransformerEmbedder:
+    """Mean-pooled sentence embeddings from a small transformers encoder"""
+
+    def __init__(self, model_name: str, max_tokens: int = 64, device: str = "cpu"):
+        from transformers import AutoTokenizer, AutoModel
+
+        self.name = model_name
+        self.max_tokens = max_tokens
+        self.min_score = 0.35
+        self.device = device
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name).to(device).eval()
+        self.dim = self.model.config.hidden_size
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """(n, dim) L2-normalized float32 embeddings; inputs are cut to max_tokens"""
+        inputs = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_tokens,
+            return_tensors="pt"
+        ).to(self.device)
+
+        with torch.inference_mode():
+            hidden = self.model(**inputs).last_hidden_state
+        mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1.0)
+        return _normalize(pooled.float().cpu().numpy())
+
+
+def create_embedder(model_name: Optional[str], max_tokens: int = 64):
+    """Sentence-embedding model, falling back to hashed n-grams when it cannot be loaded"""
+    if model_name:
+        try:
+            embedder = TransformerEmbedder(model_name, max_tokens=max_tokens)
+            print(f"✓ Memory embedding model loaded: {model_name}")
+            return embedder
+        except Exception as e:
+            print(f"⚠️  Could not load memory embedding model ({e}); using hashed n-gram embeddings")
+    return HashingEmbedder()
+
+
+class PatientMemories:
+    """
+    One patient's entries with their vectors in a contiguous matrix.
+
+    On disk the patient's directory holds entries.jsonl (one JSON entry per
+    line) and vectors.f16 (raw float16 rows, parallel to the entries); both
+    are append-only, and a torn tail from a crash is trimmed on load. The
+    in-memory matrix is float32 and grows geometrically.
+    """
+
+    def __init__(self, directory: Path, dim: int):
+        self.directory = Path(directory)
+        self.dim = dim
+        self.entries_path = self.directory / "entries.jsonl"
+        self.vectors_path = self.directory / "vectors.f16"
+
+        self.entries: List[Dict[str, Any]] = []
+        self.memory_ids = set()
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:len(self.entries)]
+
+    def load(self, embedder) -> "PatientMemories":
+        """Read stored entries; re-embeds them if vectors are missing or from another embedder"""
+        if not self.entries_path.exists():
+            return self
+
+        entries = []
+        torn = False
+        with open(self.entries_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    torn = True
+                    break
+
+        row_bytes = self.dim * 2
+        vector_rows = self.vectors_path.stat().st_size // row_bytes if self.vectors_path.exists() else 0
+        if vector_rows >= len(entries):
+            vectors = np.fromfile(self.vectors_path, dtype=np.float16, count=len(entries) * self.dim)
+            vectors = vectors.reshape(-1, self.dim).astype(np.float32)
+        else:
+            print(f"⚠️  Re-embedding {len(entries)} memory entries in {self.directory.name}")
+            vectors = embedder.embed([_entry_text(entry) for entry in entries])
+
+        if torn or vector_rows != len(entries):
+            self._rewrite(entries, vectors)
+        self._append_memory(entries, vectors)
+        return self
+
+    def add(self, entries: List[Dict[str, Any]], vectors: np.ndarray):
+        """Append entries with their (n, dim) vectors, persisting them first"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Vectors first: entries without a vector are re-embedded on load
+        _append_bytes(self.vectors_path, vectors.astype(np.float16).tobytes())
+        _append_bytes(self.entries_path, "".join(
+            json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries
+        ).encode("utf-8"))
+        self._append_memory(entries, vectors)
+
+    def _append_memory(self, entries: List[Dict[str, Any]], vectors: np.ndarray):
+        size = len(self.entries)
+        capacity = size + len(entries)
+        if capacity > len(self._vectors):
+            grown = np.empty((max(capacity, 2 * len(self._vectors), 64), self.dim), dtype=np.float32)
+            grown[:size] = self._vectors[:size]
+            self._vectors = grown
+        self._vectors[size:capacity] = vectors
+        self.entries.extend(entries)
+        self.memory_ids.update(entry["memory_id"] for entry in entries)
+
+    def _rewrite(self, entries: List[Dict[str, Any]], vectors: np.ndarray):
+        """Replace both files after a repair or re-embedding"""
+        for path, data in (
+            (self.vectors_path, vectors.astype(np.float16).tobytes()),
+            (self.entries_path, "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries).encode("utf-8"))
+        ):
+            temp_path = path.with_suffix(path.suffix + ".tmp")
+            with open(temp_path, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            temp_path.replace(path)
+
+
+class MemoryIndex:
+    """
+    Per-patient vector store of memory entries.
+
+    Each entry is a short text (a caption, an answer, a transcript) tagged
+    with the memory it came from and the people recognized in it. Patients
+    are loaded from disk on first use. A search embeds the query once and
+    scores it against the patient's entries with one matrix-vector product,
+    returning the best entry per memory.
+    """
+
+    def __init__(self, directory: Path, embedder):
+        self.directory = Path(directory)
+        self.embedder = embedder
+        self._patients: Dict[str, PatientMemories] = {}
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.searches = 0
+        self.total_search_ms = 0.0
+        self.max_search_ms = 0.0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._check_embedder()
+
+    def _check_embedder(self):
+        """Drop vectors made by a different embedder; entries are re-embedded on load"""
+        meta_path = self.directory / "meta.json"
+        meta = {"embedder": self.embedder.name, "dim": self.embedder.dim}
+        if meta_path.exists():
+            with open(meta_path, "r", encoding="utf-8") as f:
+                if json.load(f) == meta:
+                    return
+            for vectors_path in self.directory.glob("*/vectors.f16"):
+                vectors_path.unlink()
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    def _patient(self, patient_id: str) -> PatientMemories:
+        memories = self._patients.get(patient_id)
+        if memories is None:
+            directory = self.directory / hashlib.sha256(patient_id.encode("utf-8")).hexdigest()[:32]
+            memories = PatientMemories(directory, self.embedder.dim).load(self.embedder)
+            self._patients[patient_id] = memories
+        return memories
+
+    def add_memory(self, patient_id: str, memory_id: str, entries: List[Dict[str, Any]]) -> int:
+        """
+        Index the entries of one analyzed memory; returns how many were added
+
+        entries are dicts with "text" and optional "kind", "people" and
+        "timestamp". A memory that is already indexed is skipped, so
+        repeated deliveries of the same analysis are harmless.
+        """
+        with self._lock:
+            memories = self._patient(patient_id)
+            if memory_id in memories.memory_ids:
+                return 0
+
+        seen = set()
+        records = []
+        for entry in entries:
+            for text in _split_entry_text(" ".join(str(entry.get("text", "")).split())):
+                if text in seen:
+                    continue
+                seen.add(text)
+                records.append({
+                    "memory_id": memory_id,
+                    "kind": entry.get("kind", "note"),
+                    "text": text,
+                    "people": list(entry.get("people", [])),
+                    "timestamp": entry.get("timestamp")
+                })
+        if not records:
+            return 0
+
+        vectors = self.embedder.embed([_entry_text(record) for record in records])
+        with self._lock:
+            if memory_id in memories.memory_ids:
+                return 0
+            memories.add(records, vectors)
+        return len(records)
+
+    def search(self, patient_id: str, query: str, top_k: int = 3, min_score: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Best-scoring entries (at most one per memory) for a query, highest first"""
+        if min_score is None:
+            min_score = self.embedder.min_score
+        start_time = time.perf_counter()
+        with self._lock:
+            memories = self._patient(patient_id)
+            size = len(memories)
+            vectors = memories.vectors
+            entries = memories.entries[:size]
+        if size == 0 or not query.strip():
+            return []
+
+        scores = vectors @ self.embedder.embed([query])[0]
+
+        # Over-fetch so several entries of one memory still leave room for others
+        fetch = min(size, top_k * 4)
+        candidates = np.argpartition(-scores, fetch - 1)[:fetch] if fetch < size else np.arange(size)
+        candidates = candidates[np.argsort(-scores[candidates])]
+
+        results = []
+        used_memories = set()
+        for index in candidates:
+            entry = entries[index]
+            if scores[index] < min_score or len(results) >= top_k:
+                break
+            if entry["memory_id"] in used_memories:
+                continue
+            used_memories.add(entry["memory_id"])
+            results.append(dict(entry, score=round(float(scores[index]), 4)))
+
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        with self._lock:
+            self.searches += 1
+            self.total_search_ms += elapsed_ms
+            self.max_search_ms = max(self.max_search_ms, elapsed_ms)
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "embedder": self.embedder.name,
+                "dim": self.embedder.dim,
+                "patients_loaded": len(self._patients),
+                "entries_loaded": sum(len(memories) for memories in self._patients.values()),
+                "searches": self.searches,
+                "average_search_ms": round(self.total_search_ms / self.searches, 3) if self.searches else 0.0,
+                "max_search_ms": round(self.max_search_ms, 3)
+            }
+
+
+def _split_entry_text(text: str) -> List[str]:
+    """Split long texts (e.g. transcripts) at sentence ends into pieces of about MAX_ENTRY_CHARS"""
+    pieces = []
+    for sentence in SENTENCE_END.split(text):
+        if pieces and len(pieces[-1]) + 1 + len(sentence) <= MAX_ENTRY_CHARS:
+            pieces[-1] += " " + sentence
+        elif sentence:
+            pieces.append(sentence)
+    return pieces
+
+
+def _entry_text(entry: Dict[str, Any]) -> str:
+    """Text that is embedded for an entry (people are part of what it is about)"""
+    if entry["people"]:
+        return f"{entry['text']} (with {', '.join(entry['people'])})"
+    return entry["text"]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+def _append_bytes(path: Path, data: bytes):
+    with open(path, "ab") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
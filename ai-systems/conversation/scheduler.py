@@ -0,0 +1,423 @@
+"""
+Continuous-batching generation scheduler for the conversation model
+Merges concurrent requests into shared decode steps; sequences join and
+leave the running batch independently
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Optional, Dict, Any, List, Tuple
+
+import torch
+import torch.nn.functional as F
+from transformers import DynamicCache
+from transformers.generation.logits_process import (
+    LogitsProcessorList,
+    MinNewTokensLengthLogitsProcessor,
+    RepetitionPenaltyLogitsProcessor,
+    TemperatureLogitsWarper,
+    TopPLogitsWarper,
+)
+
+from conversation.kv_cache import cache_layers, build_cache
+from conversation.speculative import SpeculationStats
+
+
+class GenerationRequest:
+    """A single queued or running generation"""
+
+    def __init__(
+        self,
+        prompt_ids: torch.Tensor,
+        cache: Optional[DynamicCache] = None,
+        max_new_tokens: int = 150,
+        min_new_tokens: int = 0,
+        temperature: float = 1.0,
+        top_p: float = 1.0,
+        repetition_penalty: float = 1.0,
+        do_sample: bool = True,
+        eos_token_id: Optional[int] = None,
+        pad_token_id: Optional[int] = None,
+        streamer=None
+    ):
+        self.prompt_ids = prompt_ids.detach().cpu()
+        self.cache = cache
+        self.max_new_tokens = max_new_tokens
+        self.do_sample = do_sample
+        self.eos_token_id = eos_token_id
+        self.streamer = streamer
+
+        self._sampling = {
+            "min_new_tokens": min_new_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+            "repetition_penalty": repetition_penalty
+        }
+        self._logits_processors: Optional[LogitsProcessorList] = None
+        self._processors_device: Optional[torch.device] = None
+
+        self.token_ids: List[int] = self.prompt_ids.tolist()
+        self.generated_count = 0
+        self.submitted_at = time.time()
+        self.first_token_at: Optional[float] = None
+
+        self._done = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def logits_processors(self, device: torch.device) -> LogitsProcessorList:
+        """
+        Processors for logits on device
+
+        Built on first use because MinNewTokensLengthLogitsProcessor keeps its
+        eos ids as a tensor that must share the logits' device (which, with
+        CPU offload, need not be the model's input device).
+        """
+        if self._logits_processors is None or self._processors_device != device:
+            processors = LogitsProcessorList()
+            if self._sampling["repetition_penalty"] != 1.0:
+                processors.append(RepetitionPenaltyLogitsProcessor(self._sampling["repetition_penalty"]))
+            if self._sampling["min_new_tokens"] > 0 and self.eos_token_id is not None:
+                processors.append(MinNewTokensLengthLogitsProcessor(
+                    self.prompt_ids.shape[0], self._sampling["min_new_tokens"], self.eos_token_id, device=device
+                ))
+            if self.do_sample:
+                if self._sampling["temperature"] != 1.0:
+                    processors.append(TemperatureLogitsWarper(self._sampling["temperature"]))
+                if self._sampling["top_p"] < 1.0:
+                    processors.append(TopPLogitsWarper(self._sampling["top_p"]))
+            self._logits_processors = processors
+            self._processors_device = device
+        return self._logits_processors
+
+    def wait(self) -> Tuple[torch.Tensor, DynamicCache]:
+        """Block until generation finishes; returns (sequence ids of shape (1, n), final cache)"""
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return torch.tensor([self.token_ids]), self.cache
+
+    def _finish(self, error: Optional[BaseException] = None):
+        self._error = error
+        if self.streamer is not None:
+            self.streamer.end()
+        self._done.set()
+
+
+class ContinuousBatchScheduler:
+    """
+    Runs one background decode loop over a shared batch.
+
+    Waiting requests are prefilled individually (reusing any prefix cache they
+    bring) and then merged into the running batch. Each decode step feeds one
+    token per active sequence through a single left-padded forward pass.
+    Finished sequences leave the batch immediately, freeing their slot.
+
+    With a drafter, a lone sequence (nothing else running or waiting) is
+    decoded speculatively: the drafted tokens are fed together with its last
+    token and the main model samples each position in order, keeping drafts
+    only while they match. Sampling from the main model at every position
+    keeps the output distribution unchanged.
+    """
+
+    def __init__(self, model, device: str, max_batch_size: int = 8, drafter=None, draft_tokens: int = 8):
+        self.model = model
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.drafter = drafter
+        self.draft_tokens = draft_tokens
+        self.speculation = SpeculationStats(drafter.name, draft_tokens) if drafter is not None else None
+
+        self._waiting: deque = deque()
+        self._condition = threading.Condition()
+        self._running = True
+
+        # Running batch state (only touched by the scheduler thread)
+        self._active: List[GenerationRequest] = []
+        self._batch_cache: Optional[DynamicCache] = None
+        self._attention_mask: Optional[torch.Tensor] = None
+
+        # Statistics
+        self.total_requests = 0
+        self.completed_requests = 0
+        self.decode_steps = 0
+        self.generated_tokens = 0
+        self._occupancy_sum = 0
+
+        self._thread = threading.Thread(target=self._run, daemon=True, name="generation-scheduler")
+        self._thread.start()
+
+    def submit(self, prompt_ids: torch.Tensor, **request_kwargs) -> GenerationRequest:
+        """Queue a generation; call .wait() on the returned request for the result"""
+        request = GenerationRequest(prompt_ids, **request_kwargs)
+        with self._condition:
+            self._waiting.append(request)
+            self.total_requests += 1
+            self._condition.notify()
+        return request
+
+    def shutdown(self):
+        """Stop the decode loop and fail anything still pending"""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth and batch occupancy for health reporting"""
+        with self._condition:
+            queue_depth = len(self._waiting)
+        active = len(self._active)
+        return {
+            "queue_depth": queue_depth,
+            "active_sequences": active,
+            "max_batch_size": self.max_batch_size,
+            "batch_occupancy": round(active / self.max_batch_size, 3),
+            "average_batch_occupancy": round(
+                self._occupancy_sum / (self.decode_steps * self.max_batch_size), 3
+            ) if self.decode_steps else 0.0,
+            "total_requests": self.total_requests,
+            "completed_requests": self.completed_requests,
+            "decode_steps": self.decode_steps,
+            "generated_tokens": self.generated_tokens,
+            "speculation": self.speculation.get_stats() if self.speculation else None
+        }
+
+    def _run(self):
+        """Scheduler loop: admit waiting requests, then run one decode step"""
+        while True:
+            with self._condition:
+                while self._running and not self._waiting and not self._active:
+                    self._condition.wait()
+                if not self._running:
+                    break
+                admitted = []
+                while self._waiting and len(self._active) + len(admitted) < self.max_batch_size:
+                    admitted.append(self._waiting.popleft())
+
+            for request in admitted:
+                try:
+                    self._admit(request)
+                except Exception as e:
+                    print(f"❌ Error prefilling request: {e}")
+                    request._finish(e)
+
+            if not self._active:
+                continue
+
+            try:
+                if self.drafter is not None and len(self._active) == 1 and not self._waiting:
+                    self._speculative_step()
+                else:
+                    self._decode_step()
+            except Exception as e:
+                print(f"❌ Error in batched decode step: {e}")
+                for request in self._active:
+                    request._finish(e)
+                self._active = []
+                self._batch_cache = None
+                self._attention_mask = None
+
+        shutdown_error = RuntimeError("Generation scheduler shut down")
+        for request in list(self._active) + list(self._waiting):
+            request._finish(shutdown_error)
+
+    def _sample(self, request: GenerationRequest, logits: torch.Tensor) -> int:
+        """Pick the next token for one sequence from its last-position logits (1, vocab)"""
+        input_ids = torch.tensor([request.token_ids], device=logits.device)
+        scores = request.logits_processors(logits.device)(input_ids, logits.float())
+        if request.do_sample:
+            probs = F.softmax(scores, dim=-1)
+            return int(torch.multinomial(probs, num_samples=1)[0, 0])
+        return int(scores.argmax(dim=-1)[0])
+
+    def _accept_token(self, request: GenerationRequest, token_id: int) -> bool:
+        """Record a sampled token; returns True if the sequence is finished"""
+        request.token_ids.append(token_id)
+        request.generated_count += 1
+        self.generated_tokens += 1
+        if request.first_token_at is None:
+            request.first_token_at = time.time()
+        if request.streamer is not None:
+            request.streamer.put(torch.tensor([token_id]))
+
+        return token_id == request.eos_token_id or request.generated_count >= request.max_new_tokens
+
+    def _admit(self, request: GenerationRequest):
+        """Prefill a new request on its own and merge it into the running batch"""
+        if request.streamer is not None:
+            request.streamer.put(request.prompt_ids.unsqueeze(0))
+
+        cache = request.cache if request.cache is not None else DynamicCache()
+        cached_length = cache.get_seq_length()
+        new_ids = request.prompt_ids[cached_length:].unsqueeze(0).to(self.device)
+
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=new_ids,
+                attention_mask=torch.ones(1, request.prompt_ids.shape[0], dtype=torch.long, device=self.device),
+                past_key_values=cache,
+                use_cache=True
+            )
+
+        request.cache = None
+        finished = self._accept_token(request, self._sample(request, outputs.logits[:, -1, :]))
+        if finished:
+            request.cache = outputs.past_key_values
+            self._complete(request)
+            return
+
+        self._merge_into_batch(request, outputs.past_key_values)
+
+    def _merge_into_batch(self, request: GenerationRequest, cache: DynamicCache):
+        """Left-pad the new cache and the running batch to a common length and stack them"""
+        new_layers = cache_layers(cache)
+        new_length = new_layers[0][0].shape[2]
+        new_mask = torch.ones(1, new_length, dtype=torch.long, device=self.device)
+
+        if not self._active:
+            self._batch_cache = build_cache(new_layers)
+            self._attention_mask = new_mask
+            self._active = [request]
+            return
+
+        batch_layers = cache_layers(self._batch_cache)
+        batch_length = batch_layers[0][0].shape[2]
+        target_length = max(batch_length, new_length)
+
+        merged_layers = []
+        for (batch_k, batch_v), (new_k, new_v) in zip(batch_layers, new_layers):
+            merged_layers.append((
+                torch.cat([_left_pad(batch_k, target_length), _left_pad(new_k.to(batch_k.device), target_length)], dim=0),
+                torch.cat([_left_pad(batch_v, target_length), _left_pad(new_v.to(batch_v.device), target_length)], dim=0)
+            ))
+
+        self._attention_mask = torch.cat([
+            F.pad(self._attention_mask, (target_length - batch_length, 0)),
+            F.pad(new_mask, (target_length - new_length, 0))
+        ], dim=0)
+        self._batch_cache = build_cache(merged_layers)
+        self._active.append(request)
+
+    def _decode_step(self):
+        """Feed the last token of every active sequence through one batched forward pass"""
+        batch_size = len(self._active)
+        input_ids = torch.tensor(
+            [[request.token_ids[-1]] for request in self._active],
+            device=self.device
+        )
+        position_ids = self._attention_mask.sum(dim=1, keepdim=True)
+        self._attention_mask = F.pad(self._attention_mask, (0, 1), value=1)
+
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=input_ids,
+                attention_mask=self._attention_mask,
+                position_ids=position_ids,
+                past_key_values=self._batch_cache,
+                use_cache=True
+            )
+        self._batch_cache = outputs.past_key_values
+
+        self.decode_steps += 1
+        self._occupancy_sum += batch_size
+
+        finished_rows = []
+        for row, request in enumerate(self._active):
+            if self._accept_token(request, self._sample(request, outputs.logits[row:row + 1, -1, :])):
+                finished_rows.append(row)
+
+        if finished_rows:
+            self._remove_rows(finished_rows)
+
+    def _speculative_step(self):
+        """Verify drafted tokens for the only active sequence in one forward pass"""
+        request = self._active[0]
+        remaining = request.max_new_tokens - request.generated_count
+        draft = self.drafter.propose(request.token_ids, min(self.draft_tokens, remaining - 1)) if remaining > 1 else []
+        if not draft:
+            self._decode_step()
+            return
+
+        cached_length = self._attention_mask.shape[1]
+        fed = torch.tensor([[request.token_ids[-1]] + draft], device=self.device)
+        position_ids = self._attention_mask.sum(dim=1, keepdim=True) + torch.arange(fed.shape[1], device=self.device)
+        self._attention_mask = F.pad(self._attention_mask, (0, fed.shape[1]), value=1)
+
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=fed,
+                attention_mask=self._attention_mask,
+                position_ids=position_ids,
+                past_key_values=self._batch_cache,
+                use_cache=True
+            )
+        self._batch_cache = outputs.past_key_values
+
+        self.decode_steps += 1
+        self._occupancy_sum += 1
+
+        accepted = 0
+        finished = False
+        for position in range(len(draft) + 1):
+            token_id = self._sample(request, outputs.logits[:, position, :])
+            finished = self._accept_token(request, token_id)
+            if finished or position == len(draft) or token_id != draft[position]:
+                break
+            accepted += 1
+        self.speculation.record(len(draft), accepted)
+
+        # Drop cache entries of rejected drafts; the cache covers all but the last token
+        rejected = len(draft) - accepted
+        if rejected:
+            self._batch_cache.crop(-rejected)
+            self._attention_mask = self._attention_mask[:, :cached_length + 1 + accepted]
+
+        if finished:
+            self._remove_rows([0])
+
+    def _remove_rows(self, finished_rows: List[int]):
+        """Detach finished sequences (with their own cache) and compact the batch"""
+        layers = cache_layers(self._batch_cache)
+
+        for row in finished_rows:
+            request = self._active[row]
+            real_length = int(self._attention_mask[row].sum())
+            request.cache = build_cache([
+                (k[row:row + 1, :, -real_length:].clone(), v[row:row + 1, :, -real_length:].clone())
+                for k, v in layers
+            ])
+            self._complete(request)
+
+        keep_rows = [row for row in range(len(self._active)) if row not in finished_rows]
+        self._active = [self._active[row] for row in keep_rows]
+        if not self._active:
+            self._batch_cache = None
+            self._attention_mask = None
+            return
+
+        mask = self._attention_mask[keep_rows]
+        # Drop padding columns no remaining sequence needs
+        first_used = int((mask.sum(dim=0) > 0).nonzero()[0])
+        self._attention_mask = mask[:, first_used:]
+
+        kept_layers = []
+        for k, v in layers:
+            index = torch.tensor(keep_rows, device=k.device)
+            kept_layers.append((
+                k.index_select(0, index)[:, :, first_used:],
+                v.index_select(0, index)[:, :, first_used:]
+            ))
+        self._batch_cache = build_cache(kept_layers)
+
+    def _complete(self, request: GenerationRequest):
+        self.completed_requests += 1
+        request._finish()
+
+
+def _left_pad(tensor: torch.Tensor, target_length: int) -> torch.Tensor:
+    """Zero-pad a (batch, heads, seq, dim) cache tensor on the left of the sequence axis"""
+    missing = target_length - tensor.shape[2]
+    if missing <= 0:
+        return tensor
+    return F.pad(tensor, (0, 0, missing, 0))
@@ -0,0 +1,172 @@
+"""
+Speculative decoding for the conversation model
+Drafters propose several tokens at once which the main model verifies in a
+single forward pass; used by the generation scheduler when it runs one sequence
+"""
+
+import threading
+from typing import Optional, Dict, Any, List
+
+import numpy as np
+import torch
+from numpy.lib.stride_tricks import sliding_window_view
+from transformers import DynamicCache
+
+
+class PromptLookupDrafter:
+    """
+    Drafts by copying from the sequence itself.
+
+    The last few tokens are matched against earlier positions (longest
+    n-gram first, most recent occurrence preferred) and the tokens that
+    followed the match are proposed. Companion replies often repeat names,
+    relations and phrases from the profile and history, which makes these
+    drafts cheap and frequently right.
+    """
+
+    name = "prompt_lookup"
+
+    def __init__(self, max_ngram: int = 3):
+        self.max_ngram = max_ngram
+
+    def propose(self, token_ids: List[int], max_tokens: int) -> List[int]:
+        """Up to max_tokens draft tokens continuing token_ids"""
+        ids = np.asarray(token_ids)
+        for ngram in range(min(self.max_ngram, len(ids) - 1), 0, -1):
+            # Windows over ids[:-1] exclude the suffix's own position
+            windows = sliding_window_view(ids[:-1], ngram)
+            matches = np.flatnonzero((windows == ids[-ngram:]).all(axis=1))
+            if len(matches):
+                start = matches[-1] + ngram
+                return ids[start:start + max_tokens].tolist()
+        return []
+
+
+class DraftModelDrafter:
+    """
+    Drafts greedily with a small model that shares the main model's tokenizer.
+
+    The draft model keeps one KV cache and rewinds it to the longest prefix
+    it shares with the sequence being drafted, so consecutive steps (and
+    conversations sharing the system prompt) only feed the new tokens.
+    """
+
+    name = "draft_model"
+
+    def __init__(self, model, device: str, eos_token_id: Optional[int] = None):
+        self.model = model
+        self.device = device
+        self.eos_token_id = eos_token_id
+
+        self._cache = DynamicCache()
+        self._cached_ids: List[int] = []
+
+    def propose(self, token_ids: List[int], max_tokens: int) -> List[int]:
+        """Up to max_tokens draft tokens continuing token_ids"""
+        # Always leave at least the last token to feed
+        shared = _common_prefix_length(self._cached_ids, token_ids[:-1])
+        stale = len(self._cached_ids) - shared
+        if stale:
+            self._cache.crop(-stale)
+            del self._cached_ids[shared:]
+
+        feed = token_ids[shared:]
+        draft = []
+        with torch.no_grad():
+            for _ in range(max_tokens):
+                outputs = self.model(
+                    input_ids=torch.tensor([feed], device=self.device),
+                    past_key_values=self._cache,
+                    use_cache=True
+                )
+                self._cache = outputs.past_key_values
+                self._cached_ids.extend(feed)
+
+                token_id = int(outputs.logits[0, -1].argmax())
+                draft.append(token_id)
+                if token_id == self.eos_token_id:
+                    break
+                feed = [token_id]
+        return draft
+
+
+class SpeculationStats:
+    """Counters describing how well drafts are accepted"""
+
+    def __init__(self, drafter_name: str, draft_tokens: int):
+        self.drafter_name = drafter_name
+        self.draft_tokens = draft_tokens
+
+        self.verification_steps = 0
+        self.proposed_tokens = 0
+        self.accepted_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, proposed: int, accepted: int):
+        """One verification pass that checked proposed drafts and kept accepted of them"""
+        with self._lock:
+            self.verification_steps += 1
+            self.proposed_tokens += proposed
+            self.accepted_tokens += accepted
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            steps = self.verification_steps
+            return {
+                "drafter": self.drafter_name,
+                "draft_tokens": self.draft_tokens,
+                "verification_steps": steps,
+                "proposed_tokens": self.proposed_tokens,
+                "accepted_tokens": self.accepted_tokens,
+                "acceptance_rate": round(self.accepted_tokens / self.proposed_tokens, 3) if self.proposed_tokens else 0.0,
+                # Every verification pass also yields one token sampled by the main model
+                "tokens_per_step": round((self.accepted_tokens + steps) / steps, 3) if steps else 0.0
+            }
+
+
+def unmeasured_speculation_stats(drafter_name: str, draft_tokens: int, reason: str) -> Dict[str, Any]:
+    """Speculation stats for decoding paths that do not expose per-step acceptance"""
+    return {
+        "drafter": drafter_name,
+        "draft_tokens": draft_tokens,
+        "acceptance": None,
+        "acceptance_unavailable": reason
+    }
+
+
+def create_drafter(mode: str, device: str, draft_model_path: Optional[str] = None,
+                   max_ngram: int = 3, eos_token_id: Optional[int] = None, vocab_size: Optional[int] = None):
+    """Build the drafter for CONVERSATION_SPECULATIVE_MODE (None when speculation is off)"""
+    if mode == "off":
+        return None
+    if mode == "prompt_lookup":
+        return PromptLookupDrafter(max_ngram=max_ngram)
+    if mode == "draft_model":
+        if not draft_model_path:
+            raise ValueError("CONVERSATION_DRAFT_MODEL must be set for draft_model speculation")
+
+        from transformers import AutoModelForCausalLM
+
+        draft_model = AutoModelForCausalLM.from_pretrained(
+            draft_model_path,
+            torch_dtype=torch.float16 if device == "cuda" else torch.float32,
+            low_cpu_mem_usage=True
+        ).to(device)
+        draft_model.eval()
+
+        draft_vocab_size = draft_model.config.get_text_config().vocab_size
+        if vocab_size is not None and draft_vocab_size != vocab_size:
+            raise ValueError(
+                f"Draft model vocabulary ({draft_vocab_size}) does not match the main model ({vocab_size})"
+            )
+        return DraftModelDrafter(draft_model, device=device, eos_token_id=eos_token_id)
+
+    raise ValueError(f"Unknown speculative decoding mode: {mode}")
+
+
+def _common_prefix_length(a: List[int], b: List[int]) -> int:
+    length = min(len(a), len(b))
+    if length == 0:
+        return 0
+    mismatches = np.flatnonzero(np.asarray(a[:length]) != np.asarray(b[:length]))
+    return int(mismatches[0]) if len(mismatches) else length
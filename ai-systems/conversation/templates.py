@@ -0,0 +1,66 @@
+"""
+Fixed conversation templates for the Alzheimer's companion
+Kept free of model imports so other services (e.g. TTS phrase pre-warming)
+can read the phrases the companion speaks
+"""
+
+from typing import List, Optional
+
+
+SYSTEM_PROMPT = """You are a caring, patient, and empathetic AI companion specifically designed to help people with Alzheimer's disease and dementia. Your role is to:
+
+1. Provide emotional support and companionship
+2. Help with memory recall through gentle prompting
+3. Maintain a calm, reassuring presence
+4. Speak slowly and clearly
+5. Repeat information when needed
+6. Validate feelings and experiences
+7. Redirect gently when conversations become confused
+8. Use simple, familiar language
+9. Reference personal memories and family when appropriate
+10. Always be kind, patient, and understanding
+
+Respond in the same language the user speaks (English or Hindi). Keep responses warm, short, and easy to understand. Focus on being a comforting presence."""
+
+MEMORY_PROMPTS = [
+    "Tell me about a happy memory from your childhood.",
+    "What was your wedding day like?",
+    "Can you describe your favorite family tradition?",
+    "What did you enjoy doing with your children when they were young?",
+    "What was your favorite job or work experience?",
+    "Do you remember your favorite song from when you were young?",
+    "Tell me about your parents - what were they like?",
+    "What's a funny story from your past that always makes you smile?"
+]
+
+COMFORT_RESPONSES = [
+    "I'm here with you, and you're safe.",
+    "It's okay to feel confused sometimes. We'll figure it out together.",
+    "You're doing great. Take your time.",
+    "I understand this might be difficult. You're not alone.",
+    "Let's talk about something that makes you happy.",
+    "Your feelings are completely valid.",
+    "I'm here to listen to you.",
+    "We can take this conversation at your own pace."
+]
+
+GREETING_TEMPLATES = [
+    "Hello {name}! I'm so happy to see you today. How are you feeling?",
+    "Good day, {name}! I hope you're having a wonderful day. What would you like to talk about?",
+    "Hi there, {name}! It's lovely to spend time with you. How has your day been?"
+]
+
+DEFAULT_PATIENT_NAME = "friend"
+
+
+def greeting_options(patient_name: str) -> List[str]:
+    """Personalized greetings start_conversation chooses from"""
+    return [template.format(name=patient_name) for template in GREETING_TEMPLATES]
+
+
+def companion_phrases(patient_names: Optional[List[str]] = None) -> List[str]:
+    """Every fixed phrase the companion speaks, with greetings for the given patient names"""
+    phrases = list(MEMORY_PROMPTS) + list(COMFORT_RESPONSES)
+    for name in [DEFAULT_PATIENT_NAME, *(patient_names or [])]:
+        phrases.extend(greeting_options(name))
+    return list(dict.fromkeys(phrases))
@@ -0,0 +1,144 @@
+"""
+Tests for the continuous-batching generation scheduler
+Runs on CPU with a tiny randomly initialized Llama (pytest or python test_scheduler.py)
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM
+
+# Add parent directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+from conversation.scheduler import ContinuousBatchScheduler, GenerationRequest
+
+VOCAB_SIZE = 96
+PROMPTS = [
+    [5, 17, 42, 8, 61, 23],
+    [9, 33, 71, 2, 14, 55, 80, 3, 27, 49, 66],
+    [12, 4]
+]
+MAX_NEW_TOKENS = 12
+
+
+def make_model():
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=VOCAB_SIZE,
+        hidden_size=64,
+        intermediate_size=128,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=256
+    )
+    return LlamaForCausalLM(config).eval()
+
+
+def reference_outputs(model):
+    """Greedy model.generate output for every prompt"""
+    outputs = []
+    for prompt in PROMPTS:
+        with torch.no_grad():
+            output = model.generate(
+                torch.tensor([prompt]),
+                max_new_tokens=MAX_NEW_TOKENS,
+                do_sample=False,
+                pad_token_id=0,
+                eos_token_id=None
+            )
+        outputs.append(output[0].tolist())
+    return outputs
+
+
+def test_staggered_requests_match_generate():
+    """Requests joining a running batch at different times decode exactly like model.generate"""
+    model = make_model()
+    expected = reference_outputs(model)
+
+    scheduler = ContinuousBatchScheduler(model, device="cpu", max_batch_size=2)
+    results = [None] * len(PROMPTS)
+
+    def run(index):
+        time.sleep(0.02 * index)
+        request = scheduler.submit(
+            torch.tensor(PROMPTS[index]),
+            max_new_tokens=MAX_NEW_TOKENS,
+            do_sample=False,
+            eos_token_id=None
+        )
+        output, cache = request.wait()
+        results[index] = (output[0].tolist(), cache.get_seq_length())
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(len(PROMPTS))]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=60)
+
+        for index, (output, cache_length) in enumerate(results):
+            assert output == expected[index]
+            # The returned cache covers everything but the last sampled token
+            assert cache_length == len(expected[index]) - 1
+
+        stats = scheduler.get_stats()
+        assert stats["queue_depth"] == 0
+        assert stats["active_sequences"] == 0
+        assert stats["batch_occupancy"] == 0.0
+        assert 0.0 < stats["average_batch_occupancy"] <= 1.0
+        assert stats["total_requests"] == stats["completed_requests"] == len(PROMPTS)
+        assert stats["generated_tokens"] == len(PROMPTS) * MAX_NEW_TOKENS
+    finally:
+        scheduler.shutdown()
+
+
+def test_stats_report_queue_depth_and_occupancy():
+    """A full batch leaves later requests waiting in the queue"""
+    model = make_model()
+    scheduler = ContinuousBatchScheduler(model, device="cpu", max_batch_size=1)
+    try:
+        requests = [
+            scheduler.submit(torch.tensor(prompt), max_new_tokens=200, do_sample=False, eos_token_id=None)
+            for prompt in PROMPTS
+        ]
+
+        stats = scheduler.get_stats()
+        for _ in range(200):
+            if stats["active_sequences"] == 1:
+                break
+            time.sleep(0.01)
+            stats = scheduler.get_stats()
+
+        assert stats["active_sequences"] == 1
+        assert stats["batch_occupancy"] == 1.0
+        assert stats["queue_depth"] == len(PROMPTS) - 1
+
+        for request in requests:
+            request.wait()
+        assert scheduler.get_stats()["queue_depth"] == 0
+    finally:
+        scheduler.shutdown()
+
+
+def test_logits_processors_follow_logits_device():
+    """min_new_tokens keeps its eos ids on the device of the logits it processes"""
+    request = GenerationRequest(torch.tensor(PROMPTS[0]), min_new_tokens=5, eos_token_id=3, do_sample=False)
+    devices = [torch.device("cpu")] + ([torch.device("cuda", 0)] if torch.cuda.is_available() else [])
+
+    for device in devices:
+        logits = torch.zeros(1, VOCAB_SIZE, device=device)
+        input_ids = torch.tensor([PROMPTS[0]], device=device)
+        scores = request.logits_processors(device)(input_ids, logits)
+        assert scores.device == logits.device
+        assert torch.isinf(scores[0, 3])
+
+
+if __name__ == "__main__":
+    test_staggered_requests_match_generate()
+    test_stats_report_queue_depth_and_occupancy()
+    test_logits_processors_follow_logits_device()
+    print("✓ Scheduler tests passed")
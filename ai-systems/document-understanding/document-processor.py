@@ -14,19 +14,40 @@ import json
 import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Dict, List, Any, Union
+from typing import Optional, Dict, List, Any, Union, Callable, BinaryIO
 import base64
 import io
 import tempfile
 import os
-from http.server import HTTPServer
+from urllib.parse import urlparse, parse_qs
+import queue
 import threading
+import requests
 
 # Import shared utilities and config
 import sys
 sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent))
 from config.settings import *
 from utils.api_utils import BaseAPIHandler, get_gpu_info, optimize_for_gpu
+from utils.uploads import RequestBodyError
+from utils.server import create_api_server
+from utils.job_queue import JobQueue
+from utils.disk_cache import DiskCache, content_hash, make_cache_key
+from face_index import FaceIndex
+from face_store import FaceStore
+from frame_sampler import SceneFrameSampler
+
+
+# Questions asked about every sampled video frame
+VIDEO_FRAME_QUESTIONS = [
+    "What is happening in this scene?",
+    "Who is in this image?",
+    "What is the mood or emotion shown?"
+]
+
+# Stand-in transcription until video audio is sent to the STT system
+AUDIO_TRANSCRIPTION_PLACEHOLDER = "Audio transcription would be handled by STT system"
 
 
 class DocumentProcessor:
@@ -46,12 +67,20 @@ class DocumentProcessor:
         self.blip2_model = None
         
         # Face recognition database
-        self.known_faces = {}  # {person_name: [face_encodings]}
-        self.face_database_path = "data/face_database.json"
+        self.face_index = FaceIndex(ann_threshold=FACE_INDEX_ANN_THRESHOLD)
+        self.face_store = FaceStore(FACE_DATABASE_DIR)
+        self.legacy_face_database_path = "data/face_database.json"
         
         # Processing history
         self.processing_history = {}
         
+        # Results keyed by file content, so re-uploaded files skip inference
+        self.analysis_cache = DiskCache(ANALYSIS_CACHE_DIR, ANALYSIS_CACHE_MAX_MB * 1024**2)
+        
+        # BLIP-2 generate calls are serialized; ffmpeg and face recognition
+        # stages of other jobs keep running in parallel
+        self._model_lock = threading.Lock()
+        
         print("Initializing Document Understanding System...")
         print(f"Device: {self.device}")
         
@@ -79,7 +108,7 @@ class DocumentProcessor:
             os.environ["TRANSFORMERS_CACHE"] = os.path.join(custom_cache_dir, "transformers")
             
             # Use BLIP-2 OPT 2.7B (good balance for RTX 3050)
-            model_name = "Salesforce/blip2-opt-2.7b"
+            model_name = BLIP2_MODEL_NAME
             
             self.blip2_processor = Blip2Processor.from_pretrained(
                 model_name,
@@ -115,52 +144,44 @@ class DocumentProcessor:
             raise
     
     def _load_face_database(self):
-        """Load known faces database"""
+        """Open the binary face database memory-mapped (migrating the legacy JSON file once)"""
         try:
-            if os.path.exists(self.face_database_path):
-                with open(self.face_database_path, 'r') as f:
-                    face_data = json.load(f)
-                
-                # Convert stored encodings back to numpy arrays
-                for person_name, encodings_list in face_data.items():
-                    self.known_faces[person_name] = [
-                        np.array(encoding) for encoding in encodings_list
-                    ]
-                
-                print(f"✓ Loaded face database with {len(self.known_faces)} people")
+            if not self.face_store.exists() and os.path.exists(self.legacy_face_database_path):
+                self._migrate_legacy_face_database()
+            
+            names, encodings, labels = self.face_store.open()
+            self.face_index.load(names, encodings, labels)
+            
+            if len(self.face_index):
+                print(f"✓ Loaded face database with {len(self.face_index.counts())} people")
             else:
                 print("No existing face database found. Starting fresh.")
-                os.makedirs(os.path.dirname(self.face_database_path), exist_ok=True)
                 
         except Exception as e:
             print(f"⚠️  Error loading face database: {e}")
-            self.known_faces = {}
+            self.face_index = FaceIndex(ann_threshold=FACE_INDEX_ANN_THRESHOLD)
     
-    def _save_face_database(self):
-        """Save known faces database"""
-        try:
-            # Convert numpy arrays to lists for JSON serialization
-            face_data = {}
-            for person_name, encodings_list in self.known_faces.items():
-                face_data[person_name] = [
-                    encoding.tolist() for encoding in encodings_list
-                ]
-            
-            os.makedirs(os.path.dirname(self.face_database_path), exist_ok=True)
-            with open(self.face_database_path, 'w') as f:
-                json.dump(face_data, f)
-            
-            print("✓ Face database saved")
-            
-        except Exception as e:
-            print(f"❌ Error saving face database: {e}")
+    def _migrate_legacy_face_database(self):
+        """Copy encodings from the old JSON face database into the binary store"""
+        with open(self.legacy_face_database_path, 'r') as f:
+            face_data = json.load(f)
+        
+        names = []
+        for person_name, encodings_list in face_data.items():
+            if not encodings_list:
+                continue
+            names.append(person_name)
+            self.face_store.append(names, len(names) - 1, np.array(encodings_list, dtype=np.float32))
+        
+        print(f"✓ Migrated {len(names)} people from {self.legacy_face_database_path}")
     
     def analyze_image(
         self, 
         image_path: str,
         questions: Optional[List[str]] = None,
         detect_faces: bool = True,
-        patient_id: Optional[str] = None
+        patient_id: Optional[str] = None,
+        progress_callback: Optional[Callable[[str, float], None]] = None
     ) -> Dict[str, Any]:
         """
         Analyze image with BLIP-2 and face recognition
@@ -170,6 +191,7 @@ class DocumentProcessor:
             questions: Optional specific questions about the image
             detect_faces: Whether to detect and identify faces
             patient_id: Optional patient ID for context
+            progress_callback: Optional callback(stage, progress) for job tracking
             
         Returns:
             Analysis results
@@ -180,54 +202,37 @@ class DocumentProcessor:
             
             print(f"🖼️  Analyzing image: {image_path}")
             
-            # Load image
-            image = Image.open(image_path).convert('RGB')
+            # Look up cached descriptions and faces for this exact file
+            file_hash = content_hash(image_path)
+            description_key = self._description_cache_key(file_hash, "image", questions or [])
+            face_key = self._face_cache_key(file_hash, "image")
+            description = self.analysis_cache.get_json(description_key)
+            face_results = self.analysis_cache.get_json(face_key) if detect_faces else []
             
-            # Basic image captioning
-            print("📝 Generating image caption...")
-            inputs = self.blip2_processor(image, return_tensors="pt")
-            if self.device == "cuda":
-                inputs = {k: v.cuda() for k, v in inputs.items()}
-            
-            with torch.no_grad():
-                generated_ids = self.blip2_model.generate(**inputs, max_length=50)
-            
-            caption = self.blip2_processor.decode(
-                generated_ids[0], 
-                skip_special_tokens=True
-            ).strip()
-            
-            # Answer specific questions if provided
-            qa_results = []
-            if questions:
-                print("❓ Answering specific questions...")
-                for question in questions:
-                    inputs = self.blip2_processor(
-                        image, 
-                        question, 
-                        return_tensors="pt"
-                    )
-                    if self.device == "cuda":
-                        inputs = {k: v.cuda() for k, v in inputs.items()}
-                    
-                    with torch.no_grad():
-                        generated_ids = self.blip2_model.generate(**inputs, max_length=20)
-                    
-                    answer = self.blip2_processor.decode(
-                        generated_ids[0], 
-                        skip_special_tokens=True
-                    ).strip()
-                    
-                    qa_results.append({
-                        "question": question,
-                        "answer": answer
-                    })
+            image = None
+            if description is None or face_results is None:
+                image = Image.open(image_path).convert('RGB')
+            
+            # Caption and questions decoded together from one image encoding
+            if description is None:
+                print("📝 Generating caption and answering questions...")
+                self._report_progress(progress_callback, "captioning", 0.1)
+                description = self.describe_images([image], questions=questions)[0]
+                self.analysis_cache.put_json(description_key, description)
+            else:
+                print("✓ Using cached caption and answers")
+            caption = description["caption"]
+            qa_results = description["qa_results"]
             
             # Face detection and recognition
-            face_results = []
-            if detect_faces:
+            if face_results is None:
                 print("👥 Detecting and recognizing faces...")
-                face_results = self._analyze_faces_in_image(image_path)
+                self._report_progress(progress_callback, "recognizing_faces", 0.8)
+                face_results = self._analyze_faces_in_image(np.asarray(image))
+                if face_results is None:
+                    face_results = []
+                else:
+                    self.analysis_cache.put_json(face_key, face_results)
             
             # Create comprehensive analysis
             analysis_result = {
@@ -266,7 +271,9 @@ class DocumentProcessor:
         extract_frames_count: int = 10,
         analyze_audio: bool = True,
         detect_faces: bool = True,
-        patient_id: Optional[str] = None
+        patient_id: Optional[str] = None,
+        progress_callback: Optional[Callable[[str, float], None]] = None,
+        sampling: str = VIDEO_SAMPLING_MODE
     ) -> Dict[str, Any]:
         """
         Analyze video with FFmpeg frame extraction and BLIP-2
@@ -274,9 +281,13 @@ class DocumentProcessor:
         Args:
             video_path: Path to video file
             extract_frames_count: Number of frames to extract for analysis
+                (the frame budget when sampling by scene)
             analyze_audio: Whether to extract and transcribe audio
             detect_faces: Whether to detect faces in frames
             patient_id: Optional patient ID
+            progress_callback: Optional callback(stage, progress) for job tracking
+            sampling: "scene" for one frame per distinct scene, "uniform" for
+                evenly spaced frames
             
         Returns:
             Video analysis results
@@ -289,53 +300,118 @@ class DocumentProcessor:
             
             # Get video metadata
             video_info = self._get_video_metadata(video_path)
-            duration = video_info.get('duration', 0)
-            
-            # Extract key frames using FFmpeg
-            print("🎞️  Extracting key frames...")
-            frame_paths = self._extract_video_frames(
-                video_path, 
-                frame_count=extract_frames_count,
-                duration=duration
-            )
             
-            # Analyze each frame
-            frame_analyses = []
-            for i, frame_path in enumerate(frame_paths):
-                print(f"📸 Analyzing frame {i+1}/{len(frame_paths)}")
+            # Look up cached frame descriptions and faces for this exact file
+            file_hash = content_hash(video_path)
+            frame_settings = [
+                "video",
+                sampling,
+                extract_frames_count,
+                VIDEO_SCENE_SCAN_FPS,
+                VIDEO_SCENE_THRESHOLD,
+                VIDEO_DUPLICATE_THRESHOLD,
+                VIDEO_FRAME_MAX_SIDE
+            ]
+            description_key = self._description_cache_key(file_hash, *frame_settings, VIDEO_FRAME_QUESTIONS)
+            face_key = self._face_cache_key(file_hash, *frame_settings)
+            described = self.analysis_cache.get_json(description_key)
+            frame_faces = self.analysis_cache.get_json(face_key) if detect_faces else None
+            
+            # Decode key frames in a single FFmpeg pass (only if something must be recomputed)
+            frames = []
+            if described is None or (detect_faces and frame_faces is None):
+                print("🎞️  Extracting key frames...")
+                self._report_progress(progress_callback, "extracting_frames", 0.05)
+                if sampling == "scene":
+                    frames, sampling_stats = self._sample_scene_frames(
+                        video_path,
+                        budget=extract_frames_count,
+                        video_info=video_info
+                    )
+                else:
+                    frames = self._extract_video_frames(
+                        video_path, 
+                        frame_count=extract_frames_count,
+                        video_info=video_info
+                    )
+                    sampling_stats = {"frames_selected": len(frames)}
+                sampling_stats["mode"] = sampling
                 
-                frame_analysis = self.analyze_image(
-                    frame_path,
-                    questions=[
-                        "What is happening in this scene?",
-                        "Who is in this image?",
-                        "What is the mood or emotion shown?"
-                    ],
-                    detect_faces=detect_faces,
-                    patient_id=patient_id
+                # Never cache an empty decode as a valid result; fail the job instead
+                if not frames:
+                    raise RuntimeError(f"No frames could be decoded from {video_path}")
+            
+            # Caption and question all frames with batched BLIP-2 calls
+            if described is None:
+                print(f"📸 Describing {len(frames)} frames in batches...")
+                self._report_progress(progress_callback, "describing_frames", 0.1)
+                descriptions = self.describe_images(
+                    [Image.fromarray(frame) for _, frame in frames],
+                    questions=VIDEO_FRAME_QUESTIONS
                 )
+                described = {
+                    "frame_sampling": sampling_stats,
+                    "frames": [
+                        dict(description, timestamp=timestamp, size=(frame.shape[1], frame.shape[0]))
+                        for (timestamp, frame), description in zip(frames, descriptions)
+                    ]
+                }
+                self.analysis_cache.put_json(description_key, described)
+            else:
+                print("✓ Using cached frame descriptions")
+            sampling_stats = described["frame_sampling"]
+            
+            # Faces per frame, recomputed only when the face registry changed
+            if detect_faces and frame_faces is None:
+                frame_faces = []
+                for i, (_, frame) in enumerate(frames):
+                    print(f"👥 Recognizing faces in frame {i+1}/{len(frames)}")
+                    self._report_progress(progress_callback, "recognizing_faces", 0.5 + 0.35 * i / len(frames))
+                    frame_faces.append(self._analyze_faces_in_image(frame))
+                # A failed frame is reported without faces but keeps the set out of the cache
+                if None in frame_faces:
+                    frame_faces = [faces or [] for faces in frame_faces]
+                else:
+                    self.analysis_cache.put_json(face_key, frame_faces)
+            
+            # Insights per frame
+            frame_analyses = []
+            for i, description in enumerate(described["frames"]):
+                face_results = frame_faces[i] if detect_faces and i < len(frame_faces) else []
                 
                 frame_analyses.append({
                     "frame_number": i + 1,
-                    "timestamp": (duration / extract_frames_count) * i,
-                    "analysis": frame_analysis["result"]
+                    "timestamp": description["timestamp"],
+                    "analysis": {
+                        "caption": description["caption"],
+                        "qa_results": description["qa_results"],
+                        "face_results": face_results,
+                        "image_metadata": {
+                            "format": "rawvideo",
+                            "size": description["size"],
+                            "mode": "RGB"
+                        },
+                        "alzheimer_insights": self._generate_alzheimer_insights(
+                            description["caption"], description["qa_results"], face_results
+                        )
+                    }
                 })
-                
-                # Clean up temporary frame
-                os.unlink(frame_path)
             
             # Extract and analyze audio if requested
             audio_analysis = None
             if analyze_audio:
                 print("🎵 Extracting and analyzing audio...")
+                self._report_progress(progress_callback, "extracting_audio", 0.85)
                 audio_analysis = self._extract_and_analyze_audio(video_path)
             
             # Create video summary
+            self._report_progress(progress_callback, "summarizing", 0.95)
             video_summary = self._create_video_summary(frame_analyses, audio_analysis)
             
             # Create comprehensive analysis
             analysis_result = {
                 "video_metadata": video_info,
+                "frame_sampling": sampling_stats,
                 "frame_analyses": frame_analyses,
                 "audio_analysis": audio_analysis,
                 "video_summary": video_summary,
@@ -364,11 +440,165 @@ class DocumentProcessor:
             print(f"❌ Error analyzing video: {e}")
             raise
     
-    def _analyze_faces_in_image(self, image_path: str) -> List[Dict[str, Any]]:
-        """Detect and recognize faces in image"""
+    def describe_images(
+        self, 
+        images: List[Image.Image],
+        questions: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Caption and question several images with batched BLIP-2 inference
+        
+        Every image goes through the vision encoder and Q-Former once. The
+        resulting query embeddings are reused for the caption prompt and for
+        each question, and all (image, prompt) pairs are decoded by the
+        language model as left-padded batches.
+        
+        Args:
+            images: RGB images (e.g. a photo or the frames of a video)
+            questions: Optional questions asked about every image
+            
+        Returns:
+            One {"caption", "qa_results"} dict per image
+        """
+        # e.g. a video whose frames could not be decoded
+        if not images:
+            return []
+        
+        questions = questions or []
+        prompts = [""] + list(questions)
+        
+        image_features = self._encode_images(images)
+        
+        rows = [(image_idx, prompt) for image_idx in range(len(images)) for prompt in prompts]
+        texts = []
+        for start in range(0, len(rows), BLIP2_DECODE_BATCH_SIZE):
+            texts.extend(self._decode_prompts(image_features, rows[start:start + BLIP2_DECODE_BATCH_SIZE]))
+        
+        descriptions = []
+        for image_idx in range(len(images)):
+            image_texts = texts[image_idx * len(prompts):(image_idx + 1) * len(prompts)]
+            descriptions.append({
+                "caption": image_texts[0],
+                "qa_results": [
+                    {"question": question, "answer": answer}
+                    for question, answer in zip(questions, image_texts[1:])
+                ]
+            })
+        
+        return descriptions
+    
+    def _encode_images(self, images: List[Image.Image]) -> torch.Tensor:
+        """Run images through the vision encoder, Q-Former and projection once"""
+        features = []
+        model = self.blip2_model
+        
+        for start in range(0, len(images), BLIP2_VISION_BATCH_SIZE):
+            pixel_values = self.blip2_processor.image_processor(
+                images[start:start + BLIP2_VISION_BATCH_SIZE],
+                return_tensors="pt"
+            )["pixel_values"]
+            pixel_values = pixel_values.to(model.vision_model.device, dtype=model.vision_model.dtype)
+            
+            with self._model_lock, torch.no_grad():
+                image_embeds = model.vision_model(pixel_values, return_dict=True).last_hidden_state
+                image_attention_mask = torch.ones(image_embeds.shape[:-1], dtype=torch.long, device=image_embeds.device)
+                query_tokens = model.query_tokens.expand(image_embeds.shape[0], -1, -1)
+                query_output = model.qformer(
+                    query_embeds=query_tokens,
+                    encoder_hidden_states=image_embeds,
+                    encoder_attention_mask=image_attention_mask,
+                    return_dict=True
+                ).last_hidden_state
+                
+                # Qformer is kept in fp32, downcast back if needed
+                if query_output.dtype != image_embeds.dtype:
+                    query_output = query_output.to(image_embeds.dtype)
+                
+                features.append(model.language_projection(query_output))
+        
+        return torch.cat(features, dim=0)
+    
+    def _decode_prompts(self, image_features: torch.Tensor, rows: List[tuple]) -> List[str]:
+        """Decode a batch of (image index, prompt) rows; each row is [pad..., image queries, prompt tokens]"""
+        tokenizer = self.blip2_processor.tokenizer
+        embedding_layer = self.blip2_model.get_input_embeddings()
+        embed_device = embedding_layer.weight.device
+        
+        prompt_ids = [tokenizer(prompt, add_special_tokens=True)["input_ids"] for _, prompt in rows]
+        num_queries = image_features.shape[1]
+        max_length = num_queries + max(len(ids) for ids in prompt_ids)
+        pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        
+        batch_embeds = []
+        attention_mask = torch.zeros(len(rows), max_length, dtype=torch.long, device=embed_device)
+        
+        with torch.no_grad():
+            for row_idx, ((image_idx, _), ids) in enumerate(zip(rows, prompt_ids)):
+                padding = max_length - num_queries - len(ids)
+                token_ids = torch.tensor([pad_token_id] * padding + ids, dtype=torch.long, device=embed_device)
+                token_embeds = embedding_layer(token_ids)
+                query_embeds = image_features[image_idx].to(embed_device, token_embeds.dtype)
+                
+                batch_embeds.append(torch.cat([
+                    token_embeds[:padding],
+                    query_embeds,
+                    token_embeds[padding:]
+                ], dim=0))
+                attention_mask[row_idx, padding:] = 1
+            
+            inputs_embeds = torch.stack(batch_embeds, dim=0)
+            
+            with self._model_lock:
+                generated_ids = self.blip2_model.language_model.generate(
+                    inputs_embeds=inputs_embeds,
+                    attention_mask=attention_mask,
+                    max_new_tokens=BLIP2_MAX_NEW_TOKENS
+                )
+        
+        return [
+            text.strip()
+            for text in tokenizer.batch_decode(generated_ids, skip_special_tokens=True)
+        ]
+    
+    def _description_cache_key(self, file_hash: str, *settings) -> str:
+        """Cache key for captions/answers: file content, model and the prompts asked"""
+        return make_cache_key(
+            "description",
+            ANALYSIS_CACHE_VERSION,
+            BLIP2_MODEL_NAME,
+            BLIP2_MAX_NEW_TOKENS,
+            file_hash,
+            settings
+        )
+    
+    def _face_cache_key(self, file_hash: str, *settings) -> str:
+        """
+        Cache key for face results: file content, frame selection and the face registry
+        
+        The face store is append-only, so its size identifies the registry
+        version; adding a face only invalidates this portion of the cache.
+        """
+        return make_cache_key(
+            "faces",
+            ANALYSIS_CACHE_VERSION,
+            file_hash,
+            settings,
+            len(self.face_index),
+            FACE_MATCH_TOLERANCE,
+            FACE_MATCH_TOP_K
+        )
+    
+    def _report_progress(self, progress_callback: Optional[Callable[[str, float], None]], stage: str, progress: float):
+        """Forward stage/progress to a job tracker if one is attached"""
+        if progress_callback:
+            progress_callback(stage, progress)
+    
+    def _analyze_faces_in_image(self, image: Union[str, np.ndarray]) -> Optional[List[Dict[str, Any]]]:
+        """Detect and recognize faces in an image path or an RGB uint8 array (None if recognition failed)"""
         try:
-            # Load image for face recognition
-            image = face_recognition.load_image_from_file(image_path)
+            # Load image for face recognition unless it is already decoded
+            if isinstance(image, str):
+                image = face_recognition.load_image_file(image)
             
             # Find face locations and encodings
             face_locations = face_recognition.face_locations(image)
@@ -376,23 +606,16 @@ class DocumentProcessor:
             
             face_results = []
             
-            for i, (face_location, face_encoding) in enumerate(zip(face_locations, face_encodings)):
-                # Try to match with known faces
-                name = "Unknown"
-                confidence = 0.0
-                
-                for person_name, known_encodings in self.known_faces.items():
-                    # Compare with all known encodings for this person
-                    matches = face_recognition.compare_faces(known_encodings, face_encoding)
-                    face_distances = face_recognition.face_distance(known_encodings, face_encoding)
-                    
-                    if any(matches):
-                        # Use the best match
-                        best_match_index = np.argmin(face_distances)
-                        if matches[best_match_index]:
-                            name = person_name
-                            confidence = 1.0 - face_distances[best_match_index]
-                            break
+            # Match every detected face against every known encoding at once
+            matches = self.face_index.match(
+                np.array(face_encodings, dtype=np.float32),
+                tolerance=FACE_MATCH_TOLERANCE,
+                top_k=FACE_MATCH_TOP_K
+            )
+            
+            for i, (face_location, match) in enumerate(zip(face_locations, matches)):
+                name = match["name"]
+                confidence = 1.0 - match["distance"] if name != "Unknown" else 0.0
                 
                 # Face location (top, right, bottom, left)
                 top, right, bottom, left = face_location
@@ -401,6 +624,10 @@ class DocumentProcessor:
                     "face_id": i + 1,
                     "name": name,
                     "confidence": round(confidence, 3),
+                    "candidates": [
+                        {"name": c["name"], "confidence": round(1.0 - c["distance"], 3)}
+                        for c in match["candidates"]
+                    ],
                     "location": {
                         "top": top,
                         "right": right,
@@ -414,15 +641,15 @@ class DocumentProcessor:
             
         except Exception as e:
             print(f"Error in face recognition: {e}")
-            return []
+            return None
     
-    def add_known_face(self, image_path: str, person_name: str) -> Dict[str, Any]:
-        """Add a new face to the known faces database"""
+    def add_known_face(self, image_path: Union[str, BinaryIO], person_name: str) -> Dict[str, Any]:
+        """Add a new face to the known faces database (from a path or an open image file)"""
         try:
             print(f"👤 Adding face for {person_name}")
             
             # Load image and extract face encoding
-            image = face_recognition.load_image_from_file(image_path)
+            image = face_recognition.load_image_file(image_path)
             face_encodings = face_recognition.face_encodings(image)
             
             if not face_encodings:
@@ -436,20 +663,15 @@ class DocumentProcessor:
             
             face_encoding = face_encodings[0]
             
-            # Add to known faces
-            if person_name not in self.known_faces:
-                self.known_faces[person_name] = []
-            
-            self.known_faces[person_name].append(face_encoding)
-            
-            # Save database
-            self._save_face_database()
+            # Add to the face index and append it to the database
+            label = self.face_index.add(person_name, face_encoding)
+            self.face_store.append(list(self.face_index.names), label, face_encoding)
             
             print(f"✓ Added face for {person_name}")
             return {
                 "success": True,
                 "message": f"Face added for {person_name}",
-                "total_faces": len(self.known_faces[person_name])
+                "total_faces": self.face_index.counts().get(person_name, 0)
             }
             
         except Exception as e:
@@ -459,38 +681,111 @@ class DocumentProcessor:
                 "error": str(e)
             }
     
-    def _extract_video_frames(self, video_path: str, frame_count: int, duration: float) -> List[str]:
-        """Extract frames from video using FFmpeg"""
-        try:
-            frame_paths = []
-            
-            # Create temporary directory for frames
-            temp_dir = tempfile.mkdtemp()
-            
-            # Calculate frame extraction interval
-            interval = max(1, duration / frame_count)
-            
-            for i in range(frame_count):
-                timestamp = i * interval
-                frame_path = os.path.join(temp_dir, f"frame_{i:03d}.jpg")
-                
-                # Extract frame at specific timestamp
-                (
-                    ffmpeg
-                    .input(video_path, ss=timestamp)
-                    .output(frame_path, vframes=1, format='image2', vcodec='mjpeg')
-                    .overwrite_output()
-                    .run(quiet=True)
-                )
-                
-                if os.path.exists(frame_path):
-                    frame_paths.append(frame_path)
-            
-            return frame_paths
-            
-        except Exception as e:
-            print(f"Error extracting video frames: {e}")
+    def _extract_video_frames(
+        self, 
+        video_path: str, 
+        frame_count: int, 
+        video_info: Dict[str, Any]
+    ) -> List[tuple]:
+        """
+        Decode evenly spaced frames with a single FFmpeg process
+        
+        Returns:
+            List of (timestamp, RGB uint8 array of shape (height, width, 3))
+        """
+        if frame_count <= 0:
             return []
+        
+        duration = video_info.get('duration', 0)
+        if duration <= 0:
+            raise ValueError(f"Could not determine the duration of {video_path}")
+        
+        fps = frame_count / duration
+        frames = []
+        for i, frame in enumerate(self._iter_video_frames(video_path, video_info, fps=fps)):
+            frames.append((i / fps, frame))
+            if len(frames) == frame_count:
+                break
+        
+        return frames
+    
+    def _sample_scene_frames(
+        self, 
+        video_path: str, 
+        budget: int, 
+        video_info: Dict[str, Any]
+    ) -> tuple:
+        """
+        Pick up to `budget` frames at scene boundaries, skipping near-duplicates
+        
+        The video is scanned once at VIDEO_SCENE_SCAN_FPS and every frame gets a
+        cheap colour-histogram signature; no model runs until the scan is done.
+        
+        Returns:
+            (list of (timestamp, RGB array), sampling statistics)
+        """
+        sampler = SceneFrameSampler(
+            budget,
+            scene_threshold=VIDEO_SCENE_THRESHOLD,
+            duplicate_threshold=VIDEO_DUPLICATE_THRESHOLD
+        )
+        frames = self._iter_video_frames(video_path, video_info, fps=VIDEO_SCENE_SCAN_FPS)
+        for i, frame in enumerate(frames):
+            sampler.add(i / VIDEO_SCENE_SCAN_FPS, frame)
+        
+        return sampler.select(), sampler.get_stats()
+    
+    def _iter_video_frames(self, video_path: str, video_info: Dict[str, Any], fps: Optional[float] = None):
+        """
+        Stream raw RGB frames from FFmpeg's stdout straight into numpy arrays
+        
+        Frames are optionally resampled to `fps` and scaled down so their
+        longest side is at most VIDEO_FRAME_MAX_SIDE. Nothing touches disk.
+        Raises RuntimeError if FFmpeg exits with an error before the end of
+        the stream.
+        """
+        width, height = self._output_frame_size(video_info)
+        
+        stream = ffmpeg.input(video_path)
+        if fps:
+            stream = stream.filter('fps', fps=fps)
+        stream = stream.filter('scale', width, height)
+        
+        process = (
+            stream
+            .output('pipe:', format='rawvideo', pix_fmt='rgb24')
+            .run_async(pipe_stdout=True, quiet=True)
+        )
+        
+        end_of_stream = False
+        try:
+            while True:
+                frame = np.empty((height, width, 3), dtype=np.uint8)
+                if process.stdout.readinto(memoryview(frame).cast('B')) != frame.nbytes:
+                    end_of_stream = True
+                    break
+                yield frame
+        finally:
+            process.stdout.close()
+            # Stop FFmpeg only when the consumer stopped early; otherwise let it exit
+            if not end_of_stream and process.poll() is None:
+                process.kill()
+            process.wait()
+        
+        if process.returncode != 0:
+            raise RuntimeError(f"FFmpeg failed decoding {video_path} (exit code {process.returncode})")
+    
+    def _output_frame_size(self, video_info: Dict[str, Any]) -> tuple:
+        """Display size of decoded frames (after rotation), capped at VIDEO_FRAME_MAX_SIDE"""
+        if not video_info.get('width') or not video_info.get('height'):
+            raise ValueError("Video dimensions are unknown (metadata probe failed)")
+        width, height = video_info['width'], video_info['height']
+        if video_info.get('rotation', 0) % 180 == 90:
+            width, height = height, width
+        
+        scale = min(1.0, VIDEO_FRAME_MAX_SIDE / max(width, height))
+        # Even dimensions keep every pixel format and scaler happy
+        return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
     
     def _extract_and_analyze_audio(self, video_path: str) -> Optional[Dict[str, Any]]:
         """Extract audio from video and analyze"""
@@ -513,7 +808,7 @@ class DocumentProcessor:
             audio_info = {
                 "has_audio": True,
                 "audio_file": temp_audio.name,
-                "transcription": "Audio transcription would be handled by STT system"
+                "transcription": AUDIO_TRANSCRIPTION_PLACEHOLDER
             }
             
             # Clean up
@@ -546,12 +841,16 @@ class DocumentProcessor:
             
             if video_stream:
                 duration = float(probe['format']['duration'])
+                rotation = int(video_stream.get('tags', {}).get('rotate', 0))
+                for side_data in video_stream.get('side_data_list', []):
+                    rotation = int(side_data.get('rotation', rotation))
                 return {
                     "duration": duration,
                     "width": video_stream['width'],
                     "height": video_stream['height'],
                     "fps": eval(video_stream['r_frame_rate']),
                     "codec": video_stream['codec_name'],
+                    "rotation": abs(rotation),
                     "file_size": int(probe['format']['size'])
                 }
         except:
@@ -640,11 +939,75 @@ class DocumentProcessor:
     
     def get_known_faces(self) -> Dict[str, int]:
         """Get list of known faces and their counts"""
+        return self.face_index.counts()
+    
+    def get_memory_summary(self, analysis_record: Dict[str, Any]) -> Dict[str, Any]:
+        """Condense an analysis record into the fields stored with a reconstructed memory"""
+        result = analysis_record["result"]
+        
+        if analysis_record["file_type"] == "video":
+            frames = [frame["analysis"] for frame in result.get("frame_analyses", [])]
+            ai_summary = result.get("video_summary", "")
+        else:
+            frames = [result]
+            ai_summary = result.get("caption", "")
+        
+        people = sorted({
+            face["name"]
+            for frame in frames
+            for face in frame.get("face_results", [])
+            if face.get("is_known")
+        })
+        memory_triggers = sorted({
+            trigger
+            for frame in frames
+            for trigger in frame.get("alzheimer_insights", {}).get("memory_triggers", [])
+        })
+        emotions = sorted({
+            emotion
+            for frame in frames
+            for emotion in frame.get("alzheimer_insights", {}).get("emotional_context", [])
+        })
+        
         return {
-            name: len(encodings) 
-            for name, encodings in self.known_faces.items()
+            "analysis_id": analysis_record["analysis_id"],
+            "ai_summary": ai_summary,
+            "entities": {
+                "people": people,
+                "memory_triggers": memory_triggers,
+                "emotions": emotions
+            }
         }
     
+    def get_memory_entries(self, analysis_record: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Texts from an analysis record for the conversation memory index"""
+        result = analysis_record["result"]
+        timestamp = analysis_record["timestamp"]
+        
+        if analysis_record["file_type"] == "video":
+            frames = [(frame["analysis"], frame["timestamp"]) for frame in result.get("frame_analyses", [])]
+        else:
+            frames = [(result, None)]
+        
+        entries = []
+        for frame, frame_time in frames:
+            people = sorted({face["name"] for face in frame.get("face_results", []) if face.get("is_known")})
+            entries.append({"kind": "caption", "text": frame.get("caption", ""), "people": people, "timestamp": timestamp})
+            for qa in frame.get("qa_results", []):
+                entries.append({
+                    "kind": "answer",
+                    "text": f"{qa['question']} {qa['answer']}",
+                    "people": people,
+                    "timestamp": timestamp
+                })
+        
+        audio = result.get("audio_analysis") or {}
+        transcription = audio.get("transcription")
+        if transcription and transcription != AUDIO_TRANSCRIPTION_PLACEHOLDER:
+            entries.append({"kind": "transcript", "text": transcription, "people": [], "timestamp": timestamp})
+        
+        return entries
+    
     def get_processing_history(self, patient_id: Optional[str] = None) -> List[Dict]:
         """Get processing history"""
         if patient_id:
@@ -655,21 +1018,306 @@ class DocumentProcessor:
         return list(self.processing_history.values())
 
 
+class DocumentAPIHandler(BaseAPIHandler):
+    """HTTP request handler for Document Understanding API"""
+    
+    max_body_bytes = DOCUMENT_MAX_UPLOAD_MB * 1024 * 1024
+    
+    def do_POST(self):
+        """Handle POST requests"""
+        try:
+            endpoint = urlparse(self.path).path
+            
+            if endpoint == '/analyze':
+                self._handle_analyze(*self.read_upload_request())
+            elif endpoint == '/add_face':
+                self._handle_add_face(*self.read_upload_request())
+            else:
+                self.send_error_response(404, "Endpoint not found")
+                
+        except RequestBodyError as e:
+            self.send_error_response(e.status_code, str(e))
+        except Exception as e:
+            print(f"Error handling request: {e}")
+            self.send_error_response(500, f"Internal server error: {str(e)}")
+    
+    def _handle_analyze(self, request_data, files):
+        """
+        Queue an image or video analysis job and return its id immediately
+        
+        The media is either a file_path readable by this service, or an
+        uploaded file (multipart "file" part or a raw image/* / video/* body)
+        that is stored under DOCUMENT_UPLOAD_DIR until the job finishes.
+        """
+        upload = files.get('file')
+        file_path = request_data.get('file_path')
+        file_type = request_data.get('file_type')
+        if upload is not None and not file_type and upload.content_type:
+            file_type = upload.content_type.split('/')[0]
+        
+        if not (file_path or upload) or file_type not in ("image", "video"):
+            self.send_error_response(400, "file_path (or an uploaded file) and file_type ('image' or 'video') are required")
+            return
+        
+        try:
+            extract_frames_count = int(request_data.get('extract_frames_count', 10))
+        except (TypeError, ValueError):
+            extract_frames_count = 0
+        if extract_frames_count < 1:
+            self.send_error_response(400, "extract_frames_count must be a positive integer")
+            return
+        
+        if upload is not None:
+            suffix = f".{upload.extension}" if upload.extension else ""
+            file_path = str(upload.save(DOCUMENT_UPLOAD_DIR / f"{uuid.uuid4()}{suffix}"))
+            upload.close()
+        elif not os.path.exists(file_path):
+            self.send_error_response(404, f"File not found: {file_path}")
+            return
+        
+        params = {
+            "file_path": file_path,
+            "file_type": file_type,
+            "patient_id": request_data.get('patient_id'),
+            "questions": request_data.get('questions'),
+            "detect_faces": request_data.get('detect_faces', True),
+            "extract_frames_count": extract_frames_count,
+            "analyze_audio": request_data.get('analyze_audio', True),
+            "sampling": request_data.get('sampling', VIDEO_SAMPLING_MODE),
+            "delete_after": upload is not None,
+            "memory_id": request_data.get('upload_id')
+        }
+        metadata = {
+            "upload_id": request_data.get('upload_id'),
+            "patient_id": request_data.get('patient_id'),
+            "file_type": file_type
+        }
+        
+        try:
+            job_id = analysis_jobs.submit(
+                f"analyze_{file_type}",
+                _run_analysis_job,
+                params=params,
+                metadata=metadata,
+                summarize=document_processor.get_memory_summary
+            )
+        except queue.Full:
+            if upload is not None:
+                os.unlink(file_path)
+            self.send_error_response(429, "Analysis queue is full, retry later")
+            return
+        
+        response = {
+            "success": True,
+            "job_id": job_id,
+            "status": "pending",
+            "status_url": f"/jobs/{job_id}",
+            "timestamp": datetime.now().isoformat()
+        }
+        
+        self.send_json_response(response, 202)
+    
+    def _handle_add_face(self, request_data, files):
+        """Handle add known face request (image_path or an uploaded image)"""
+        upload = files.get('image') or files.get('file')
+        image_path = request_data.get('image_path')
+        person_name = request_data.get('person_name')
+        
+        if not (image_path or upload) or not person_name:
+            self.send_error_response(400, "image_path (or an uploaded image) and person_name are required")
+            return
+        
+        try:
+            if upload is not None:
+                upload.file.seek(0)
+                image_path = upload.file
+            result = document_processor.add_known_face(image_path, person_name)
+        finally:
+            if upload is not None:
+                upload.close()
+        self.send_json_response(result, 200 if result.get("success") else 400)
+    
+    def do_GET(self):
+        """Handle GET requests"""
+        parsed = urlparse(self.path)
+        path_parts = [part for part in parsed.path.split('/') if part]
+        
+        if parsed.path == '/health':
+            response = {
+                "status": "healthy",
+                "service": "Document Understanding",
+                "jobs": analysis_jobs.get_stats(),
+                "known_people": len(document_processor.face_index.counts()),
+                "analysis_cache": document_processor.analysis_cache.get_stats(),
+                "server": self.server_stats(),
+                "gpu_info": get_gpu_info()
+            }
+            self.send_json_response(response)
+        elif parsed.path == '/known_faces':
+            self.send_json_response({
+                "success": True,
+                "known_faces": document_processor.get_known_faces()
+            })
+        elif path_parts == ['jobs']:
+            status = parse_qs(parsed.query).get('status', [None])[0]
+            jobs = [_public_job(job) for job in analysis_jobs.list_jobs(status)]
+            self.send_json_response({"success": True, "jobs": jobs, "count": len(jobs)})
+        elif len(path_parts) == 2 and path_parts[0] == 'jobs':
+            self._handle_job_status(path_parts[1])
+        elif len(path_parts) == 3 and path_parts[0] == 'jobs' and path_parts[2] == 'result':
+            self._handle_job_result(path_parts[1])
+        else:
+            self.send_error_response(404, "Not found")
+    
+    def _handle_job_status(self, job_id: str):
+        """Report a job's status, stage and progress"""
+        job = analysis_jobs.get_job(job_id)
+        if not job:
+            self.send_error_response(404, "Job not found")
+            return
+        
+        self.send_json_response({"success": True, "job": _public_job(job)})
+    
+    def _handle_job_result(self, job_id: str):
+        """Return the full analysis record of a finished job"""
+        job = analysis_jobs.get_job(job_id)
+        if not job:
+            self.send_error_response(404, "Job not found")
+            return
+        
+        if job["status"] == "failed":
+            self.send_error_response(500, f"Analysis failed: {job['error']}")
+            return
+        
+        if job["status"] != "done":
+            self.send_error_response(409, f"Job is {job['status']} ({job['stage']})")
+            return
+        
+        self.send_json_response({
+            "success": True,
+            "job_id": job_id,
+            "result": analysis_jobs.get_result(job_id)
+        })
+
+
+def _public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Job record without the in-memory result payload"""
+    return {key: value for key, value in job.items() if key != "result"}
+
+
+def _run_analysis_job(
+    report_progress: Callable[[str, float], None],
+    file_path: str,
+    file_type: str,
+    patient_id: Optional[str] = None,
+    questions: Optional[List[str]] = None,
+    detect_faces: bool = True,
+    extract_frames_count: int = 10,
+    analyze_audio: bool = True,
+    sampling: str = VIDEO_SAMPLING_MODE,
+    delete_after: bool = False,
+    memory_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Worker entry point for queued analysis jobs"""
+    try:
+        if file_type == "video":
+            analysis_record = document_processor.analyze_video(
+                file_path,
+                extract_frames_count=extract_frames_count,
+                analyze_audio=analyze_audio,
+                detect_faces=detect_faces,
+                patient_id=patient_id,
+                progress_callback=report_progress,
+                sampling=sampling
+            )
+        else:
+            analysis_record = document_processor.analyze_image(
+                file_path,
+                questions=questions,
+                detect_faces=detect_faces,
+                patient_id=patient_id,
+                progress_callback=report_progress
+            )
+        
+        if patient_id:
+            _send_to_memory_index(analysis_record, memory_id)
+        return analysis_record
+    finally:
+        # Uploaded media only lives as long as its job
+        if delete_after and os.path.exists(file_path):
+            os.unlink(file_path)
+
+
+def _send_to_memory_index(analysis_record: Dict[str, Any], memory_id: Optional[str] = None):
+    """POST the analyzed memory to the conversation service's retrieval index (best effort)"""
+    if not MEMORY_INDEX_URL:
+        return
+    
+    payload = {
+        "patient_id": analysis_record["patient_id"],
+        "memory_id": memory_id or analysis_record["analysis_id"],
+        "entries": document_processor.get_memory_entries(analysis_record)
+    }
+    try:
+        requests.post(MEMORY_INDEX_URL, json=payload, timeout=10)
+    except Exception as e:
+        print(f"⚠️  Could not index memory for conversations: {e}")
+
+
 # Global document processor instance
 document_processor = None
+analysis_jobs = None
 
 def initialize_document_processor():
     """Initialize document processor"""
-    global document_processor
+    global document_processor, analysis_jobs
     print("Initializing Document Understanding System...")
     
     document_processor = DocumentProcessor(device="auto")
+    
+    callback_headers = {}
+    if os.getenv('AI_CALLBACK_SECRET'):
+        callback_headers['X-AI-Callback-Secret'] = os.getenv('AI_CALLBACK_SECRET')
+    elif DOCUMENT_STATUS_CALLBACK_URL:
+        print("⚠️  AI_CALLBACK_SECRET is not set; the backend will reject analysis status callbacks")
+    
+    analysis_jobs = JobQueue(
+        num_workers=DOCUMENT_NUM_WORKERS,
+        results_dir=DOCUMENT_RESULTS_DIR,
+        callback_url=DOCUMENT_STATUS_CALLBACK_URL,
+        callback_headers=callback_headers,
+        max_pending=DOCUMENT_MAX_PENDING_JOBS,
+        retention_seconds=DOCUMENT_JOB_RETENTION_SECONDS
+    )
+    print(f"✓ Analysis job queue started with {DOCUMENT_NUM_WORKERS} workers")
     print("✓ Document Understanding System initialized")
 
+def start_server():
+    """Start the document understanding server"""
+    server_address = (DOCUMENT_API_HOST, DOCUMENT_API_PORT)
+    httpd = create_api_server(server_address, DocumentAPIHandler, max_active=DOCUMENT_MAX_CONCURRENT_REQUESTS)
+    
+    print(f"Document Understanding Server running on http://{DOCUMENT_API_HOST}:{DOCUMENT_API_PORT}")
+    print("Endpoints:")
+    print("  POST /analyze - Queue image/video analysis (returns job_id)")
+    print("  POST /add_face - Add a known face")
+    print("  GET /jobs - List analysis jobs (?status=pending|processing|done|failed)")
+    print("  GET /jobs/<job_id> - Job status and progress")
+    print("  GET /jobs/<job_id>/result - Analysis result")
+    print("  GET /known_faces - Known faces and counts")
+    print("  GET /health - Health check")
+    
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down document understanding server...")
+        httpd.shutdown()
+
 if __name__ == "__main__":
     # Initialize processor
     init_thread = threading.Thread(target=initialize_document_processor)
     init_thread.start()
     init_thread.join()
     
-    print("Document Understanding System ready for testing!")
\ No newline at end of file
+    # Start server
+    start_server()
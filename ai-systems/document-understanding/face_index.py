@@ -0,0 +1,184 @@
+"""
+Vectorized face-matching index for the known-faces database
+All encodings live in one contiguous float32 matrix with a parallel label array
+"""
+
+import threading
+from typing import Dict, List, Any
+
+import numpy as np
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+
+FACE_ENCODING_DIM = 128
+
+
+class FaceIndex:
+    """
+    Nearest-neighbour index over known face encodings.
+
+    Every detected face is matched against every known encoding with one
+    matrix distance computation; the global best match wins regardless of
+    insertion order. When faiss is installed and the registry grows past
+    ann_threshold encodings, an HNSW graph answers queries instead.
+    """
+
+    def __init__(self, dim: int = FACE_ENCODING_DIM, ann_threshold: int = 50000):
+        self.dim = dim
+        self.ann_threshold = ann_threshold
+
+        self.names: List[str] = []            # label id -> person name
+        self._label_ids: Dict[str, int] = {}  # person name -> label id
+
+        self._encodings = np.empty((0, dim), dtype=np.float32)
+        self._labels = np.empty(0, dtype=np.int32)
+        self._size = 0
+
+        self._ann = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def encodings(self) -> np.ndarray:
+        """(N, dim) float32 matrix of all known encodings"""
+        return self._encodings[:self._size]
+
+    @property
+    def labels(self) -> np.ndarray:
+        """(N,) label ids parallel to encodings"""
+        return self._labels[:self._size]
+
+    def label_id(self, name: str) -> int:
+        """Label id for a person, registering the name if it is new"""
+        if name not in self._label_ids:
+            self._label_ids[name] = len(self.names)
+            self.names.append(name)
+        return self._label_ids[name]
+
+    def add(self, name: str, encodings: np.ndarray) -> int:
+        """Append one (dim,) or several (n, dim) encodings for a person; returns its label id"""
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+
+        with self._lock:
+            label = self.label_id(name)
+            self._reserve(self._size + len(encodings))
+            self._encodings[self._size:self._size + len(encodings)] = encodings
+            self._labels[self._size:self._size + len(encodings)] = label
+            self._size += len(encodings)
+
+            if self._ann is not None:
+                self._ann.add(encodings)
+            elif faiss is not None and self._size >= self.ann_threshold:
+                self._build_ann()
+
+            return label
+
+    def load(self, names: List[str], encodings: np.ndarray, labels: np.ndarray):
+        """Replace the index contents with prebuilt arrays (memory maps are used without copying)"""
+        with self._lock:
+            self.names = list(names)
+            self._label_ids = {name: i for i, name in enumerate(self.names)}
+            self._encodings = np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+            self._labels = np.asarray(labels, dtype=np.int32)
+            self._size = len(self._labels)
+            self._ann = None
+            if faiss is not None and self._size >= self.ann_threshold:
+                self._build_ann()
+
+    def _reserve(self, capacity: int):
+        """Grow storage geometrically so appends are amortized O(1)"""
+        if capacity <= len(self._labels):
+            return
+
+        new_capacity = max(capacity, 2 * len(self._labels), 64)
+        encodings = np.empty((new_capacity, self.dim), dtype=np.float32)
+        labels = np.empty(new_capacity, dtype=np.int32)
+        encodings[:self._size] = self._encodings[:self._size]
+        labels[:self._size] = self._labels[:self._size]
+        self._encodings, self._labels = encodings, labels
+
+    def _build_ann(self):
+        """Build an HNSW graph over the current encodings"""
+        self._ann = faiss.IndexHNSWFlat(self.dim, 32)
+        self._ann.add(self.encodings)
+
+    def counts(self) -> Dict[str, int]:
+        """Number of stored encodings per person"""
+        counts = np.bincount(self.labels, minlength=len(self.names))
+        return {name: int(count) for name, count in zip(self.names, counts) if count}
+
+    def search(self, queries: np.ndarray, top_k: int = 3) -> tuple:
+        """
+        k nearest known encodings for each query
+
+        Returns:
+            (distances, indices), both (M, k), sorted by ascending distance
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        k = min(top_k, self._size)
+
+        if self._ann is not None:
+            squared, indices = self._ann.search(queries, k)
+            return np.sqrt(np.maximum(squared, 0.0)), indices
+
+        known = self.encodings
+        squared = (
+            np.einsum("ij,ij->i", queries, queries)[:, None]
+            + np.einsum("ij,ij->i", known, known)[None, :]
+            - 2.0 * queries @ known.T
+        )
+        distances = np.sqrt(np.maximum(squared, 0.0))
+
+        if k < distances.shape[1]:
+            indices = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        else:
+            indices = np.tile(np.arange(distances.shape[1]), (len(queries), 1))
+        nearest = np.take_along_axis(distances, indices, axis=1)
+        order = np.argsort(nearest, axis=1)
+
+        return np.take_along_axis(nearest, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+    def match(self, queries: np.ndarray, tolerance: float = 0.6, top_k: int = 3) -> List[Dict[str, Any]]:
+        """
+        Identify each query face against all known people at once
+
+        Returns:
+            One dict per query with the best "name" ("Unknown" above tolerance),
+            its "distance", and up to top_k distinct-person "candidates".
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        if self._size == 0 or len(queries) == 0:
+            return [{"name": "Unknown", "distance": None, "candidates": []} for _ in range(len(queries))]
+
+        # Over-fetch so that several encodings of one person still leave room for others
+        with self._lock:
+            distances, indices = self.search(queries, top_k=top_k * 4)
+            labels = self.labels[indices]
+            names = list(self.names)
+
+        matches = []
+        for row_distances, row_labels in zip(distances, labels):
+            candidates = []
+            seen = set()
+            for distance, label in zip(row_distances, row_labels):
+                if label in seen:
+                    continue
+                seen.add(label)
+                candidates.append({"name": names[label], "distance": round(float(distance), 4)})
+                if len(candidates) == top_k:
+                    break
+
+            best = candidates[0]
+            matches.append({
+                "name": best["name"] if best["distance"] <= tolerance else "Unknown",
+                "distance": best["distance"],
+                "candidates": candidates
+            })
+
+        return matches
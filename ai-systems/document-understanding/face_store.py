@@ -0,0 +1,101 @@
+"""
+Binary on-disk store for the known-faces database
+Encodings and labels are append-only raw arrays opened memory-mapped
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+
+class FaceStore:
+    """
+    Append-only face database in a directory of three files:
+
+        encodings.f32  raw float32 rows of `dim` values, one per stored face
+        labels.i32     raw int32 label id per row, parallel to encodings
+        names.json     label id -> person name (rewritten only for new people)
+
+    Opening memory-maps both arrays, so startup does not read the encodings.
+    Adding a face appends one row to each file. names.json is replaced
+    atomically, and a torn tail left by a crash between the two appends is
+    trimmed on the next open.
+    """
+
+    def __init__(self, directory: Path, dim: int = 128):
+        self.directory = Path(directory)
+        self.dim = dim
+        self.encodings_path = self.directory / "encodings.f32"
+        self.labels_path = self.directory / "labels.i32"
+        self.names_path = self.directory / "names.json"
+        self._lock = threading.Lock()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def exists(self) -> bool:
+        return self.names_path.exists()
+
+    def open(self) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """Return (names, encodings (N, dim), labels (N,)); arrays are read-only memory maps"""
+        with self._lock:
+            names = self._read_names()
+            count = self._repair()
+            if count == 0:
+                return names, np.empty((0, self.dim), dtype=np.float32), np.empty(0, dtype=np.int32)
+
+            encodings = np.memmap(self.encodings_path, dtype=np.float32, mode="r", shape=(count, self.dim))
+            labels = np.memmap(self.labels_path, dtype=np.int32, mode="r", shape=(count,))
+            return names, encodings, labels
+
+    def append(self, names: List[str], label: int, encodings: np.ndarray):
+        """Append encodings for one label; names is the full label list after the add"""
+        encodings = np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        labels = np.full(len(encodings), label, dtype=np.int32)
+
+        with self._lock:
+            if len(names) != len(self._read_names()):
+                self._write_names(names)
+
+            # Encodings first: rows without a label are dropped by _repair()
+            self._append_bytes(self.encodings_path, encodings.tobytes())
+            self._append_bytes(self.labels_path, labels.tobytes())
+
+    def _read_names(self) -> List[str]:
+        if not self.names_path.exists():
+            return []
+        with open(self.names_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_names(self, names: List[str]):
+        temp_path = self.names_path.with_suffix(".json.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(names, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        temp_path.replace(self.names_path)
+
+    def _append_bytes(self, path: Path, data: bytes):
+        with open(path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _repair(self) -> int:
+        """Truncate both arrays to the number of complete, labelled rows"""
+        row_bytes = self.dim * 4
+        encoding_rows = self.encodings_path.stat().st_size // row_bytes if self.encodings_path.exists() else 0
+        label_rows = self.labels_path.stat().st_size // 4 if self.labels_path.exists() else 0
+        count = min(encoding_rows, label_rows)
+
+        for path, size in ((self.encodings_path, count * row_bytes), (self.labels_path, count * 4)):
+            if path.exists() and path.stat().st_size != size:
+                print(f"⚠️  Trimming incomplete face database tail in {path.name}")
+                os.truncate(path, size)
+            elif not path.exists():
+                path.touch()
+
+        return count
@@ -0,0 +1,202 @@
+"""
+Streaming transcription for WhisperX STT
+Feeds live PCM chunks through a VAD-gated rolling buffer and emits partial
+and final hypotheses while the patient is still speaking
+"""
+
+import threading
+import time
+import uuid
+from typing import Optional, Dict, List, Any, Callable
+
+import numpy as np
+
+
+SAMPLE_RATE = 16000
+
+
+def pcm16_to_float32(pcm_bytes: bytes) -> np.ndarray:
+    """Little-endian signed 16-bit PCM to float32 samples in [-1, 1]"""
+    usable = len(pcm_bytes) - len(pcm_bytes) % 2
+    return np.frombuffer(pcm_bytes[:usable], dtype="<i2").astype(np.float32) / 32768.0
+
+
+class EnergyVAD:
+    """
+    Frame-level voice activity detector based on RMS energy.
+
+    The noise floor follows quiet frames, and a frame counts as speech when
+    its energy is well above the floor and above an absolute minimum.
+    """
+
+    def __init__(self, frame_ms: int = 30, threshold_ratio: float = 3.0, min_rms: float = 0.01):
+        self.frame_size = SAMPLE_RATE * frame_ms // 1000
+        self.threshold_ratio = threshold_ratio
+        self.min_rms = min_rms
+        self.noise_floor = min_rms / threshold_ratio
+
+    def speech_frames(self, audio: np.ndarray) -> np.ndarray:
+        """Boolean speech flag per complete frame of audio"""
+        frame_count = len(audio) // self.frame_size
+        if frame_count == 0:
+            return np.zeros(0, dtype=bool)
+
+        frames = audio[:frame_count * self.frame_size].reshape(frame_count, self.frame_size)
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        threshold = max(self.min_rms, self.noise_floor * self.threshold_ratio)
+        is_speech = rms > threshold
+
+        quiet = rms[~is_speech]
+        if quiet.size:
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * float(np.median(quiet))
+        return is_speech
+
+
+class StreamingSession:
+    """
+    One live transcription stream.
+
+    Incoming audio is appended to a rolling buffer of not-yet-finalized
+    speech. While speech continues, the buffer is re-decoded every
+    partial_interval seconds of new audio to refresh the partial hypothesis.
+    When the speaker pauses for end_silence seconds (or the buffer reaches
+    max_segment seconds) the buffer is decoded one last time, its segments
+    become final with absolute timestamps, and the buffer is cleared.
+    Silence before speech is discarded so the decoder never sees it.
+    """
+
+    def __init__(
+        self,
+        transcribe: Callable[[np.ndarray, Optional[str]], Dict[str, Any]],
+        patient_id: Optional[str] = None,
+        language: Optional[str] = None,
+        partial_interval: float = 1.0,
+        end_silence: float = 0.8,
+        max_segment: float = 25.0,
+        speech_pad: float = 0.3
+    ):
+        self.session_id = str(uuid.uuid4())
+        self.patient_id = patient_id
+        self.language = language
+        self.created_at = time.time()
+        self.last_activity = self.created_at
+
+        self._transcribe = transcribe
+        self._vad = EnergyVAD()
+        self._partial_interval = int(partial_interval * SAMPLE_RATE)
+        self._end_silence_frames = int(end_silence * 1000 / 30)
+        self._max_segment = int(max_segment * SAMPLE_RATE)
+        self._speech_pad = int(speech_pad * SAMPLE_RATE)
+
+        self._committed: List[np.ndarray] = []   # all audio, kept for deferred alignment
+        self._total_samples = 0
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._buffer_start = 0                    # absolute sample index of buffer[0]
+        self._vad_remainder = np.zeros(0, dtype=np.float32)
+        self._has_speech = False
+        self._trailing_silence = 0
+        self._since_partial = 0
+
+        self.partial_text = ""
+        self.final_segments: List[Dict[str, Any]] = []
+        self.decode_count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def audio(self) -> np.ndarray:
+        """Every sample received so far"""
+        return np.concatenate(self._committed) if self._committed else np.zeros(0, dtype=np.float32)
+
+    def feed(self, samples: np.ndarray) -> Dict[str, Any]:
+        """
+        Add 16 kHz mono float32 samples
+
+        Returns:
+            {"partial": current partial text, "final_segments": segments finalized by this chunk}
+        """
+        with self._lock:
+            self.last_activity = time.time()
+            samples = np.asarray(samples, dtype=np.float32)
+            self._committed.append(samples)
+            self._total_samples += len(samples)
+            self._buffer = np.concatenate([self._buffer, samples])
+            self._since_partial += len(samples)
+
+            vad_input = np.concatenate([self._vad_remainder, samples])
+            flags = self._vad.speech_frames(vad_input)
+            self._vad_remainder = vad_input[len(flags) * self._vad.frame_size:]
+
+            for is_speech in flags:
+                if is_speech:
+                    self._has_speech = True
+                    self._trailing_silence = 0
+                else:
+                    self._trailing_silence += 1
+
+            new_finals = []
+            if not self._has_speech:
+                self._drop_leading_silence()
+                self._since_partial = 0
+            elif self._trailing_silence >= self._end_silence_frames or len(self._buffer) >= self._max_segment:
+                new_finals = self._finalize()
+            elif self._since_partial >= self._partial_interval:
+                self._since_partial = 0
+                self.partial_text = self._decode_text(self._buffer)
+
+            return {"partial": self.partial_text, "final_segments": new_finals}
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Finalize whatever speech is still buffered; returns all final segments"""
+        with self._lock:
+            if self._has_speech:
+                self._finalize()
+            return list(self.final_segments)
+
+    def _drop_leading_silence(self):
+        """Keep only a short pad of pre-speech audio in the rolling buffer"""
+        surplus = len(self._buffer) - self._speech_pad
+        if surplus > 0:
+            self._buffer = self._buffer[surplus:]
+            self._buffer_start += surplus
+
+    def _decode(self, audio: np.ndarray) -> Dict[str, Any]:
+        self.decode_count += 1
+        result = self._transcribe(audio, self.language)
+        if not self.language and result.get("language"):
+            # Reuse the detected language so later decodes skip detection
+            self.language = result["language"]
+        return result
+
+    def _decode_text(self, audio: np.ndarray) -> str:
+        segments = self._decode(audio).get("segments", [])
+        return " ".join(seg.get("text", "").strip() for seg in segments).strip()
+
+    def _finalize(self) -> List[Dict[str, Any]]:
+        offset = self._buffer_start / SAMPLE_RATE
+        segments = []
+        for seg in self._decode(self._buffer).get("segments", []):
+            text = seg.get("text", "").strip()
+            if text:
+                segments.append({
+                    "text": text,
+                    "start": round(offset + seg.get("start", 0.0), 3),
+                    "end": round(offset + seg.get("end", 0.0), 3)
+                })
+
+        self.final_segments.extend(segments)
+        self._buffer_start += len(self._buffer)
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._has_speech = False
+        self._trailing_silence = 0
+        self._since_partial = 0
+        self.partial_text = ""
+        return segments
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "received_seconds": round(self._total_samples / SAMPLE_RATE, 2),
+            "buffered_seconds": round(len(self._buffer) / SAMPLE_RATE, 2),
+            "final_segments": len(self.final_segments),
+            "decode_count": self.decode_count
+        }
@@ -6,24 +6,28 @@ Provides accurate speech-to-text with speaker diarization and timestamps
 import whisperx
 import torch
 import numpy as np
-import soundfile as sf
 import io
 import json
 import uuid
 from datetime import datetime
 from pathlib import Path
 from typing import Optional, Dict, List, Any, Union
-from http.server import HTTPServer
+from urllib.parse import urlparse
 import threading
 import base64
-import tempfile
 import os
+import re
+import time
 
 # Import shared utilities and config
 import sys
 sys.path.append(str(Path(__file__).parent.parent))
 from config.settings import *
 from utils.api_utils import BaseAPIHandler, get_gpu_info, optimize_for_gpu
+from utils.server import create_api_server
+from utils.uploads import RequestBodyError
+from utils.audio_io import decode_audio_bytes
+from stt.streaming import StreamingSession, pcm16_to_float32
 
 
 class WhisperXSTT:
@@ -68,6 +72,10 @@ class WhisperXSTT:
         # Transcription history
         self.transcription_history = {}
         
+        # Live streaming sessions: {session_id: (StreamingSession, settings)}
+        self.stream_sessions = {}
+        self._sessions_lock = threading.Lock()
+        
         print("Initializing WhisperX STT System...")
         print(f"Model: {self.model_size}")
         print(f"Device: {self.device}")
@@ -137,6 +145,41 @@ class WhisperXSTT:
             enable_diarization: Enable speaker separation
             enable_alignment: Enable word-level timestamps
             
+        Returns:
+            Transcription result with metadata
+        """
+        print(f"🎤 Transcribing audio file: {audio_path}")
+        
+        with open(audio_path, 'rb') as f:
+            audio_bytes = f.read()
+        
+        return self.transcribe_audio_bytes(
+            audio_bytes,
+            format=Path(audio_path).suffix.lstrip('.'),
+            patient_id=patient_id,
+            enable_diarization=enable_diarization,
+            enable_alignment=enable_alignment,
+            audio_source=audio_path
+        )
+    
+    def transcribe_audio_array(
+        self,
+        audio_data: np.ndarray,
+        audio_source: str = "memory",
+        patient_id: Optional[str] = None,
+        enable_diarization: bool = True,
+        enable_alignment: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Transcribe decoded audio
+        
+        Args:
+            audio_data: float32 mono samples at 16 kHz
+            audio_source: Where the audio came from (stored with the record)
+            patient_id: Optional patient ID for context
+            enable_diarization: Enable speaker separation
+            enable_alignment: Enable word-level timestamps
+            
         Returns:
             Transcription result with metadata
         """
@@ -144,15 +187,6 @@ class WhisperXSTT:
             transcription_id = str(uuid.uuid4())
             start_time = datetime.now()
             
-            print(f"🎤 Transcribing audio file: {audio_path}")
-            
-            # Load and preprocess audio
-            audio_data, sample_rate = sf.read(audio_path)
-            
-            # Ensure mono audio
-            if len(audio_data.shape) > 1:
-                audio_data = np.mean(audio_data, axis=1)
-            
             # Basic transcription
             print("📝 Running speech recognition...")
             result = self.whisper_model.transcribe(
@@ -162,96 +196,204 @@ class WhisperXSTT:
                 print_progress=True
             )
             
-            # Word-level alignment (if enabled and model available)
-            if enable_alignment and self.align_model:
-                print("🔗 Aligning words with timestamps...")
-                result = whisperx.align(
-                    result["segments"], 
-                    self.align_model, 
-                    self.align_metadata, 
-                    audio_data, 
-                    self.device, 
-                    return_char_alignments=False
-                )
-            
-            # Speaker diarization (if enabled and model available)
-            if enable_diarization and self.diarize_model:
-                print("👥 Running speaker diarization...")
-                diarize_segments = self.diarize_model(audio_data)
-                result = whisperx.assign_word_speakers(diarize_segments, result)
-            
-            # Process and enhance results for Alzheimer's patients
-            processed_result = self._process_transcription_for_patients(
-                result, 
-                audio_path,
-                patient_id
+            return self._complete_transcription(
+                result,
+                audio_data,
+                audio_source,
+                patient_id=patient_id,
+                enable_diarization=enable_diarization,
+                enable_alignment=enable_alignment,
+                transcription_id=transcription_id,
+                start_time=start_time
             )
             
-            # Store transcription
-            transcription_record = {
-                "transcription_id": transcription_id,
-                "patient_id": patient_id,
-                "audio_file": audio_path,
-                "timestamp": start_time.isoformat(),
-                "processing_time": (datetime.now() - start_time).total_seconds(),
-                "result": processed_result,
-                "settings": {
-                    "model_size": self.model_size,
-                    "language": self.language,
-                    "diarization_enabled": enable_diarization,
-                    "alignment_enabled": enable_alignment
-                }
-            }
-            
-            self.transcription_history[transcription_id] = transcription_record
-            
-            print(f"✓ Transcription completed in {transcription_record['processing_time']:.2f}s")
-            return transcription_record
-            
         except Exception as e:
             print(f"❌ Error transcribing audio: {e}")
             raise
     
+    def _complete_transcription(
+        self,
+        result: Dict,
+        audio_data: np.ndarray,
+        audio_source: str,
+        patient_id: Optional[str],
+        enable_diarization: bool,
+        enable_alignment: bool,
+        transcription_id: str,
+        start_time: datetime
+    ) -> Dict[str, Any]:
+        """Align, diarize and post-process recognized segments, then store the record"""
+        # Word-level alignment (if enabled and model available)
+        if enable_alignment and self.align_model and result["segments"]:
+            print("🔗 Aligning words with timestamps...")
+            language = result.get("language")
+            result = whisperx.align(
+                result["segments"], 
+                self.align_model, 
+                self.align_metadata, 
+                audio_data, 
+                self.device, 
+                return_char_alignments=False
+            )
+            result.setdefault("language", language)
+        
+        # Speaker diarization (if enabled and model available)
+        if enable_diarization and self.diarize_model and result["segments"]:
+            print("👥 Running speaker diarization...")
+            diarize_segments = self.diarize_model(audio_data)
+            result = whisperx.assign_word_speakers(diarize_segments, result)
+        
+        # Process and enhance results for Alzheimer's patients
+        processed_result = self._process_transcription_for_patients(
+            result, 
+            audio_source,
+            patient_id
+        )
+        
+        # Store transcription
+        transcription_record = {
+            "transcription_id": transcription_id,
+            "patient_id": patient_id,
+            "audio_file": audio_source,
+            "timestamp": start_time.isoformat(),
+            "processing_time": (datetime.now() - start_time).total_seconds(),
+            "result": processed_result,
+            "settings": {
+                "model_size": self.model_size,
+                "language": self.language,
+                "diarization_enabled": enable_diarization,
+                "alignment_enabled": enable_alignment
+            }
+        }
+        
+        self.transcription_history[transcription_id] = transcription_record
+        
+        print(f"✓ Transcription completed in {transcription_record['processing_time']:.2f}s")
+        return transcription_record
+    
+    def start_stream(
+        self,
+        patient_id: Optional[str] = None,
+        enable_diarization: bool = True,
+        enable_alignment: bool = True
+    ) -> str:
+        """
+        Open a live transcription session fed with 16 kHz mono PCM chunks
+        
+        Alignment and diarization are deferred until finish_stream and run
+        once over the finalized segments.
+        
+        Returns:
+            session_id
+        """
+        self._expire_stream_sessions()
+        
+        session = StreamingSession(
+            self._transcribe_stream_audio,
+            patient_id=patient_id,
+            language=self.language if self.language != "auto" else None,
+            partial_interval=STT_STREAM_PARTIAL_INTERVAL,
+            end_silence=STT_STREAM_END_SILENCE,
+            max_segment=STT_STREAM_MAX_SEGMENT
+        )
+        settings = {
+            "enable_diarization": enable_diarization,
+            "enable_alignment": enable_alignment,
+            "start_time": datetime.now()
+        }
+        with self._sessions_lock:
+            self.stream_sessions[session.session_id] = (session, settings)
+        
+        print(f"🎙️  Started streaming session {session.session_id}")
+        return session.session_id
+    
+    def feed_stream(self, session_id: str, pcm_bytes: bytes) -> Dict[str, Any]:
+        """Add a chunk of 16-bit PCM audio; returns the partial and any newly final segments"""
+        session, _ = self._get_stream_session(session_id)
+        return session.feed(pcm16_to_float32(pcm_bytes))
+    
+    def finish_stream(self, session_id: str) -> Dict[str, Any]:
+        """Close a session and return its full transcription record"""
+        session, settings = self._get_stream_session(session_id)
+        with self._sessions_lock:
+            self.stream_sessions.pop(session_id, None)
+        
+        segments = session.finish()
+        result = {"segments": segments, "language": session.language or "unknown"}
+        
+        return self._complete_transcription(
+            result,
+            session.audio,
+            f"stream:{session_id}",
+            patient_id=session.patient_id,
+            enable_diarization=settings["enable_diarization"],
+            enable_alignment=settings["enable_alignment"],
+            transcription_id=session_id,
+            start_time=settings["start_time"]
+        )
+    
+    def _get_stream_session(self, session_id: str) -> tuple:
+        with self._sessions_lock:
+            entry = self.stream_sessions.get(session_id)
+        if entry is None:
+            raise KeyError(f"Unknown streaming session: {session_id}")
+        return entry
+    
+    def _expire_stream_sessions(self):
+        """Drop sessions that have not received audio for STT_STREAM_SESSION_TIMEOUT seconds"""
+        cutoff = time.time() - STT_STREAM_SESSION_TIMEOUT
+        with self._sessions_lock:
+            for session_id in [sid for sid, (session, _) in self.stream_sessions.items() if session.last_activity < cutoff]:
+                print(f"⚠️  Expiring idle streaming session {session_id}")
+                del self.stream_sessions[session_id]
+    
+    def _transcribe_stream_audio(self, audio_data: np.ndarray, language: Optional[str]) -> Dict[str, Any]:
+        """Decode one rolling-buffer window for a streaming session"""
+        return self.whisper_model.transcribe(
+            audio_data,
+            batch_size=1,
+            chunk_length=self.patient_optimizations["chunk_length"],
+            language=language,
+            print_progress=False
+        )
+    
     def transcribe_audio_bytes(
         self, 
         audio_bytes: bytes,
         format: str = "wav",
         patient_id: Optional[str] = None,
         enable_diarization: bool = True,
-        enable_alignment: bool = True
+        enable_alignment: bool = True,
+        audio_source: str = "upload"
     ) -> Dict[str, Any]:
         """
         Transcribe audio from bytes data
         
+        The bytes are decoded, downmixed and resampled to 16 kHz mono
+        float32 entirely in memory (see utils.audio_io).
+        
         Args:
             audio_bytes: Audio data as bytes
             format: Audio format ("wav", "mp3", "m4a", etc.)
             patient_id: Optional patient ID
             enable_diarization: Enable speaker separation
             enable_alignment: Enable word-level timestamps
+            audio_source: Where the audio came from (stored with the record)
             
         Returns:
             Transcription result
         """
         try:
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(suffix=f".{format}", delete=False) as temp_file:
-                temp_file.write(audio_bytes)
-                temp_path = temp_file.name
+            audio_data = decode_audio_bytes(audio_bytes, format=format)
             
-            # Transcribe
-            result = self.transcribe_audio_file(
-                temp_path,
+            return self.transcribe_audio_array(
+                audio_data,
+                audio_source=audio_source,
                 patient_id=patient_id,
                 enable_diarization=enable_diarization,
                 enable_alignment=enable_alignment
             )
             
-            # Clean up temporary file
-            os.unlink(temp_path)
-            
-            return result
-            
         except Exception as e:
             print(f"❌ Error transcribing audio bytes: {e}")
             raise
@@ -329,8 +471,6 @@ class WhisperXSTT:
     
     def _clean_text_for_patients(self, text: str) -> str:
         """Clean and format text for better readability"""
-        import re
-        
         # Remove excessive whitespace
         text = re.sub(r'\s+', ' ', text)
         
@@ -434,51 +574,61 @@ class WhisperXSTT:
 class STTAPIHandler(BaseAPIHandler):
     """HTTP request handler for STT API"""
     
+    max_body_bytes = STT_MAX_UPLOAD_MB * 1024 * 1024
+    unthrottled_paths = ("/health", "/get_history", "/stream/start")
+    
     def do_POST(self):
         """Handle POST requests"""
         try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            
-            endpoint = self.path
+            endpoint = urlparse(self.path).path
+            path_parts = [part for part in endpoint.split('/') if part]
             
-            if endpoint == '/transcribe_file':
-                self._handle_transcribe_file(post_data)
+            if endpoint == '/stream/start':
+                self._handle_stream_start(self.read_json_body())
+            elif len(path_parts) == 3 and path_parts[0] == 'stream' and path_parts[2] == 'audio':
+                self._handle_stream_audio(path_parts[1], self.read_body())
+            elif len(path_parts) == 3 and path_parts[0] == 'stream' and path_parts[2] == 'finish':
+                self.read_body()
+                self._handle_stream_finish(path_parts[1])
+            elif endpoint == '/transcribe_file':
+                self._handle_transcribe_file(*self.read_upload_request())
             elif endpoint == '/transcribe_audio':
-                self._handle_transcribe_audio(post_data)
+                self._handle_transcribe_audio(*self.read_upload_request())
             elif endpoint == '/get_history':
-                request_data = json.loads(post_data.decode('utf-8'))
-                self._handle_get_history(request_data)
+                self._handle_get_history(self.read_json_body())
             else:
                 self.send_error_response(404, "Endpoint not found")
                 
+        except RequestBodyError as e:
+            self.send_error_response(e.status_code, str(e))
         except Exception as e:
             print(f"Error handling request: {e}")
             self.send_error_response(500, f"Internal server error: {str(e)}")
     
-    def _handle_transcribe_file(self, post_data):
-        """Handle file transcription request"""
+    def _handle_transcribe_file(self, request_data, files):
+        """
+        Handle file transcription request
+        
+        Audio arrives as a multipart "audio"/"file" part, as a raw
+        application/octet-stream (or audio/*) body, or as base64 "audio_data"
+        in a JSON body.
+        """
         try:
-            # Parse multipart form data (simplified)
-            boundary = self.headers['Content-Type'].split('boundary=')[1]
-            # In production, use a proper multipart parser
-            
-            # For now, expect JSON with base64 encoded audio
-            request_data = json.loads(post_data.decode('utf-8'))
-            
-            audio_base64 = request_data.get('audio_data')
-            audio_format = request_data.get('format', 'wav')
+            upload = files.get('audio') or files.get('file')
             patient_id = request_data.get('patient_id')
             enable_diarization = request_data.get('enable_diarization', True)
             enable_alignment = request_data.get('enable_alignment', True)
             
-            if not audio_base64:
-                self.send_error_response(400, "audio_data is required")
+            if upload is not None:
+                audio_bytes = upload.read()
+                audio_format = request_data.get('format') or upload.extension or 'wav'
+            elif request_data.get('audio_data'):
+                audio_bytes = base64.b64decode(request_data['audio_data'])
+                audio_format = request_data.get('format', 'wav')
+            else:
+                self.send_error_response(400, "An audio file or audio_data is required")
                 return
             
-            # Decode audio
-            audio_bytes = base64.b64decode(audio_base64)
-            
             # Transcribe
             result = stt_engine.transcribe_audio_bytes(
                 audio_bytes,
@@ -499,11 +649,62 @@ class STTAPIHandler(BaseAPIHandler):
             
         except Exception as e:
             self.send_error_response(500, f"Transcription error: {str(e)}")
+        finally:
+            for upload in files.values():
+                upload.close()
     
-    def _handle_transcribe_audio(self, post_data):
+    def _handle_transcribe_audio(self, request_data, files):
         """Handle audio transcription request"""
         # Similar to _handle_transcribe_file but for different input format
-        self._handle_transcribe_file(post_data)
+        self._handle_transcribe_file(request_data, files)
+    
+    def _handle_stream_start(self, request_data):
+        """Open a streaming transcription session"""
+        session_id = stt_engine.start_stream(
+            patient_id=request_data.get('patient_id'),
+            enable_diarization=request_data.get('enable_diarization', True),
+            enable_alignment=request_data.get('enable_alignment', True)
+        )
+        
+        self.send_json_response({
+            "success": True,
+            "session_id": session_id,
+            "audio_format": {
+                "encoding": "pcm_s16le",
+                "sample_rate": 16000,
+                "channels": 1
+            }
+        })
+    
+    def _handle_stream_audio(self, session_id, post_data):
+        """Feed a raw PCM chunk and return the current hypotheses"""
+        try:
+            update = stt_engine.feed_stream(session_id, post_data)
+        except KeyError as e:
+            self.send_error_response(404, str(e))
+            return
+        
+        self.send_json_response({
+            "success": True,
+            "session_id": session_id,
+            "partial": update["partial"],
+            "final_segments": update["final_segments"]
+        })
+    
+    def _handle_stream_finish(self, session_id):
+        """Finalize a session with deferred alignment and diarization"""
+        try:
+            result = stt_engine.finish_stream(session_id)
+        except KeyError as e:
+            self.send_error_response(404, str(e))
+            return
+        
+        self.send_json_response({
+            "success": True,
+            "transcription_id": result["transcription_id"],
+            "result": result["result"],
+            "processing_time": result["processing_time"]
+        })
     
     def _handle_get_history(self, request_data):
         """Handle transcription history request"""
@@ -527,6 +728,7 @@ class STTAPIHandler(BaseAPIHandler):
                 "service": "WhisperX STT",
                 "model_info": stt_engine.get_model_info(),
                 "supported_languages": stt_engine.get_supported_languages(),
+                "server": self.server_stats(),
                 "gpu_info": get_gpu_info()
             }
             self.send_json_response(response)
@@ -571,13 +773,16 @@ def initialize_stt_engine():
 def start_server():
     """Start the STT server"""
     server_address = (STT_API_HOST, STT_API_PORT)
-    httpd = HTTPServer(server_address, STTAPIHandler)
+    httpd = create_api_server(server_address, STTAPIHandler, max_active=STT_MAX_CONCURRENT_REQUESTS)
     
     print(f"WhisperX STT Server running on http://{STT_API_HOST}:{STT_API_PORT}")
     print("Endpoints:")
     print("  POST /transcribe_file - Transcribe audio file")
     print("  POST /transcribe_audio - Transcribe audio data")
     print("  POST /get_history - Get transcription history")
+    print("  POST /stream/start - Open a streaming transcription session")
+    print("  POST /stream/<session_id>/audio - Send raw 16 kHz PCM16 mono audio")
+    print("  POST /stream/<session_id>/finish - Finalize a streaming session")
     print("  GET /health - Health check")
     print("  GET /languages - Get supported languages")
     
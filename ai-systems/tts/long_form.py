@@ -0,0 +1,97 @@
+"""
+Long-form synthesis helpers for Veena TTS
+Splits long texts at sentence and clause boundaries and joins the
+synthesized pieces with short crossfades
+"""
+
+import re
+from typing import List
+
+import numpy as np
+
+
+# A sentence runs up to terminal punctuation (Latin or Devanagari danda),
+# optionally followed by closing quotes/brackets, or to the end of a line
+SENTENCE_PATTERN = re.compile(r'[^\n]+?(?:[.!?।॥…]+["\'”’)\]]*(?=\s|$)|$)', re.MULTILINE)
+CLAUSE_BOUNDARY = re.compile(r'(?<=[,;:—–])\s+')
+
+
+def split_text(text: str, max_chars: int) -> List[str]:
+    """
+    Split text into chunks of at most max_chars, preferring sentence ends,
+    then clause punctuation, then word boundaries. Short neighbouring
+    sentences are packed together so chunks are not needlessly small.
+    """
+    pieces = []
+    for sentence in SENTENCE_PATTERN.findall(text):
+        sentence = " ".join(sentence.split())
+        if not sentence:
+            continue
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+
+        for clause in _pack(CLAUSE_BOUNDARY.split(sentence), max_chars):
+            if len(clause) <= max_chars:
+                pieces.append(clause)
+            else:
+                pieces.extend(_pack(clause.split(), max_chars))
+
+    return _pack(pieces, max_chars)
+
+
+def _pack(pieces: List[str], max_chars: int) -> List[str]:
+    """Greedily join consecutive pieces with spaces while they fit in max_chars"""
+    packed = []
+    for piece in pieces:
+        if packed and len(packed[-1]) + 1 + len(piece) <= max_chars:
+            packed[-1] += " " + piece
+        else:
+            packed.append(piece)
+    return packed
+
+
+class Crossfader:
+    """
+    Joins consecutive utterances with an equal-power crossfade.
+
+    Audio is pushed as it becomes available; the last fade_samples of what
+    was pushed are held back so the next utterance can be blended into
+    them. Pieces of the same utterance (new_utterance=False) are simply
+    appended.
+    """
+
+    def __init__(self, fade_samples: int):
+        self.fade_samples = fade_samples
+        self._tail = np.zeros(0, dtype=np.float32)
+
+    def push(self, audio: np.ndarray, new_utterance: bool = True) -> np.ndarray:
+        """Add audio; returns the samples that are final"""
+        audio = np.asarray(audio, dtype=np.float32)
+        if new_utterance and len(self._tail):
+            overlap = min(len(self._tail), len(audio))
+            ramp = np.linspace(0.0, np.pi / 2, overlap, dtype=np.float32)
+            blended = self._tail[len(self._tail) - overlap:] * np.cos(ramp) + audio[:overlap] * np.sin(ramp)
+            audio = np.concatenate([self._tail[:len(self._tail) - overlap], blended, audio[overlap:]])
+        else:
+            audio = np.concatenate([self._tail, audio])
+
+        cut = max(0, len(audio) - self.fade_samples)
+        self._tail = audio[cut:]
+        return audio[:cut]
+
+    def flush(self) -> np.ndarray:
+        """Remaining held-back samples"""
+        tail, self._tail = self._tail, np.zeros(0, dtype=np.float32)
+        return tail
+
+
+def join_utterances(utterances: List[np.ndarray], fade_samples: int) -> np.ndarray:
+    """Crossfade a list of complete utterances into one array"""
+    if len(utterances) == 1:
+        return utterances[0]
+
+    crossfader = Crossfader(fade_samples)
+    pieces = [crossfader.push(audio) for audio in utterances]
+    pieces.append(crossfader.flush())
+    return np.concatenate(pieces)
@@ -0,0 +1,99 @@
+"""
+Phrase cache for Veena TTS
+Keeps synthesized audio for recurring companion phrases on disk and in memory
+"""
+
+import io
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+import numpy as np
+import soundfile as sf
+
+from utils.disk_cache import DiskCache
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form of a phrase for cache keys (NFC, single spaces, trimmed)"""
+    return unicodedata.normalize("NFC", " ".join(text.split()))
+
+
+class PhraseCache:
+    """
+    Two-tier cache of synthesized audio.
+
+    The disk tier is a size-bounded DiskCache of FLAC-encoded audio that
+    survives restarts. The memory tier is a byte-bounded LRU of decoded
+    float32 arrays for the hottest phrases; disk hits are promoted into it.
+    Cached arrays are read-only because they are shared between requests.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int, memory_bytes: int, sample_rate: int):
+        self.disk = DiskCache(directory, max_bytes)
+        self.memory_bytes = memory_bytes
+        self.sample_rate = sample_rate
+
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._memory_total = 0
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Cached audio for key, or None"""
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return audio
+
+        data = self.disk.get(key)
+        if data is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        audio, _ = sf.read(io.BytesIO(data), dtype="float32")
+        with self._lock:
+            self.disk_hits += 1
+        return self._remember(key, audio)
+
+    def put(self, key: str, audio: np.ndarray) -> np.ndarray:
+        """Store audio in both tiers; returns the shared read-only copy"""
+        buffer = io.BytesIO()
+        sf.write(buffer, audio, self.sample_rate, format="FLAC", subtype="PCM_16")
+        self.disk.put(key, buffer.getvalue())
+        return self._remember(key, np.array(audio, dtype=np.float32))
+
+    def _remember(self, key: str, audio: np.ndarray) -> np.ndarray:
+        audio.setflags(write=False)
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_total -= previous.nbytes
+            if audio.nbytes <= self.memory_bytes:
+                self._memory[key] = audio
+                self._memory_total += audio.nbytes
+                while self._memory_total > self.memory_bytes:
+                    _, evicted = self._memory.popitem(last=False)
+                    self._memory_total -= evicted.nbytes
+        return audio
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                "memory_entries": len(self._memory),
+                "memory_mb": round(self._memory_total / (1024**2), 2),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses
+            }
+        stats["disk"] = self.disk.get_stats()
+        return stats
@@ -0,0 +1,133 @@
+"""
+Streaming synthesis for Veena TTS
+Collects audio tokens from model.generate as they are produced and decodes
+SNAC audio in overlapping windows so playback can start before generation ends
+"""
+
+import queue
+import threading
+from typing import Optional, List, Callable
+
+import numpy as np
+import torch
+from transformers import StoppingCriteria
+from transformers.generation.streamers import BaseStreamer
+
+
+SNAC_FRAME_TOKENS = 7
+
+
+class AudioTokenStreamer(BaseStreamer):
+    """
+    Hands generated token ids from the generate thread to a consumer.
+
+    The first put() carries the prompt and is skipped. Iterating blocks for
+    at most timeout seconds per token and stops when generation ends.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.timeout = timeout
+        self.token_queue = queue.Queue()
+        self._prompt_skipped = False
+
+    def put(self, value):
+        if not self._prompt_skipped:
+            self._prompt_skipped = True
+            return
+        for token_id in value.reshape(-1).tolist():
+            self.token_queue.put(token_id)
+
+    def end(self):
+        self.token_queue.put(None)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> int:
+        token_id = self.token_queue.get(timeout=self.timeout)
+        if token_id is None:
+            raise StopIteration
+        return token_id
+
+
+class CancelGeneration(StoppingCriteria):
+    """Stopping criterion that ends generation once cancel() is called from another thread"""
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self._cancelled.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+class IncrementalSNACDecoder:
+    """
+    Turns a growing stream of 7-token SNAC frames into PCM chunks.
+
+    The SNAC decoder is non-causal, so samples near the edge of a decoded
+    window depend on codes outside it. Each window therefore reaches back
+    context_frames into audio that was already emitted and waits for
+    lookahead_frames of future codes, and only its interior is emitted;
+    consecutive chunks join without clicks. The first chunk is emitted
+    after first_chunk_frames to keep time-to-first-audio low, later ones
+    every chunk_frames to keep decoder calls few.
+    """
+
+    def __init__(
+        self,
+        decode: Callable[[List[int]], np.ndarray],
+        first_chunk_frames: int = 3,
+        chunk_frames: int = 8,
+        context_frames: int = 2,
+        lookahead_frames: int = 2
+    ):
+        self._decode = decode
+        self.first_chunk_frames = first_chunk_frames
+        self.chunk_frames = chunk_frames
+        self.context_frames = context_frames
+        self.lookahead_frames = lookahead_frames
+
+        self.frames: List[List[int]] = []
+        self.emitted_frames = 0
+        self.samples_per_frame: Optional[int] = None
+        self.decode_count = 0
+        self._pending: List[int] = []
+
+    def add_token(self, token_id: int) -> Optional[np.ndarray]:
+        """Add one audio token; returns a PCM chunk when enough frames are ready"""
+        self._pending.append(token_id)
+        if len(self._pending) < SNAC_FRAME_TOKENS:
+            return None
+
+        self.frames.append(self._pending)
+        self._pending = []
+
+        target = self.first_chunk_frames if self.emitted_frames == 0 else self.chunk_frames
+        ready = len(self.frames) - self.lookahead_frames
+        if ready - self.emitted_frames >= target:
+            return self._emit(ready)
+        return None
+
+    def flush(self) -> Optional[np.ndarray]:
+        """Decode every remaining frame (a trailing partial frame is dropped)"""
+        self._pending = []
+        if len(self.frames) > self.emitted_frames:
+            return self._emit(len(self.frames))
+        return None
+
+    def _emit(self, ready: int) -> np.ndarray:
+        start = max(0, self.emitted_frames - self.context_frames)
+        end = min(len(self.frames), ready + self.lookahead_frames)
+
+        audio = self._decode([token_id for frame in self.frames[start:end] for token_id in frame])
+        self.decode_count += 1
+        if self.samples_per_frame is None:
+            self.samples_per_frame = len(audio) // (end - start)
+
+        offset = (self.emitted_frames - start) * self.samples_per_frame
+        chunk = audio[offset:(ready - start) * self.samples_per_frame]
+        self.emitted_frames = ready
+        return chunk
@@ -39,5 +39,24 @@ def test_tts_api():
         print(f"✗ Error: {response.status_code}")
         print(response.text)
 
+def test_tts_audio_response():
+    """Test raw audio and streamed WAV responses"""
+    url = f"http://{TTS_API_HOST}:{TTS_API_PORT}/"
+    
+    for request_data in [
+        {"text": "Good morning! How are you feeling today?", "format": "ogg"},
+        {"text": "Good morning! How are you feeling today?", "format": "wav", "stream": True}
+    ]:
+        print(f"Sending TTS request ({request_data['format']}, stream={request_data.get('stream', False)})...")
+        response = requests.post(url, json=request_data, stream=True)
+        
+        if response.status_code == 200:
+            audio_bytes = b"".join(response.iter_content(chunk_size=None))
+            print(f"✓ Received {len(audio_bytes)} bytes of {response.headers['Content-Type']}")
+        else:
+            print(f"✗ Error: {response.status_code}")
+            print(response.text)
+
 if __name__ == "__main__":
-    test_tts_api()
\ No newline at end of file
+    test_tts_api()
+    test_tts_audio_response()
\ No newline at end of file
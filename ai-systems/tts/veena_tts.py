@@ -3,18 +3,20 @@ Veena TTS System with Built-in API Server
 """
 
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
+from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig, StoppingCriteriaList
 from snac import SNAC
 import soundfile as sf
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, Iterator, Union, Tuple, Dict, Any
 import numpy as np
 import json
+import queue
+import time
 import uuid
 from datetime import datetime
-from http.server import HTTPServer
-import io
+from urllib.parse import urlparse
 import base64
+import itertools
 import threading
 
 # Import shared utilities and config
@@ -22,6 +24,14 @@ import sys
 sys.path.append(str(Path(__file__).parent.parent))
 from config.settings import *
 from utils.api_utils import BaseAPIHandler, get_gpu_info, optimize_for_gpu
+from utils.server import create_api_server
+from utils.uploads import RequestBodyError
+from utils.audio_io import AUDIO_ENCODINGS, encode_audio, audio_content_type, float_to_pcm16, wav_stream_header
+from utils.disk_cache import make_cache_key
+from tts.streaming import AudioTokenStreamer, CancelGeneration, IncrementalSNACDecoder
+from tts.phrase_cache import PhraseCache, normalize_text
+from tts.long_form import split_text, Crossfader, join_utterances
+from conversation.templates import companion_phrases
 
 
 class VeenaTTS:
@@ -35,6 +45,7 @@ class VeenaTTS:
     START_OF_AI_TOKEN = 128261
     END_OF_AI_TOKEN = 128262
     AUDIO_CODE_BASE_OFFSET = 128266
+    SNAC_CODEBOOK_SIZE = 4096
     
     def __init__(self, use_quantization: bool = True, device: str = "auto"):
         """Initialize Veena TTS system"""
@@ -42,6 +53,15 @@ class VeenaTTS:
         self.use_quantization = use_quantization
         self.device = device
         
+        # Serializes model calls between requests and background pre-warming
+        self._generation_lock = threading.Lock()
+        self.phrase_cache = PhraseCache(
+            TTS_PHRASE_CACHE_DIR,
+            max_bytes=TTS_PHRASE_CACHE_MAX_MB * 1024 * 1024,
+            memory_bytes=TTS_PHRASE_CACHE_MEMORY_MB * 1024 * 1024,
+            sample_rate=TTS_SAMPLE_RATE
+        )
+        
         print("Initializing Veena TTS system...")
         optimize_for_gpu()
         self._load_model()
@@ -95,19 +115,11 @@ class VeenaTTS:
         
         print("✓ SNAC decoder loaded")
     
-    def generate_speech(
-        self, 
-        text: str, 
-        speaker: str = TTS_DEFAULT_SPEAKER, 
-        temperature: float = 0.4, 
-        top_p: float = 0.9
-    ) -> np.ndarray:
-        """Generate speech from text"""
+    def _build_prompt(self, text: str, speaker: str) -> List[int]:
+        """Token ids of the speaker-tagged prompt up to the start of speech"""
         if speaker not in TTS_AVAILABLE_SPEAKERS:
             raise ValueError(f"Speaker must be one of {TTS_AVAILABLE_SPEAKERS}")
         
-        print(f"Generating speech with speaker '{speaker}'...")
-        
         # Prepare input with speaker token
         prompt = f"<spk_{speaker}> {text}"
         prompt_tokens = self.tokenizer.encode(prompt, add_special_tokens=False)
@@ -120,76 +132,477 @@ class VeenaTTS:
             self.START_OF_AI_TOKEN,
             self.START_OF_SPEECH_TOKEN
         ]
+        return input_tokens
+    
+    def _generation_kwargs(self, text: str, temperature: float, top_p: float) -> dict:
+        """Sampling settings shared by full and streaming synthesis"""
+        return {
+            "max_new_tokens": min(int(len(text) * 1.3) * 7 + 21, 700),
+            "do_sample": True,
+            "temperature": temperature,
+            "top_p": top_p,
+            "repetition_penalty": 1.05,
+            "pad_token_id": self.tokenizer.pad_token_id,
+            "eos_token_id": [self.END_OF_SPEECH_TOKEN, self.END_OF_AI_TOKEN]
+        }
+    
+    def _phrase_cache_key(self, text: str, speaker: str, temperature: float, top_p: float) -> Optional[str]:
+        """Cache key for a phrase, or None for texts too long to be worth caching"""
+        text = normalize_text(text)
+        if len(text) > TTS_PHRASE_CACHE_MAX_CHARS:
+            return None
+        return make_cache_key("veena", self.model_name, TTS_PHRASE_CACHE_VERSION, text, speaker, temperature, top_p)
+    
+    def _is_audio_token(self, token_id: int) -> bool:
+        return self.AUDIO_CODE_BASE_OFFSET <= token_id < (self.AUDIO_CODE_BASE_OFFSET + 7 * self.SNAC_CODEBOOK_SIZE)
+    
+    def generate_speech(
+        self, 
+        text: str, 
+        speaker: str = TTS_DEFAULT_SPEAKER, 
+        temperature: float = 0.4, 
+        top_p: float = 0.9
+    ) -> np.ndarray:
+        """
+        Generate speech from text
+        
+        Recurring phrases come from the phrase cache; texts longer than
+        TTS_LONG_FORM_CHUNK_CHARS are synthesized in sentence chunks.
+        """
+        if len(split_text(text, TTS_LONG_FORM_CHUNK_CHARS)) > 1:
+            audio = self.generate_speech_batch([(text, speaker)], temperature, top_p)[0]
+            if audio is None:
+                raise ValueError("No audio tokens generated")
+            return audio
+        
+        input_tokens = self._build_prompt(text, speaker)
+        
+        cache_key = self._phrase_cache_key(text, speaker, temperature, top_p)
+        if cache_key:
+            audio = self.phrase_cache.get(cache_key)
+            if audio is not None:
+                print(f"✓ Phrase cache hit for speaker '{speaker}'")
+                return audio
+        
+        print(f"Generating speech with speaker '{speaker}'...")
         
         input_ids = torch.tensor([input_tokens], device=self.model.device)
-        max_tokens = min(int(len(text) * 1.3) * 7 + 21, 700)
         
         # Generate audio tokens
-        with torch.no_grad():
+        with self._generation_lock, torch.no_grad():
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
             
-            output = self.model.generate(
-                input_ids,
-                max_new_tokens=max_tokens,
-                do_sample=True,
-                temperature=temperature,
-                top_p=top_p,
-                repetition_penalty=1.05,
-                pad_token_id=self.tokenizer.pad_token_id,
-                eos_token_id=[self.END_OF_SPEECH_TOKEN, self.END_OF_AI_TOKEN]
-            )
+            output = self.model.generate(input_ids, **self._generation_kwargs(text, temperature, top_p))
             
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
         
         # Extract SNAC tokens
-        generated_ids = output[0][len(input_tokens):].tolist()
-        snac_tokens = [
-            token_id for token_id in generated_ids
-            if self.AUDIO_CODE_BASE_OFFSET <= token_id < (self.AUDIO_CODE_BASE_OFFSET + 7 * 4096)
-        ]
+        generated_ids = output[0, len(input_tokens):]
+        snac_tokens = generated_ids[self._audio_token_mask(generated_ids)]
         
-        if not snac_tokens:
+        if snac_tokens.numel() == 0:
             raise ValueError("No audio tokens generated")
         
         # Decode audio
         audio = self._decode_snac_tokens(snac_tokens)
         print("✓ Speech generated successfully")
         
+        if cache_key:
+            audio = self.phrase_cache.put(cache_key, audio)
         return audio
     
-    def _decode_snac_tokens(self, snac_tokens: List[int]) -> np.ndarray:
-        """De-interleave and decode SNAC tokens to audio"""
-        if not snac_tokens or len(snac_tokens) % 7 != 0:
-            raise ValueError("Invalid SNAC tokens")
-        
-        # De-interleave tokens into 3 hierarchical levels
-        codes_lvl = [[] for _ in range(3)]
-        llm_codebook_offsets = [self.AUDIO_CODE_BASE_OFFSET + i * 4096 for i in range(7)]
-        
-        for i in range(0, len(snac_tokens), 7):
-            codes_lvl[0].append(snac_tokens[i] - llm_codebook_offsets[0])
-            codes_lvl[1].append(snac_tokens[i+1] - llm_codebook_offsets[1])
-            codes_lvl[1].append(snac_tokens[i+4] - llm_codebook_offsets[4])
-            codes_lvl[2].append(snac_tokens[i+2] - llm_codebook_offsets[2])
-            codes_lvl[2].append(snac_tokens[i+3] - llm_codebook_offsets[3])
-            codes_lvl[2].append(snac_tokens[i+5] - llm_codebook_offsets[5])
-            codes_lvl[2].append(snac_tokens[i+6] - llm_codebook_offsets[6])
-        
-        # Convert to tensors for SNAC decoder
-        hierarchical_codes = []
+    def _audio_token_mask(self, token_ids: torch.Tensor) -> torch.Tensor:
+        return (token_ids >= self.AUDIO_CODE_BASE_OFFSET) & (token_ids < self.AUDIO_CODE_BASE_OFFSET + 7 * self.SNAC_CODEBOOK_SIZE)
+    
+    def _snac_offsets(self, device) -> torch.Tensor:
+        """Token id of code 0 for each of the 7 positions in a frame"""
+        return self.AUDIO_CODE_BASE_OFFSET + torch.arange(7, device=device) * self.SNAC_CODEBOOK_SIZE
+    
+    def _codes_in_range(self, codes: torch.Tensor) -> bool:
+        return not ((codes < 0) | (codes >= self.SNAC_CODEBOOK_SIZE)).any()
+    
+    def _deinterleave_snac_tokens(self, snac_tokens: Union[List[int], torch.Tensor]) -> List[torch.Tensor]:
+        """
+        Split interleaved 7-token frames into SNAC's three hierarchical code levels
+        
+        Accepts a token list, a (T,) tensor or a batched (B, T) tensor. Each
+        frame holds 1 level-0, 2 level-1 and 4 level-2 codes at positions
+        [0], [1, 4] and [2, 3, 5, 6]; a trailing partial frame is dropped.
+        Returns int32 tensors of shape (B, N), (B, 2N), (B, 4N) on the SNAC device.
+        """
         snac_device = next(self.snac_model.parameters()).device
+        if not isinstance(snac_tokens, torch.Tensor):
+            # numpy converts Python lists far faster than torch.tensor
+            snac_tokens = torch.from_numpy(np.asarray(snac_tokens, dtype=np.int64))
+        tokens = snac_tokens.to(snac_device)
+        if tokens.dim() == 1:
+            tokens = tokens.unsqueeze(0)
+        
+        batch_size = tokens.shape[0]
+        frame_count = tokens.shape[1] // 7
+        if frame_count == 0:
+            raise ValueError("Invalid SNAC tokens: no complete 7-token frame")
+        
+        frames = tokens[:, :frame_count * 7].reshape(batch_size, frame_count, 7) - self._snac_offsets(snac_device)
+        if not self._codes_in_range(frames):
+            raise ValueError("Invalid SNAC tokens: codes outside their codebook range")
+        frames = frames.to(torch.int32)
+        
+        return [
+            frames[:, :, 0],
+            frames[:, :, [1, 4]].reshape(batch_size, -1),
+            frames[:, :, [2, 3, 5, 6]].reshape(batch_size, -1)
+        ]
+    
+    def _decode_snac_tokens(self, snac_tokens: Union[List[int], torch.Tensor]) -> np.ndarray:
+        """
+        De-interleave and decode SNAC tokens to audio
         
-        for lvl_codes in codes_lvl:
-            tensor = torch.tensor(lvl_codes, dtype=torch.int32, device=snac_device).unsqueeze(0)
-            hierarchical_codes.append(tensor)
+        Returns (samples,) for a single utterance or (batch, samples) for a
+        batched (B, T) token tensor.
+        """
+        batched = isinstance(snac_tokens, torch.Tensor) and snac_tokens.dim() == 2
+        hierarchical_codes = self._deinterleave_snac_tokens(snac_tokens)
         
         # Decode with SNAC
         with torch.no_grad():
             audio_hat = self.snac_model.decode(hierarchical_codes)
         
-        return audio_hat.squeeze().clamp(-1, 1).cpu().numpy()
+        audio = audio_hat[:, 0].clamp(-1, 1).float().cpu().numpy()
+        return audio if batched else audio[0]
+    
+    def stream_speech(
+        self,
+        text: str,
+        speaker: str = TTS_DEFAULT_SPEAKER,
+        temperature: float = 0.4,
+        top_p: float = 0.9
+    ) -> Iterator[np.ndarray]:
+        """
+        Yield float32 audio chunks while the model is still generating
+        
+        model.generate runs on a background thread and pushes tokens into an
+        AudioTokenStreamer; audio tokens are grouped into 7-token frames and
+        decoded in overlapping windows by an IncrementalSNACDecoder, so the
+        first chunk is ready a few frames after prefill instead of after the
+        whole utterance. Closing the generator stops generation. Cached
+        phrases are yielded at once as a single chunk, and long texts go
+        through stream_long_speech.
+        """
+        text_chunks = split_text(text, TTS_LONG_FORM_CHUNK_CHARS)
+        if len(text_chunks) > 1:
+            yield from self.stream_long_speech(text_chunks, speaker, temperature, top_p)
+            return
+        
+        input_tokens = self._build_prompt(text, speaker)
+        
+        cache_key = self._phrase_cache_key(text, speaker, temperature, top_p)
+        if cache_key:
+            audio = self.phrase_cache.get(cache_key)
+            if audio is not None:
+                print(f"✓ Phrase cache hit for speaker '{speaker}'")
+                yield audio
+                return
+        
+        print(f"Streaming speech with speaker '{speaker}'...")
+        
+        input_ids = torch.tensor([input_tokens], device=self.model.device)
+        streamer = AudioTokenStreamer(timeout=STREAM_TOKEN_TIMEOUT)
+        cancel = CancelGeneration()
+        decoder = IncrementalSNACDecoder(
+            self._decode_snac_tokens,
+            first_chunk_frames=TTS_STREAM_FIRST_CHUNK_FRAMES,
+            chunk_frames=TTS_STREAM_CHUNK_FRAMES
+        )
+        generation_error = []
+        
+        def _run_generation():
+            try:
+                with self._generation_lock, torch.no_grad():
+                    self.model.generate(
+                        input_ids,
+                        streamer=streamer,
+                        stopping_criteria=StoppingCriteriaList([cancel]),
+                        **self._generation_kwargs(text, temperature, top_p)
+                    )
+            except Exception as e:
+                generation_error.append(e)
+                streamer.end()
+        
+        generation_thread = threading.Thread(target=_run_generation, daemon=True)
+        generation_thread.start()
+        
+        chunks = []
+        try:
+            for token_id in streamer:
+                if self._is_audio_token(token_id):
+                    chunk = decoder.add_token(token_id)
+                    if chunk is not None:
+                        chunks.append(chunk)
+                        yield chunk
+            
+            if generation_error:
+                raise generation_error[0]
+            
+            chunk = decoder.flush()
+            if chunk is not None:
+                chunks.append(chunk)
+                yield chunk
+            elif decoder.decode_count == 0:
+                raise ValueError("No audio tokens generated")
+        finally:
+            cancel.cancel()
+            generation_thread.join()
+        
+        print(f"✓ Speech streamed in {decoder.decode_count} chunks")
+        if cache_key:
+            self.phrase_cache.put(cache_key, np.concatenate(chunks))
+    
+    def stream_long_speech(
+        self,
+        text_chunks: List[str],
+        speaker: str = TTS_DEFAULT_SPEAKER,
+        temperature: float = 0.4,
+        top_p: float = 0.9
+    ) -> Iterator[np.ndarray]:
+        """
+        Yield audio for a text already split into sentence chunks
+        
+        The first chunk is streamed frame by frame for a fast start while a
+        background thread synthesizes the remaining chunks in batches, so
+        later audio is usually ready before the client needs it. Chunk
+        boundaries are crossfaded.
+        """
+        crossfader = Crossfader(int(TTS_LONG_FORM_CROSSFADE_MS * TTS_SAMPLE_RATE / 1000))
+        remaining = queue.Queue()
+        stopped = threading.Event()
+        
+        def _synthesize_remaining():
+            try:
+                for start in range(1, len(text_chunks), TTS_BATCH_SIZE):
+                    if stopped.is_set():
+                        return
+                    items = [(chunk, speaker) for chunk in text_chunks[start:start + TTS_BATCH_SIZE]]
+                    for audio in self._synthesize_batch(items, temperature, top_p):
+                        remaining.put(audio)
+            except Exception as e:
+                remaining.put(e)
+        
+        # Started once the first chunk is under way, so it cannot take the model first
+        producer = threading.Thread(target=_synthesize_remaining, daemon=True)
+        
+        try:
+            for piece in self.stream_speech(text_chunks[0], speaker, temperature, top_p):
+                first_piece = producer.ident is None
+                if first_piece:
+                    producer.start()
+                ready = crossfader.push(piece, new_utterance=first_piece)
+                if len(ready):
+                    yield ready
+            
+            if producer.ident is None:
+                producer.start()
+            
+            for _ in text_chunks[1:]:
+                audio = remaining.get()
+                if isinstance(audio, Exception):
+                    raise audio
+                if audio is None:
+                    raise ValueError("No audio tokens generated for a sentence chunk")
+                ready = crossfader.push(audio)
+                if len(ready):
+                    yield ready
+            
+            yield crossfader.flush()
+        finally:
+            stopped.set()
+    
+    def generate_speech_batch(
+        self,
+        items: List[Tuple[str, str]],
+        temperature: float = 0.4,
+        top_p: float = 0.9
+    ) -> List[Optional[np.ndarray]]:
+        """
+        Generate speech for many (text, speaker) items with batched model calls
+        
+        Long texts are split into sentence chunks that are synthesized
+        alongside the other items and crossfaded back together. Returns audio
+        per item in input order, or None for items where any chunk produced
+        no audio tokens.
+        """
+        item_chunks = [split_text(text, TTS_LONG_FORM_CHUNK_CHARS) for text, _ in items]
+        chunk_items = [(chunk, speaker) for (_, speaker), chunks in zip(items, item_chunks) for chunk in chunks]
+        chunk_audio = self._synthesize_batch(chunk_items, temperature, top_p)
+        
+        fade_samples = int(TTS_LONG_FORM_CROSSFADE_MS * TTS_SAMPLE_RATE / 1000)
+        results: List[Optional[np.ndarray]] = []
+        position = 0
+        for chunks in item_chunks:
+            pieces = chunk_audio[position:position + len(chunks)]
+            position += len(chunks)
+            if not pieces or any(audio is None for audio in pieces):
+                results.append(None)
+            else:
+                results.append(join_utterances(pieces, fade_samples))
+        return results
+    
+    def _synthesize_batch(
+        self,
+        items: List[Tuple[str, str]],
+        temperature: float,
+        top_p: float
+    ) -> List[Optional[np.ndarray]]:
+        """
+        Synthesize short (text, speaker) items with batched model calls
+        
+        Items are sorted by prompt length and processed TTS_BATCH_SIZE at a
+        time: prompts are left-padded into one generate call, each row is cut
+        at its first end-of-speech token, and the rows' SNAC codes are decoded
+        together. Cached phrases are not synthesized again, and repeated
+        phrases within the list are synthesized once. Returns audio per item
+        in input order, or None for items that produced no audio tokens.
+        """
+        prompts = [self._build_prompt(text, speaker) for text, speaker in items]
+        results: List[Optional[np.ndarray]] = [None] * len(items)
+        
+        # Items sharing a cache key are synthesized once; uncacheable items stand alone
+        pending: Dict[Any, List[int]] = {}
+        for index, (text, speaker) in enumerate(items):
+            cache_key = self._phrase_cache_key(text, speaker, temperature, top_p)
+            cached = self.phrase_cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                results[index] = cached
+            else:
+                pending.setdefault(cache_key or index, []).append(index)
+        
+        groups = list(pending.items())
+        order = sorted(range(len(groups)), key=lambda group: len(prompts[groups[group][1][0]]))
+        
+        print(f"Generating speech for {len(groups)} of {len(items)} items in batches of {TTS_BATCH_SIZE}...")
+        for start in range(0, len(order), TTS_BATCH_SIZE):
+            batch_groups = [groups[group] for group in order[start:start + TTS_BATCH_SIZE]]
+            with self._generation_lock:
+                batch_audio = self._generate_batch(
+                    [prompts[indices[0]] for _, indices in batch_groups],
+                    [items[indices[0]][0] for _, indices in batch_groups],
+                    temperature,
+                    top_p
+                )
+            for (cache_key, indices), audio in zip(batch_groups, batch_audio):
+                if audio is not None and isinstance(cache_key, str):
+                    audio = self.phrase_cache.put(cache_key, audio)
+                for index in indices:
+                    results[index] = audio
+        
+        print(f"✓ Generated speech for {sum(audio is not None for audio in results)}/{len(items)} items")
+        return results
+    
+    def prewarm_phrases(
+        self,
+        texts: List[str],
+        speakers: Optional[List[str]] = None,
+        temperature: float = 0.4,
+        top_p: float = 0.9
+    ) -> dict:
+        """
+        Make sure every (text, speaker) pair is in the phrase cache
+        
+        Cached phrases are loaded into the in-memory tier; missing ones are
+        synthesized in batches. Texts too long to cache are skipped.
+        """
+        items = [(text, speaker) for speaker in (speakers or TTS_PREWARM_SPEAKERS) for text in dict.fromkeys(texts)]
+        missing = []
+        for text, speaker in items:
+            cache_key = self._phrase_cache_key(text, speaker, temperature, top_p)
+            if cache_key and self.phrase_cache.get(cache_key) is None:
+                missing.append((text, speaker))
+        
+        if missing:
+            self.generate_speech_batch(missing, temperature, top_p)
+        print(f"✓ Phrase cache warm: {len(items)} phrases, {len(missing)} newly synthesized")
+        return {"phrases": len(items), "synthesized": len(missing)}
+    
+    def _generate_batch(
+        self,
+        prompts: List[List[int]],
+        texts: List[str],
+        temperature: float,
+        top_p: float
+    ) -> List[Optional[np.ndarray]]:
+        """One left-padded generate call and one batched SNAC decode"""
+        pad_token_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else self.END_OF_AI_TOKEN
+        prompt_length = max(len(prompt) for prompt in prompts)
+        
+        input_ids = torch.full((len(prompts), prompt_length), pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(prompts), prompt_length), dtype=torch.long)
+        for row, prompt in enumerate(prompts):
+            input_ids[row, prompt_length - len(prompt):] = torch.tensor(prompt)
+            attention_mask[row, prompt_length - len(prompt):] = 1
+        
+        # Each row keeps its own single-item token cap; generate runs to the largest
+        row_caps = [self._generation_kwargs(text, temperature, top_p)["max_new_tokens"] for text in texts]
+        generation_kwargs = self._generation_kwargs(texts[0], temperature, top_p)
+        generation_kwargs["max_new_tokens"] = max(row_caps)
+        generation_kwargs["pad_token_id"] = pad_token_id
+        
+        with torch.no_grad():
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            
+            output = self.model.generate(
+                input_ids.to(self.model.device),
+                attention_mask=attention_mask.to(self.model.device),
+                **generation_kwargs
+            )
+            
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        
+        # Cut every row at its first end token (rows that never ended keep everything)
+        generated = output[:, prompt_length:]
+        is_end = (generated == self.END_OF_SPEECH_TOKEN) | (generated == self.END_OF_AI_TOKEN)
+        row_lengths = torch.where(is_end.any(dim=1), is_end.int().argmax(dim=1), generated.shape[1]).tolist()
+        
+        row_tokens = []
+        for row, (length, cap) in enumerate(zip(row_lengths, row_caps)):
+            tokens = generated[row, :min(length, cap)]
+            tokens = tokens[self._audio_token_mask(tokens)]
+            row_tokens.append(tokens[:tokens.numel() - tokens.numel() % 7])
+        
+        return self._decode_snac_batch(row_tokens)
+    
+    def _decode_snac_batch(self, row_tokens: List[torch.Tensor]) -> List[Optional[np.ndarray]]:
+        """
+        Decode several utterances' SNAC tokens in one decoder call
+        
+        Shorter rows are padded to the longest by repeating their last frame
+        (usually trailing silence) and their audio is trimmed back afterwards.
+        Rows without frames or with misaligned codes come back as None.
+        """
+        frame_counts = [tokens.numel() // 7 for tokens in row_tokens]
+        decodable = [
+            row for row, count in enumerate(frame_counts)
+            if count > 0 and self._codes_in_range(row_tokens[row].reshape(-1, 7) - self._snac_offsets(row_tokens[row].device))
+        ]
+        results: List[Optional[np.ndarray]] = [None] * len(row_tokens)
+        if not decodable:
+            return results
+        
+        max_frames = max(frame_counts[row] for row in decodable)
+        padded = []
+        for row in decodable:
+            frames = row_tokens[row].reshape(-1, 7)
+            padding = frames[-1:].expand(max_frames - len(frames), 7)
+            padded.append(torch.cat([frames, padding]).reshape(-1))
+        
+        audio = self._decode_snac_tokens(torch.stack(padded))
+        samples_per_frame = audio.shape[1] // max_frames
+        for batch_row, row in enumerate(decodable):
+            results[row] = audio[batch_row, :frame_counts[row] * samples_per_frame]
+        return results
     
     def text_to_speech(
         self, 
@@ -200,6 +613,41 @@ class VeenaTTS:
     ) -> dict:
         """Convert text to speech and return response"""
         audio = self.generate_speech(text, speaker)
+        return self._speech_response(audio, text, speaker, output_path, return_base64)
+    
+    def text_to_speech_batch(
+        self,
+        items: List[Tuple[str, str]],
+        output_paths: Optional[List[Optional[str]]] = None,
+        return_base64: bool = False
+    ) -> dict:
+        """Convert many (text, speaker) items to speech and return one response per item"""
+        start_time = time.time()
+        batch_audio = self.generate_speech_batch(items)
+        output_paths = output_paths or [None] * len(items)
+        
+        results = []
+        for (text, speaker), audio, output_path in zip(items, batch_audio, output_paths):
+            if audio is None:
+                results.append({"success": False, "speaker": speaker, "error": "No valid audio tokens generated"})
+            else:
+                results.append(self._speech_response(audio, text, speaker, output_path, return_base64))
+        
+        return {
+            "success": True,
+            "count": len(results),
+            "generation_time": round(time.time() - start_time, 3),
+            "results": results
+        }
+    
+    def _speech_response(
+        self,
+        audio: np.ndarray,
+        text: str,
+        speaker: str,
+        output_path: Optional[str],
+        return_base64: bool
+    ) -> dict:
         duration = len(audio) / TTS_SAMPLE_RATE
         
         response = {
@@ -211,11 +659,7 @@ class VeenaTTS:
         }
         
         if return_base64:
-            buffer = io.BytesIO()
-            sf.write(buffer, audio, TTS_SAMPLE_RATE, format='WAV')
-            buffer.seek(0)
-            audio_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-            response["audio_base64"] = audio_base64
+            response["audio_base64"] = base64.b64encode(encode_audio(audio, TTS_SAMPLE_RATE, "wav")).decode('utf-8')
         
         if output_path:
             Path(output_path).parent.mkdir(parents=True, exist_ok=True)
@@ -226,14 +670,29 @@ class VeenaTTS:
 
 
 class TTSRequestHandler(BaseAPIHandler):
-    """HTTP request handler for TTS API"""
+    """
+    HTTP request handler for TTS API
+    
+    "format" selects the response body: "json" (default, optional
+    audio_base64) or raw "wav", "ogg" or "opus" audio. With "stream": true
+    and format "wav", PCM is sent in chunks as soon as it is synthesized.
+    """
+    
+    # /prewarm only starts a background thread
+    unthrottled_paths = ("/health", "/prewarm")
     
     def do_POST(self):
         """Handle POST requests"""
         try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            request_data = json.loads(post_data.decode('utf-8'))
+            request_data = self.read_json_body()
+            
+            endpoint = urlparse(self.path).path
+            if endpoint == '/batch':
+                self._handle_batch(request_data)
+                return
+            if endpoint == '/prewarm':
+                self._handle_prewarm(request_data)
+                return
             
             # Extract parameters
             text = request_data.get('text', '').strip()
@@ -244,12 +703,22 @@ class TTSRequestHandler(BaseAPIHandler):
             speaker = request_data.get('speaker', TTS_DEFAULT_SPEAKER)
             return_base64 = request_data.get('return_base64', True)
             save_file = request_data.get('save_file', False)
+            response_format = request_data.get('format', 'json')
+            stream = request_data.get('stream', False)
             
             # Validate speaker
             if speaker not in TTS_AVAILABLE_SPEAKERS:
                 self.send_error_response(400, f"Invalid speaker. Supported: {TTS_AVAILABLE_SPEAKERS}")
                 return
             
+            if response_format != 'json' and response_format not in AUDIO_ENCODINGS:
+                self.send_error_response(400, f"Invalid format. Supported: {['json', *AUDIO_ENCODINGS]}")
+                return
+            
+            if stream and response_format != 'wav':
+                self.send_error_response(400, "Streaming is only supported with format 'wav'")
+                return
+            
             # Generate speech
             output_path = None
             if save_file:
@@ -257,6 +726,14 @@ class TTSRequestHandler(BaseAPIHandler):
                 audio_id = str(uuid.uuid4())[:8]
                 output_path = GENERATED_AUDIO_DIR / f"tts_{speaker}_{timestamp}_{audio_id}.wav"
             
+            if stream:
+                self._stream_audio(text, speaker, output_path)
+                return
+            
+            if response_format != 'json':
+                self._send_audio(text, speaker, response_format, output_path)
+                return
+            
             response = tts_instance.text_to_speech(
                 text=text,
                 speaker=speaker,
@@ -266,10 +743,130 @@ class TTSRequestHandler(BaseAPIHandler):
             
             self.send_json_response(response)
             
+        except RequestBodyError as e:
+            self.send_error_response(e.status_code, str(e))
         except Exception as e:
             print(f"Error handling request: {e}")
             self.send_error_response(500, f"Internal server error: {str(e)}")
     
+    def _handle_batch(self, request_data):
+        """
+        Synthesize a list of {"text", "speaker"} items in batched model calls
+        
+        Returns one text_to_speech-style result per item, in order.
+        """
+        items = request_data.get('items')
+        if not isinstance(items, list) or not items:
+            self.send_error_response(400, "items must be a non-empty list of {text, speaker}")
+            return
+        if len(items) > TTS_MAX_BATCH_ITEMS:
+            self.send_error_response(400, f"At most {TTS_MAX_BATCH_ITEMS} items per batch")
+            return
+        
+        batch_items = []
+        for position, item in enumerate(items):
+            text = str(item.get('text', '')).strip() if isinstance(item, dict) else ''
+            if not text:
+                self.send_error_response(400, f"Item {position}: text is required")
+                return
+            speaker = item.get('speaker', TTS_DEFAULT_SPEAKER)
+            if speaker not in TTS_AVAILABLE_SPEAKERS:
+                self.send_error_response(400, f"Item {position}: invalid speaker. Supported: {TTS_AVAILABLE_SPEAKERS}")
+                return
+            batch_items.append((text, speaker))
+        
+        output_paths = None
+        if request_data.get('save_file', False):
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_paths = [
+                str(GENERATED_AUDIO_DIR / f"tts_{speaker}_{timestamp}_{str(uuid.uuid4())[:8]}.wav")
+                for _, speaker in batch_items
+            ]
+        
+        response = tts_instance.text_to_speech_batch(
+            batch_items,
+            output_paths=output_paths,
+            return_base64=request_data.get('return_base64', True)
+        )
+        self.send_json_response(response)
+    
+    def _handle_prewarm(self, request_data):
+        """
+        Cache phrases in the background: {"texts": [...], "patient_names": [...], "speakers": [...]}
+        
+        patient_names adds the companion's personalized greetings for each name.
+        """
+        texts = request_data.get('texts', [])
+        patient_names = request_data.get('patient_names', [])
+        speakers = request_data.get('speakers') or TTS_PREWARM_SPEAKERS
+        
+        if not isinstance(texts, list) or not isinstance(patient_names, list):
+            self.send_error_response(400, "texts and patient_names must be lists")
+            return
+        invalid = [speaker for speaker in speakers if speaker not in TTS_AVAILABLE_SPEAKERS]
+        if invalid:
+            self.send_error_response(400, f"Invalid speakers {invalid}. Supported: {TTS_AVAILABLE_SPEAKERS}")
+            return
+        
+        phrases = [str(text).strip() for text in texts if str(text).strip()]
+        if patient_names:
+            phrases += companion_phrases([str(name) for name in patient_names])
+        if not phrases:
+            self.send_error_response(400, "Nothing to prewarm: provide texts or patient_names")
+            return
+        
+        threading.Thread(
+            target=tts_instance.prewarm_phrases,
+            args=(phrases, speakers),
+            daemon=True
+        ).start()
+        self.send_json_response({"success": True, "queued_phrases": len(phrases) * len(speakers)}, 202)
+    
+    def _audio_headers(self, speaker: str, duration: Optional[float] = None) -> dict:
+        headers = {"X-Sample-Rate": str(TTS_SAMPLE_RATE), "X-Speaker": speaker}
+        if duration is not None:
+            headers["X-Audio-Duration"] = f"{duration:.3f}"
+        return headers
+    
+    def _send_audio(self, text: str, speaker: str, response_format: str, output_path: Optional[Path]):
+        """Respond with the encoded audio file itself"""
+        audio = tts_instance.generate_speech(text, speaker)
+        if output_path:
+            sf.write(str(output_path), audio, TTS_SAMPLE_RATE)
+        
+        self.send_binary_response(
+            encode_audio(audio, TTS_SAMPLE_RATE, response_format),
+            audio_content_type(response_format),
+            headers=self._audio_headers(speaker, len(audio) / TTS_SAMPLE_RATE)
+        )
+    
+    def _stream_audio(self, text: str, speaker: str, output_path: Optional[Path]):
+        """Respond with a WAV stream, writing PCM16 chunks as they are synthesized"""
+        chunks = tts_instance.stream_speech(text, speaker)
+        try:
+            # Failures before the first chunk are still reported as JSON errors
+            first_chunk = next(chunks)
+            
+            self.send_chunked_headers('audio/wav', headers=self._audio_headers(speaker))
+            self.send_chunk(wav_stream_header(TTS_SAMPLE_RATE))
+            
+            pieces = []
+            try:
+                for chunk in itertools.chain([first_chunk], chunks):
+                    self.send_chunk(float_to_pcm16(chunk))
+                    pieces.append(chunk)
+            except Exception as e:
+                # Headers are out; drop the connection so the client sees a truncated stream
+                print(f"Error while streaming audio: {e}")
+                self.close_connection = True
+                return
+            self.end_chunked_response()
+            
+            if output_path:
+                sf.write(str(output_path), np.concatenate(pieces), TTS_SAMPLE_RATE)
+        finally:
+            chunks.close()
+    
     def do_GET(self):
         """Handle GET requests"""
         if self.path == '/health':
@@ -277,6 +874,8 @@ class TTSRequestHandler(BaseAPIHandler):
                 "status": "healthy",
                 "service": "Veena TTS",
                 "supported_speakers": TTS_AVAILABLE_SPEAKERS,
+                "phrase_cache": tts_instance.phrase_cache.get_stats(),
+                "server": self.server_stats(),
                 "gpu_info": get_gpu_info()
             }
             self.send_json_response(response)
@@ -293,15 +892,25 @@ def initialize_tts():
     print("Initializing TTS system...")
     tts_instance = VeenaTTS()
     print("✓ TTS system initialized")
+    
+    if TTS_PREWARM_ON_STARTUP:
+        # Template phrases are synthesized in the background while the server starts
+        threading.Thread(
+            target=tts_instance.prewarm_phrases,
+            args=(companion_phrases(),),
+            daemon=True
+        ).start()
 
 def start_server():
     """Start the TTS server"""
     server_address = (TTS_API_HOST, TTS_API_PORT)
-    httpd = HTTPServer(server_address, TTSRequestHandler)
+    httpd = create_api_server(server_address, TTSRequestHandler, max_active=TTS_MAX_CONCURRENT_REQUESTS)
     
     print(f"TTS Server running on http://{TTS_API_HOST}:{TTS_API_PORT}")
     print("Endpoints:")
-    print("  POST / - Generate TTS")
+    print("  POST / - Generate TTS (format: json|wav|ogg|opus, stream: true for chunked wav)")
+    print("  POST /batch - Generate TTS for a list of {text, speaker} items")
+    print("  POST /prewarm - Cache phrases / patient greetings in the background")
     print("  GET /health - Health check")
     
     try:
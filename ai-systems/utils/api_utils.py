@@ -3,26 +3,269 @@ Shared API utilities for all AI systems
 """
 
 import json
+import functools
 import torch
 from datetime import datetime
 from http.server import BaseHTTPRequestHandler
-from typing import Dict, Any
+from urllib.parse import urlparse, parse_qs
+from typing import Dict, Any, Optional, Iterator, Tuple
+
+from config.settings import (
+    MAX_REQUEST_BODY_MB, UPLOAD_SPOOL_MB, API_REQUEST_TIMEOUT,
+    API_COMPRESSION_MIN_BYTES, API_COMPRESSION_LEVEL
+)
+from utils.uploads import RequestBodyError, UploadedFile, MultipartParser, decode_form_value, iter_chunked
+from utils.server import ServerOverloaded
+from utils.responses import encode_json, negotiate_encoding, is_compressible, compress_body
+
+
+def _with_admission(method):
+    """
+    Wrap a do_<METHOD> handler so expensive requests take a worker slot
+    from the server's RequestLimiter, answering 429 when none is free
+    """
+    @functools.wraps(method)
+    def wrapped(self):
+        self._body_consumed = False
+        limiter = getattr(self.server, 'limiter', None)
+        path = urlparse(self.path).path
+        
+        try:
+            if limiter is None or self.command not in self.throttled_methods or path in self.unthrottled_paths:
+                method(self)
+                return
+            
+            try:
+                limiter.acquire()
+            except ServerOverloaded as e:
+                self.close_connection = True
+                self.send_json_response(
+                    {"error": str(e), "timestamp": datetime.now().isoformat(), "status_code": 429},
+                    429,
+                    headers={'Retry-After': '1'}
+                )
+                return
+            
+            try:
+                method(self)
+            finally:
+                limiter.release()
+        finally:
+            # A body left unread would be parsed as the next keep-alive request
+            has_body = self.headers.get('Content-Length', '0') != '0' or 'Transfer-Encoding' in self.headers
+            if has_body and not self._body_consumed:
+                self.close_connection = True
+    
+    wrapped._admission_wrapped = True
+    return wrapped
 
 
 class BaseAPIHandler(BaseHTTPRequestHandler):
     """Base API handler with common functionality"""
     
-    def send_json_response(self, data: Dict[str, Any], status_code: int = 200):
-        """Send JSON response"""
-        response_json = json.dumps(data, indent=2, ensure_ascii=False)
+    # Keep-alive connections; idle or stalled sockets time out
+    protocol_version = "HTTP/1.1"
+    timeout = API_REQUEST_TIMEOUT
+    
+    # Requests that take a worker slot when served by utils.server.APIServer
+    throttled_methods = ("POST",)
+    unthrottled_paths = ("/health",)
+    
+    # Per-handler limits; services with large uploads raise max_body_bytes
+    max_body_bytes = MAX_REQUEST_BODY_MB * 1024 * 1024
+    upload_spool_bytes = UPLOAD_SPOOL_MB * 1024 * 1024
+    body_chunk_size = 64 * 1024
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name in ("do_GET", "do_POST"):
+            method = cls.__dict__.get(name)
+            if method is not None and not getattr(method, '_admission_wrapped', False):
+                setattr(cls, name, _with_admission(method))
+    
+    def server_stats(self) -> Dict[str, Any]:
+        """Worker pool usage of the serving APIServer (empty for plain servers)"""
+        get_stats = getattr(self.server, 'get_stats', None)
+        return get_stats() if get_stats else {}
+    
+    def iter_body(self) -> Iterator[bytes]:
+        """
+        Yield the request body in chunks as it arrives
+        
+        Handles Content-Length and chunked transfer encoding, and raises
+        RequestBodyError(413) as soon as max_body_bytes is exceeded.
+        """
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            chunks = iter_chunked(self.rfile, self.body_chunk_size)
+        else:
+            try:
+                content_length = int(self.headers.get('Content-Length', 0))
+            except ValueError:
+                raise RequestBodyError(400, "Invalid Content-Length")
+            if content_length > self.max_body_bytes:
+                self.close_connection = True
+                raise RequestBodyError(413, f"Request body exceeds {self.max_body_bytes} bytes")
+            chunks = self._iter_fixed_length(content_length)
+        
+        received = 0
+        for chunk in chunks:
+            received += len(chunk)
+            if received > self.max_body_bytes:
+                # The rest of the body is never read, so the connection cannot be reused
+                self.close_connection = True
+                raise RequestBodyError(413, f"Request body exceeds {self.max_body_bytes} bytes")
+            yield chunk
+        self._body_consumed = True
+    
+    def _iter_fixed_length(self, content_length: int) -> Iterator[bytes]:
+        remaining = content_length
+        while remaining > 0:
+            chunk = self.rfile.read(min(self.body_chunk_size, remaining))
+            if not chunk:
+                raise RequestBodyError(400, "Request body ended early")
+            remaining -= len(chunk)
+            yield chunk
+    
+    def read_body(self) -> bytes:
+        """Whole request body as bytes (size-limited)"""
+        return b"".join(self.iter_body())
+    
+    def read_json_body(self) -> Dict[str, Any]:
+        """Request body parsed as JSON ({} when empty)"""
+        body = self.read_body()
+        if not body:
+            return {}
+        try:
+            return json.loads(body.decode('utf-8'))
+        except ValueError as e:
+            raise RequestBodyError(400, f"Invalid JSON body: {e}")
+    
+    def read_upload_request(self) -> Tuple[Dict[str, Any], Dict[str, UploadedFile]]:
+        """
+        Read a request that may carry files, without buffering it whole
+        
+        - multipart/form-data: file parts are spooled, other parts become fields
+        - application/octet-stream, audio/*, image/*, video/*: the body is the
+          single file "file"; fields come from the query string and the
+          filename from an X-Filename header
+        - anything else is parsed as JSON fields
+        
+        Form and query values are JSON-decoded when possible.
+        
+        Returns:
+            (fields, files)
+        """
+        content_type = self.headers.get('Content-Type', '')
+        media_type = content_type.split(';')[0].strip().lower()
+        
+        if media_type == 'multipart/form-data':
+            boundary = dict(
+                param.strip().split('=', 1) for param in content_type.split(';')[1:] if '=' in param
+            ).get('boundary', '').strip('"')
+            if not boundary:
+                raise RequestBodyError(400, "multipart/form-data without a boundary")
+            
+            parser = MultipartParser(boundary, self.upload_spool_bytes)
+            for chunk in self.iter_body():
+                parser.feed(chunk)
+            parser.close()
+            return {key: decode_form_value(value) for key, value in parser.fields.items()}, parser.files
+        
+        if media_type == 'application/octet-stream' or media_type.split('/')[0] in ('audio', 'image', 'video'):
+            upload = UploadedFile(self.headers.get('X-Filename'), media_type, self.upload_spool_bytes)
+            for chunk in self.iter_body():
+                upload.write(chunk)
+            fields = {
+                key: decode_form_value(values[-1])
+                for key, values in parse_qs(urlparse(self.path).query).items()
+            }
+            return fields, {"file": upload}
+        
+        return self.read_json_body(), {}
+    
+    def send_json_response(self, data: Dict[str, Any], status_code: int = 200, headers: Optional[Dict[str, str]] = None):
+        """Send compact JSON response (compressed when the client accepts it)"""
+        self.send_binary_response(
+            encode_json(data),
+            'application/json; charset=utf-8',
+            status_code,
+            headers=headers
+        )
+    
+    def send_binary_response(
+        self,
+        body: bytes,
+        content_type: str,
+        status_code: int = 200,
+        headers: Optional[Dict[str, str]] = None,
+        compress: Optional[bool] = None
+    ):
+        """
+        Send a complete body as-is, e.g. audio/wav instead of base64 inside JSON
+        
+        compress defaults to compressing text-like content types when the
+        client's Accept-Encoding allows gzip or deflate.
+        """
+        if compress is None:
+            compress = is_compressible(content_type)
+        
+        content_encoding = None
+        if compress:
+            encoding = negotiate_encoding(self.headers.get('Accept-Encoding'))
+            body, content_encoding = compress_body(body, encoding, API_COMPRESSION_MIN_BYTES, API_COMPRESSION_LEVEL)
+        
         self.send_response(status_code)
-        self.send_header('Content-type', 'application/json; charset=utf-8')
+        self.send_header('Content-type', content_type)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.send_header('Content-length', len(response_json.encode('utf-8')))
+        if compress:
+            self.send_header('Vary', 'Accept-Encoding')
+        if content_encoding:
+            self.send_header('Content-Encoding', content_encoding)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-length', len(body))
         self.end_headers()
-        self.wfile.write(response_json.encode('utf-8'))
+        self.wfile.write(body)
+    
+    def send_chunked_headers(self, content_type: str, status_code: int = 200, headers: Optional[Dict[str, str]] = None):
+        """
+        Start a response whose body is written piece by piece with send_chunk
+        
+        Uses chunked transfer encoding so the connection stays reusable;
+        HTTP/1.0 clients get a close-delimited body instead.
+        """
+        self._chunked = self.request_version != 'HTTP/1.0'
+        self.send_response(status_code)
+        self.send_header('Content-type', content_type)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('X-Accel-Buffering', 'no')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if self._chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+    
+    def send_chunk(self, data: bytes):
+        """Write and flush one piece of a response started with send_chunked_headers"""
+        if not data:
+            return
+        if self._chunked:
+            self.wfile.write(b"%X\r\n" % len(data) + data + b"\r\n")
+        else:
+            self.wfile.write(data)
+        self.wfile.flush()
+    
+    def end_chunked_response(self):
+        """Terminate a chunked response"""
+        if self._chunked:
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
     
     def send_error_response(self, code: int, message: str):
         """Send error response"""
@@ -32,13 +275,33 @@ class BaseAPIHandler(BaseHTTPRequestHandler):
             "status_code": code
         }
         self.send_json_response(error_response, code)
-    
+
+    def send_sse_headers(self, status_code: int = 200):
+        """Start a server-sent events response (body streamed until connection close)"""
+        self.send_response(status_code)
+        self.send_header('Content-type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.send_header('X-Accel-Buffering', 'no')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.close_connection = True
+
+    def send_sse_event(self, data: Dict[str, Any], event: Optional[str] = None):
+        """Write a single server-sent event and flush it to the client"""
+        message = ""
+        if event:
+            message += f"event: {event}\n"
+        self.wfile.write(message.encode('utf-8') + b"data: " + encode_json(data) + b"\n\n")
+        self.wfile.flush()
+
     def do_OPTIONS(self):
         """Handle CORS preflight requests"""
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
     def log_message(self, format, *args):
@@ -0,0 +1,140 @@
+"""
+In-memory audio decoding and encoding shared by AI systems
+Turns uploaded audio bytes into the float32 16 kHz mono arrays models expect,
+and generated audio into WAV/OGG bodies for API responses
+"""
+
+import io
+import struct
+import subprocess
+from math import gcd
+from typing import Optional, Tuple
+
+import numpy as np
+import soundfile as sf
+
+try:
+    from scipy.signal import resample_poly
+except ImportError:
+    resample_poly = None
+
+
+WHISPER_SAMPLE_RATE = 16000
+
+# Containers libsndfile reads directly; everything else goes through ffmpeg
+SOUNDFILE_FORMATS = {"wav", "flac", "ogg", "oga", "aiff", "aif"}
+
+# Response formats: name -> (libsndfile format, subtype, content type)
+AUDIO_ENCODINGS = {
+    "wav": ("WAV", "PCM_16", "audio/wav"),
+    "ogg": ("OGG", "VORBIS", "audio/ogg"),
+    "opus": ("OGG", "OPUS", "audio/ogg; codecs=opus")
+}
+
+
+def decode_audio_bytes(
+    audio_bytes: bytes,
+    format: Optional[str] = None,
+    target_sample_rate: int = WHISPER_SAMPLE_RATE
+) -> np.ndarray:
+    """
+    Decode encoded audio held in memory to float32 mono at target_sample_rate
+
+    wav/flac/ogg are read with soundfile over a BytesIO; other formats
+    (mp3, m4a, webm, ...) or files soundfile rejects are piped through an
+    ffmpeg subprocess, which also resamples and downmixes. Nothing is
+    written to disk.
+    """
+    format = (format or "").lower().lstrip(".")
+
+    if format in SOUNDFILE_FORMATS or not format:
+        try:
+            audio, sample_rate = read_with_soundfile(audio_bytes)
+            return resample(to_mono(audio), sample_rate, target_sample_rate)
+        except RuntimeError:
+            pass
+
+    return decode_with_ffmpeg(audio_bytes, target_sample_rate)
+
+
+def read_with_soundfile(audio_bytes: bytes) -> Tuple[np.ndarray, int]:
+    """(frames, channels) float32 samples and sample rate from in-memory bytes"""
+    audio, sample_rate = sf.read(io.BytesIO(audio_bytes), dtype="float32", always_2d=True)
+    return audio, sample_rate
+
+
+def decode_with_ffmpeg(audio_bytes: bytes, target_sample_rate: int = WHISPER_SAMPLE_RATE) -> np.ndarray:
+    """
+    Decode any ffmpeg-readable audio from stdin to float32 mono on stdout
+
+    Note that MP4/M4A files whose index (moov atom) sits at the end cannot be
+    decoded from a pipe; clients should upload them with faststart enabled.
+    """
+    command = [
+        "ffmpeg", "-nostdin", "-loglevel", "error",
+        "-i", "pipe:0",
+        "-f", "f32le", "-acodec", "pcm_f32le",
+        "-ac", "1", "-ar", str(target_sample_rate),
+        "pipe:1"
+    ]
+    process = subprocess.run(command, input=audio_bytes, capture_output=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode audio: {process.stderr.decode(errors='ignore').strip()}")
+    return np.frombuffer(process.stdout, dtype=np.float32)
+
+
+def to_mono(audio: np.ndarray) -> np.ndarray:
+    """Average (frames, channels) audio down to one float32 channel"""
+    if audio.ndim == 1:
+        return audio.astype(np.float32, copy=False)
+    if audio.shape[1] == 1:
+        return np.ascontiguousarray(audio[:, 0], dtype=np.float32)
+    return audio.mean(axis=1, dtype=np.float32)
+
+
+def resample(audio: np.ndarray, orig_sample_rate: int, target_sample_rate: int) -> np.ndarray:
+    """Polyphase resampling of mono float32 audio (linear interpolation without scipy)"""
+    if orig_sample_rate == target_sample_rate or len(audio) == 0:
+        return audio.astype(np.float32, copy=False)
+
+    if resample_poly is not None:
+        divisor = gcd(orig_sample_rate, target_sample_rate)
+        up, down = target_sample_rate // divisor, orig_sample_rate // divisor
+        return resample_poly(audio, up, down).astype(np.float32)
+
+    target_length = int(round(len(audio) * target_sample_rate / orig_sample_rate))
+    positions = np.arange(target_length, dtype=np.float64) * (orig_sample_rate / target_sample_rate)
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+
+
+def encode_audio(audio: np.ndarray, sample_rate: int, format: str = "wav") -> bytes:
+    """Encode float32 mono audio as a complete wav (16-bit PCM), ogg (Vorbis) or opus file"""
+    sf_format, subtype, _ = AUDIO_ENCODINGS[format]
+    buffer = io.BytesIO()
+    sf.write(buffer, audio, sample_rate, format=sf_format, subtype=subtype)
+    return buffer.getvalue()
+
+
+def audio_content_type(format: str) -> str:
+    return AUDIO_ENCODINGS[format][2]
+
+
+def float_to_pcm16(audio: np.ndarray) -> bytes:
+    """Little-endian signed 16-bit PCM bytes from float32 samples in [-1, 1]"""
+    return (np.clip(audio, -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
+
+
+def wav_stream_header(sample_rate: int, channels: int = 1) -> bytes:
+    """
+    WAV header for a 16-bit PCM stream of unknown length
+
+    The RIFF and data sizes are set to the maximum, which browsers and
+    ffmpeg treat as "read until end of stream", so PCM16 chunks can be
+    sent as soon as they are synthesized.
+    """
+    byte_rate = sample_rate * channels * 2
+    return (
+        b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, byte_rate, channels * 2, 16)
+        + b"data" + struct.pack("<I", 0xFFFFFFFF)
+    )
@@ -0,0 +1,151 @@
+"""
+Size-bounded on-disk LRU cache shared by AI systems
+Values are stored as one file per key; least recently used files are evicted
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+
+def content_hash(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's bytes, read in chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_cache_key(*parts: Any) -> str:
+    """Stable hex key for any JSON-serializable parts (hashes, model names, settings, ...)"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    Persistent key -> bytes store bounded by total size.
+
+    Entries live under <directory>/<key[:2]>/<key>. Recency is kept in file
+    modification times, so LRU order survives restarts; the index is rebuilt
+    from a directory scan at startup. Writes go through a temporary file and
+    an atomic rename, so readers never see partial values.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # key -> size, oldest first
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._scan()
+
+    def _scan(self):
+        """Rebuild the LRU index from files already on disk"""
+        found = []
+        for shard in self.directory.iterdir():
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard):
+                if entry.name.endswith(".tmp"):
+                    os.unlink(entry.path)
+                    continue
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name, stat.st_size))
+
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Cached bytes for key, or None"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            now = time.time()
+            os.utime(path, (now, now))
+            return data
+        except FileNotFoundError:
+            with self._lock:
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self._total_bytes -= size
+            return None
+
+    def put(self, key: str, data: bytes):
+        """Store bytes for key, evicting least recently used entries over budget"""
+        if len(data) > self.max_bytes:
+            return
+
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        temp_path = path.with_name(f"{key}.{threading.get_ident()}.tmp")
+        temp_path.write_bytes(data)
+        temp_path.replace(path)
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def get_json(self, key: str) -> Optional[Any]:
+        data = self.get(key)
+        return json.loads(data) if data is not None else None
+
+    def put_json(self, key: str, value: Any):
+        self.put(key, json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+
+    def delete(self, key: str):
+        with self._lock:
+            size = self._entries.pop(key, None)
+            if size is not None:
+                self._total_bytes -= size
+        self._path(key).unlink(missing_ok=True)
+
+    def _evict(self):
+        """Drop oldest entries until under budget (caller holds the lock or is the constructor)"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            self._path(key).unlink(missing_ok=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Cache usage statistics for health reporting"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "cached_mb": round(self._total_bytes / (1024**2), 2),
+                "budget_mb": round(self.max_bytes / (1024**2), 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,264 @@
+"""
+Background job queue shared by AI systems
+Runs long analyses on a worker pool and persists their results to disk
+"""
+
+import json
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, Any, Callable, List
+
+import requests
+
+
+JOB_PENDING = "pending"
+JOB_PROCESSING = "processing"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class JobQueue:
+    """
+    Worker-pool job queue with status, progress and persisted results.
+
+    A job function is called as func(report_progress, **params), where
+    report_progress(stage, progress) updates the job's stage name and its
+    0..1 progress. Its return value is written to <results_dir>/<job_id>.json;
+    an optional summarize(result) dict is kept on the job record itself.
+    Every status change is optionally POSTed to a callback URL so callers
+    (e.g. the backend's MemoryUpload status) can follow along. Callbacks are
+    sent in order by a single notifier thread, so a slow callback never
+    delays submit() or a worker, and "pending" always precedes "processing".
+    Finished jobs are forgotten retention_seconds after they end (their
+    result files stay on disk); None keeps them for the queue's lifetime.
+    """
+
+    def __init__(
+        self,
+        num_workers: int = 2,
+        results_dir: Optional[Path] = None,
+        callback_url: Optional[str] = None,
+        callback_headers: Optional[Dict[str, str]] = None,
+        max_pending: int = 0,
+        retention_seconds: Optional[float] = None
+    ):
+        self.num_workers = num_workers
+        self.results_dir = Path(results_dir) if results_dir else None
+        self.callback_url = callback_url
+        self.callback_headers = callback_headers or {}
+        self.retention_seconds = retention_seconds
+
+        if self.results_dir:
+            self.results_dir.mkdir(parents=True, exist_ok=True)
+
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=max_pending)
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._functions: Dict[str, Callable] = {}
+        self._finished: "deque[tuple]" = deque()  # (monotonic finish time, job_id) in finish order
+        self._lock = threading.Lock()
+
+        self._notifications: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self._notifier = None
+        if self.callback_url:
+            self._notifier = threading.Thread(target=self._notifier_loop, daemon=True, name="job-notifier")
+            self._notifier.start()
+
+        self._workers = [
+            threading.Thread(target=self._worker_loop, daemon=True, name=f"job-worker-{i}")
+            for i in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(
+        self,
+        job_type: str,
+        func: Callable,
+        params: Optional[Dict[str, Any]] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        summarize: Optional[Callable[[Any], Dict[str, Any]]] = None
+    ) -> str:
+        """Queue a job and return its id immediately (raises queue.Full when at capacity)"""
+        job_id = str(uuid.uuid4())
+        job = {
+            "job_id": job_id,
+            "job_type": job_type,
+            "status": JOB_PENDING,
+            "stage": "queued",
+            "progress": 0.0,
+            "metadata": metadata or {},
+            "created_at": datetime.now().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "result_path": None,
+            "summary": None,
+            "error": None
+        }
+
+        with self._lock:
+            self._prune_finished()
+            self._jobs[job_id] = job
+            self._functions[job_id] = (
+                lambda report_progress: func(report_progress, **(params or {})),
+                summarize
+            )
+
+            # Queued under the lock: a worker can only report "processing" after this
+            try:
+                self._queue.put_nowait(job_id)
+            except queue.Full:
+                del self._jobs[job_id]
+                del self._functions[job_id]
+                raise
+            self._notify(job)
+
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Snapshot of a job's status and progress"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def get_result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Load a finished job's result from disk (None if not done)"""
+        job = self.get_job(job_id)
+        if not job or job["status"] != JOB_DONE:
+            return None
+
+        if job.get("result") is not None:
+            return job["result"]
+
+        with open(job["result_path"], "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def list_jobs(self, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """All known jobs, optionally filtered by status"""
+        with self._lock:
+            jobs = [dict(job) for job in self._jobs.values()]
+        if status:
+            jobs = [job for job in jobs if job["status"] == status]
+        return jobs
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth and job counts for health reporting"""
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {
+            "workers": self.num_workers,
+            "queue_depth": self._queue.qsize(),
+            "jobs": counts
+        }
+
+    def _prune_finished(self):
+        """Drop finished jobs older than the retention period (caller holds the lock)"""
+        if self.retention_seconds is None:
+            return
+
+        cutoff = time.monotonic() - self.retention_seconds
+        while self._finished and self._finished[0][0] < cutoff:
+            _, job_id = self._finished.popleft()
+            self._jobs.pop(job_id, None)
+
+    def _update(self, job_id: str, **fields) -> Dict[str, Any]:
+        with self._lock:
+            self._jobs[job_id].update(fields)
+            return dict(self._jobs[job_id])
+
+    def _worker_loop(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                break
+
+            with self._lock:
+                func, summarize = self._functions.pop(job_id)
+
+            job = self._update(
+                job_id,
+                status=JOB_PROCESSING,
+                stage="starting",
+                started_at=datetime.now().isoformat()
+            )
+            self._notify(job)
+
+            def report_progress(stage: str, progress: float, _job_id=job_id):
+                self._update(_job_id, stage=stage, progress=round(min(max(progress, 0.0), 1.0), 3))
+
+            try:
+                result = func(report_progress)
+                result_fields = self._store_result(job_id, result)
+                if summarize:
+                    result_fields["summary"] = summarize(result)
+                job = self._update(
+                    job_id,
+                    status=JOB_DONE,
+                    stage="done",
+                    progress=1.0,
+                    finished_at=datetime.now().isoformat(),
+                    **result_fields
+                )
+            except Exception as e:
+                print(f"❌ Job {job_id} failed: {e}")
+                job = self._update(
+                    job_id,
+                    status=JOB_FAILED,
+                    stage="failed",
+                    finished_at=datetime.now().isoformat(),
+                    error=str(e)
+                )
+
+            with self._lock:
+                self._finished.append((time.monotonic(), job_id))
+                self._prune_finished()
+
+            self._notify(job)
+            self._queue.task_done()
+
+    def _store_result(self, job_id: str, result: Any) -> Dict[str, Any]:
+        """Persist a result; kept in memory only when no results directory is configured"""
+        if not self.results_dir:
+            return {"result": result}
+
+        result_path = self.results_dir / f"{job_id}.json"
+        temp_path = result_path.with_suffix(".json.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, default=str)
+        temp_path.replace(result_path)
+        return {"result_path": str(result_path)}
+
+    def _notify(self, job: Dict[str, Any]):
+        """Queue a status change for the callback URL"""
+        if self._notifier is None:
+            return
+
+        self._notifications.put({key: value for key, value in job.items() if key != "result"})
+
+    def _notifier_loop(self):
+        """POST queued status changes in order (best effort)"""
+        while True:
+            payload = self._notifications.get()
+            if payload is None:
+                break
+
+            try:
+                requests.post(self.callback_url, json=payload, headers=self.callback_headers, timeout=5)
+            except Exception as e:
+                print(f"⚠️  Job status callback failed: {e}")
+
+    def shutdown(self):
+        """Stop workers after the jobs already queued"""
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        if self._notifier is not None:
+            self._notifications.put(None)
+            self._notifier.join()
@@ -0,0 +1,91 @@
+"""
+Response serialization shared by AI systems
+Compact JSON encoding (orjson when installed) and gzip/deflate content negotiation
+"""
+
+import gzip
+import json
+import zlib
+from typing import Any, Optional, Tuple
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Content types worth compressing; audio and images barely shrink under deflate
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+def encode_json(data: Any) -> bytes:
+    """
+    Serialize data to compact UTF-8 JSON bytes in one pass
+
+    Uses orjson when it is installed, otherwise the standard library with
+    compact separators. numpy values become plain numbers/lists and anything
+    else neither backend understands is converted with str().
+    """
+    if orjson is not None:
+        return orjson.dumps(data, default=_json_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick "gzip" or "deflate" from an Accept-Encoding header, or None for identity"""
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    for encoding in ("gzip", "deflate"):
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > 0:
+            return encoding
+    return None
+
+
+def is_compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress_body(body: bytes, encoding: Optional[str], min_bytes: int, level: int) -> Tuple[bytes, Optional[str]]:
+    """
+    Compress body with the negotiated encoding
+
+    Returns (body, content_encoding); small bodies and bodies that do not
+    shrink are returned unchanged with content_encoding None.
+    """
+    if encoding is None or len(body) < min_bytes:
+        return body, None
+
+    if encoding == "gzip":
+        compressed = gzip.compress(body, compresslevel=level, mtime=0)
+    elif encoding == "deflate":
+        compressed = zlib.compress(body, level)
+    else:
+        return body, None
+
+    if len(compressed) >= len(body):
+        return body, None
+    return compressed, encoding
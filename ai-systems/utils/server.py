@@ -0,0 +1,144 @@
+"""
+Shared HTTP serving layer for AI systems
+Threaded server with keep-alive, timeouts and bounded admission of model work
+"""
+
+import threading
+from http.server import ThreadingHTTPServer
+from typing import Optional, Dict, Any
+
+from config.settings import API_MAX_QUEUED_REQUESTS, API_QUEUE_TIMEOUT, API_MAX_CONNECTIONS
+
+
+class ServerOverloaded(Exception):
+    """No worker slot became free; the request should be answered with 429"""
+
+
+class RequestLimiter:
+    """
+    Admission control for expensive requests.
+
+    At most max_active requests run at once; up to max_queued more may wait
+    (for at most queue_timeout seconds) for a slot. Anything beyond that is
+    rejected immediately so clients back off instead of piling up threads
+    behind a busy GPU.
+    """
+
+    def __init__(self, max_active: int, max_queued: int, queue_timeout: float):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+
+        self._slots = threading.BoundedSemaphore(max_active)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+
+        # Statistics
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def acquire(self):
+        with self._lock:
+            if self._queued >= self.max_queued and self._active >= self.max_active:
+                self.rejected += 1
+                raise ServerOverloaded("Server is busy, retry later")
+            self._queued += 1
+
+        acquired = self._slots.acquire(timeout=self.queue_timeout)
+
+        with self._lock:
+            self._queued -= 1
+            if not acquired:
+                self.timed_out += 1
+                raise ServerOverloaded("Timed out waiting for a free worker")
+            self._active += 1
+            self.admitted += 1
+
+    def release(self):
+        with self._lock:
+            self._active -= 1
+        self._slots.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "active_requests": self._active,
+                "queued_requests": self._queued,
+                "max_active": self.max_active,
+                "max_queued": self.max_queued,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out
+            }
+
+
+class APIServer(ThreadingHTTPServer):
+    """
+    ThreadingHTTPServer shared by all AI services.
+
+    Every connection gets its own daemon thread, so cheap requests such as
+    /health are answered even while model calls are running. Handlers derived
+    from BaseAPIHandler pass their expensive requests through the server's
+    RequestLimiter (see BaseAPIHandler.throttled_methods). Connections beyond
+    max_connections are refused with 503 before a thread is started.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        server_address: tuple,
+        handler_class,
+        max_active: int = 1,
+        max_queued: int = 16,
+        queue_timeout: float = 30.0,
+        max_connections: int = 256
+    ):
+        self.limiter = RequestLimiter(max_active, max_queued, queue_timeout)
+        self.max_connections = max_connections
+        self._connections = threading.BoundedSemaphore(max_connections)
+        super().__init__(server_address, handler_class)
+
+    def process_request(self, request, client_address):
+        if not self._connections.acquire(blocking=False):
+            try:
+                request.sendall(
+                    b"HTTP/1.1 503 Service Unavailable\r\n"
+                    b"Content-Length: 0\r\nConnection: close\r\nRetry-After: 1\r\n\r\n"
+                )
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        super().process_request(request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._connections.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self.limiter.get_stats()
+
+
+def create_api_server(
+    server_address: tuple,
+    handler_class,
+    max_active: int = 1,
+    max_queued: Optional[int] = None,
+    queue_timeout: Optional[float] = None,
+    max_connections: Optional[int] = None
+) -> APIServer:
+    """Build an APIServer with defaults from config.settings"""
+    return APIServer(
+        server_address,
+        handler_class,
+        max_active=max_active,
+        max_queued=API_MAX_QUEUED_REQUESTS if max_queued is None else max_queued,
+        queue_timeout=API_QUEUE_TIMEOUT if queue_timeout is None else queue_timeout,
+        max_connections=API_MAX_CONNECTIONS if max_connections is None else max_connections
+    )
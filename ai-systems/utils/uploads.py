@@ -0,0 +1,213 @@
+"""
+Streaming request-body parsing shared by AI systems
+Reads uploads incrementally into spooled files instead of one big bytes object
+"""
+
+import json
+import shutil
+import tempfile
+from email.parser import BytesHeaderParser
+from pathlib import Path
+from typing import Optional, Dict, Any, Iterator
+
+
+class RequestBodyError(Exception):
+    """Malformed or oversized request body; carries the HTTP status to answer with"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class UploadedFile:
+    """
+    One uploaded file, spooled in memory up to spool_bytes and on disk beyond.
+    """
+
+    def __init__(self, filename: Optional[str], content_type: Optional[str], spool_bytes: int):
+        self.filename = filename
+        self.content_type = content_type
+        self.size = 0
+        self.file = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+
+    def write(self, data: bytes):
+        self.file.write(data)
+        self.size += len(data)
+
+    def read(self) -> bytes:
+        """Whole content as bytes"""
+        self.file.seek(0)
+        return self.file.read()
+
+    def save(self, destination: Path) -> Path:
+        """Copy the content to destination (streamed, never fully in memory)"""
+        destination = Path(destination)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        self.file.seek(0)
+        with open(destination, "wb") as f:
+            shutil.copyfileobj(self.file, f)
+        return destination
+
+    @property
+    def extension(self) -> str:
+        return Path(self.filename).suffix.lower().lstrip(".") if self.filename else ""
+
+    def close(self):
+        self.file.close()
+
+
+class MultipartParser:
+    """
+    Incremental multipart/form-data parser.
+
+    Feed body chunks as they arrive. File parts are written into
+    UploadedFile spools and plain fields are collected as strings, so
+    memory stays bounded by the spool size plus one chunk.
+    """
+
+    MAX_HEADER_BYTES = 16 * 1024
+    MAX_FIELD_BYTES = 1024 * 1024
+
+    def __init__(self, boundary: str, spool_bytes: int):
+        self.delimiter = b"\r\n--" + boundary.encode("latin-1")
+        self.spool_bytes = spool_bytes
+        self.fields: Dict[str, str] = {}
+        self.files: Dict[str, UploadedFile] = {}
+
+        # A leading CRLF lets the first boundary match the same delimiter as the rest
+        self._buffer = bytearray(b"\r\n")
+        self._state = "preamble"
+        self._part_name: Optional[str] = None
+        self._part_sink = None
+
+    def feed(self, chunk: bytes):
+        self._buffer += chunk
+        while self._step():
+            pass
+
+    def close(self):
+        if self._state != "done":
+            raise RequestBodyError(400, "Multipart body ended before the closing boundary")
+
+    def _step(self) -> bool:
+        """Advance the state machine; returns False when more data is needed"""
+        buffer = self._buffer
+        if self._state == "preamble":
+            index = buffer.find(self.delimiter)
+            if index < 0:
+                del buffer[:max(0, len(buffer) - len(self.delimiter))]
+                return False
+            del buffer[:index + len(self.delimiter)]
+            self._state = "delimiter"
+            return True
+
+        if self._state == "delimiter":
+            if len(buffer) < 2:
+                return False
+            if buffer[:2] == b"--":
+                self._state = "done"
+                buffer.clear()
+                return False
+            end = buffer.find(b"\r\n")
+            if end < 0:
+                return False
+            del buffer[:end + 2]  # CRLF (after optional transport padding)
+            self._state = "headers"
+            return True
+
+        if self._state == "headers":
+            end = buffer.find(b"\r\n\r\n")
+            if end < 0:
+                if len(buffer) > self.MAX_HEADER_BYTES:
+                    raise RequestBodyError(400, "Multipart part headers too large")
+                return False
+            self._start_part(bytes(buffer[:end + 4]))
+            del buffer[:end + 4]
+            self._state = "body"
+            return True
+
+        if self._state == "body":
+            index = buffer.find(self.delimiter)
+            if index < 0:
+                # Keep a tail that might be the start of a split delimiter
+                safe = len(buffer) - len(self.delimiter) + 1
+                if safe > 0:
+                    self._write_part(bytes(buffer[:safe]))
+                    del buffer[:safe]
+                return False
+            self._write_part(bytes(buffer[:index]))
+            self._finish_part()
+            del buffer[:index + len(self.delimiter)]
+            self._state = "delimiter"
+            return True
+
+        # done: ignore the epilogue
+        buffer.clear()
+        return False
+
+    def _start_part(self, header_bytes: bytes):
+        headers = BytesHeaderParser().parsebytes(header_bytes)
+        name = headers.get_param("name", header="content-disposition")
+        if not name:
+            raise RequestBodyError(400, "Multipart part without a name")
+
+        self._part_name = str(name)
+        filename = headers.get_filename()
+        if filename is not None:
+            self._part_sink = UploadedFile(filename, headers.get_content_type(), self.spool_bytes)
+        else:
+            self._part_sink = bytearray()
+
+    def _write_part(self, data: bytes):
+        if isinstance(self._part_sink, bytearray):
+            if len(self._part_sink) + len(data) > self.MAX_FIELD_BYTES:
+                raise RequestBodyError(413, f"Form field '{self._part_name}' is too large")
+            self._part_sink += data
+        else:
+            self._part_sink.write(data)
+
+    def _finish_part(self):
+        if isinstance(self._part_sink, bytearray):
+            self.fields[self._part_name] = self._part_sink.decode("utf-8")
+        else:
+            self.files[self._part_name] = self._part_sink
+        self._part_name = None
+        self._part_sink = None
+
+
+def decode_form_value(value: str) -> Any:
+    """
+    Form and query values are strings; JSON lists, objects, booleans and null
+    are decoded, everything else (ids, numbers, formats) stays a string
+    """
+    stripped = value.strip()
+    if stripped in ("true", "false", "null") or stripped[:1] in ("[", "{"):
+        try:
+            return json.loads(stripped)
+        except ValueError:
+            pass
+    return value
+
+
+def iter_chunked(rfile, chunk_size: int) -> Iterator[bytes]:
+    """Decode a Transfer-Encoding: chunked body from a socket file"""
+    while True:
+        size_line = rfile.readline(1024)
+        try:
+            remaining = int(size_line.split(b";")[0].strip(), 16)
+        except ValueError:
+            raise RequestBodyError(400, "Malformed chunked encoding")
+
+        if remaining == 0:
+            # Skip optional trailers up to the terminating empty line
+            while rfile.readline(1024) not in (b"\r\n", b"\n", b""):
+                pass
+            return
+
+        while remaining > 0:
+            data = rfile.read(min(chunk_size, remaining))
+            if not data:
+                raise RequestBodyError(400, "Request body ended early")
+            remaining -= len(data)
+            yield data
+        rfile.readline(1024)  # CRLF after each chunk
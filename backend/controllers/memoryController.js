@@ -1,6 +1,40 @@
+const path = require('path');
 const { PrismaClient } = require('@prisma/client');
 const prisma = new PrismaClient();
 
+const AI_DOCUMENT_URL = process.env.AI_DOCUMENT_URL || 'http://localhost:8003';
+const ANALYZED_TYPES = ['image', 'video'];
+// Analysis statuses only move forward; done and failed are final
+const STATUS_RANK = { pending: 0, processing: 1, done: 2, failed: 2 };
+
+const markAnalysisFailed = (memoryId) =>
+  prisma.memoryUpload
+    .update({ where: { id: memoryId }, data: { status: 'failed' } })
+    .catch((error) => console.error('Error marking memory analysis as failed:', error));
+
+// Queue AI analysis without holding up the upload response
+const requestAnalysis = async (memory) => {
+  try {
+    const response = await fetch(`${AI_DOCUMENT_URL}/analyze`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        upload_id: memory.id,
+        patient_id: String(memory.userId),
+        file_path: path.resolve(memory.filePath),
+        file_type: memory.type,
+      }),
+    });
+    if (!response.ok) {
+      console.error('Memory analysis request rejected:', response.status);
+      await markAnalysisFailed(memory.id);
+    }
+  } catch (error) {
+    console.error('Error requesting memory analysis:', error);
+    await markAnalysisFailed(memory.id);
+  }
+};
+
 exports.processMemoryUpload = async (req, res) => {
   try {
     const userId = req.user.id;
@@ -25,6 +59,10 @@ exports.processMemoryUpload = async (req, res) => {
       }
     });
 
+    if (ANALYZED_TYPES.includes(memory.type)) {
+      requestAnalysis(memory);
+    }
+
     res.status(201).json({ message: 'Memory uploaded successfully', memory });
   } catch (error) {
     console.error('Error uploading memory:', error);
@@ -45,4 +83,49 @@ exports.recentMemories = async (req,res) => {
         console.error('Error fetching recent memories:', error);
         res.status(500).json({ message: 'Error fetching recent memories', error });
     }
-}
\ No newline at end of file
+}
+
+// Status callback from the AI document analysis job queue.
+// Requires AI_CALLBACK_SECRET, set to the same value in the AI document service environment.
+exports.updateAnalysisStatus = async (req, res) => {
+  try {
+    const secret = process.env.AI_CALLBACK_SECRET;
+    if (!secret || req.headers['x-ai-callback-secret'] !== secret) {
+      return res.status(401).json({ error: 'Unauthorized' });
+    }
+
+    const { status, metadata, summary } = req.body;
+    const uploadId = metadata?.upload_id;
+    if (!uploadId || !Object.keys(STATUS_RANK).includes(status)) {
+      return res.status(400).json({ message: 'upload_id and a valid status are required' });
+    }
+
+    // Late or out-of-order callbacks must not move an upload back to an earlier status
+    const fromStatuses = Object.keys(STATUS_RANK).filter(
+      (current) => STATUS_RANK[current] < STATUS_RANK[status] || current === status
+    );
+    const { count } = await prisma.memoryUpload.updateMany({
+      where: { id: uploadId, status: { in: fromStatuses } },
+      data: {
+        status: status,
+        ...(summary ? { tags: summary.entities.memory_triggers } : {}),
+      },
+    });
+    if (count === 0) {
+      return res.status(200).json({ message: 'Status not updated (stale or unknown upload)' });
+    }
+
+    if (status === 'done' && summary) {
+      await prisma.reconstructedMemory.upsert({
+        where: { uploadId: uploadId },
+        create: { uploadId: uploadId, aiSummary: summary.ai_summary, entities: summary.entities },
+        update: { aiSummary: summary.ai_summary, entities: summary.entities },
+      });
+    }
+
+    res.status(200).json({ message: 'Status updated' });
+  } catch (error) {
+    console.error('Error updating analysis status:', error);
+    res.status(500).json({ message: 'Error updating analysis status', error });
+  }
+};
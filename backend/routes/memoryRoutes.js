@@ -1,6 +1,6 @@
 const express = require('express');
 const multer = require('multer');
-const { processMemoryUpload } = require('../controllers/memoryController');
+const { processMemoryUpload, updateAnalysisStatus } = require('../controllers/memoryController');
 const { authenticateJWT } = require('../middleware/validation.js');
 
 const Router = express.Router();
@@ -17,5 +17,6 @@ const storage = multer.diskStorage({
 const upload = multer({ storage: storage });
 
 Router.post('/upload', authenticateJWT, upload.single('file'), processMemoryUpload);
+Router.post('/analysis-status', updateAnalysisStatus);
 
 module.exports = Router;
\ No newline at end of file